@@ -1,15 +1,83 @@
 # -*- coding: utf-8 -*-
 # Set up dedicated logging for the face recognition module
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
 
 # Create a dedicated logger with a specific name
 face_logger = logging.getLogger('odoo.addons.hr_attendance_face_recognition')
 
-# Configure the logger to include timestamps and levels
-handler = logging.StreamHandler()
-formatter = logging.Formatter('%(asctime)s %(levelname)s [Face Recognition] %(message)s')
-handler.setFormatter(formatter)
-face_logger.addHandler(handler)
+
+class _FaceQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that hands the raw record to the listener thread.
+
+    The stock ``prepare`` formats the message in the calling thread; the
+    queue never leaves this process, so formatting is deferred to the
+    listener instead of being paid for inside the request.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def _setup_face_logger():
+    """Attach a non-blocking queue handler to the face logger
+
+    Safe to call again on module reload: handlers installed by a previous
+    import are detached and their listener threads stopped first.
+    """
+    _detach_face_handlers()
+    listener = _start_face_listener()
+    queue_handler = _FaceQueueHandler(listener.queue)
+    queue_handler._face_recognition_handler = True
+    queue_handler.listener = listener
+    face_logger.addHandler(queue_handler)
+
+
+def _detach_face_handlers():
+    for old_handler in list(face_logger.handlers):
+        if getattr(old_handler, '_face_recognition_handler', False):
+            face_logger.removeHandler(old_handler)
+            atexit.unregister(old_handler.listener.stop)
+            old_handler.listener.stop()
+
+
+def _start_face_listener():
+    """Start a listener thread writing the records of a new queue"""
+    # Configure the output to include timestamps and levels
+    stream_handler = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s %(levelname)s [Face Recognition] %(message)s')
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.pid = os.getpid()
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def _restart_face_listener():
+    """Give a forked process its own queue and listener thread
+
+    Prefork workers are forked after this module is imported, and the
+    listener thread does not survive the fork: without a new one their
+    records would pile up in a queue nobody reads. Records the parent had
+    not written yet are left to the parent.
+    """
+    for handler in face_logger.handlers:
+        if getattr(handler, '_face_recognition_handler', False) and handler.listener.pid != os.getpid():
+            atexit.unregister(handler.listener.stop)
+            handler.listener = _start_face_listener()
+            handler.queue = handler.listener.queue
+
+
+_setup_face_logger()
+# Registered on every import; a reloaded module's hook finds the
+# listeners already restarted and does nothing
+os.register_at_fork(after_in_child=_restart_face_listener)
 
 # Set default level to INFO, can be overridden in config
 face_logger.setLevel(logging.INFO)
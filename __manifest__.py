@@ -12,18 +12,25 @@ This module extends the HR Attendance module to add face recognition capabilitie
     """,
     'author': 'ARMKU',
     'website': 'https://www.armku.us',
-    'depends': ['hr', 'hr_attendance', 'base_setup'],
+    'depends': ['hr', 'hr_attendance', 'base_setup', 'bus'],
     'data': [
         'security/ir.model.access.csv',
+        'data/face_identity_audit_cron.xml',
+        'data/face_health_cron.xml',
         'views/hr_employee_views.xml',
         'views/hr_attendance_views.xml',
         'views/kiosk_face_view.xml',
+        'views/hr_attendance_face_kiosk_views.xml',
+        'views/hr_attendance_face_audit_views.xml',
         'views/face_health_dashboard.xml',
         'views/face_health_menu.xml',
         'views/templates.xml',
     ],
     'assets': {
         'web.assets_backend': [
+            'hr_attendance_face_recognition/static/src/js/face_model_loader.js',
+            'hr_attendance_face_recognition/static/src/js/face_event_queue.js',
+            'hr_attendance_face_recognition/static/src/js/face_edge_gallery.js',
             'hr_attendance_face_recognition/static/src/js/kiosk_face_mode.js',
             'hr_attendance_face_recognition/static/src/css/kiosk_face_mode.css',
             'hr_attendance_face_recognition/static/src/js/face_registration.js',
@@ -36,7 +43,7 @@ This module extends the HR Attendance module to add face recognition capabilitie
         ],
     },
     'external_dependencies': {
-        'python': ['numpy', 'psutil'],
+        'python': ['numpy', 'psutil', 'cryptography'],
     },
     'installable': True,
     'application': False,
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""Offline benchmarks of the face matching and cache layers
+
+Run from the module directory, without an Odoo server::
+
+    python3 -m benchmarks.run --sizes 1000,10000,100000 --output results.json
+
+Only numpy is needed; the matching code is loaded through ``adapter``.
+
+End-to-end, against a local test database (see each module's docstring)::
+
+    python3 -m benchmarks.seed_data --db loadtest --employees 2000
+    python3 -m benchmarks.kiosk_load --login kiosk --password kiosk --rate 100
+"""
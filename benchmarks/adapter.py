@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Thin adapter exposing the module's matching code without Odoo
+
+The ``utils`` modules used for matching only depend on numpy, but the
+``utils`` package itself imports Odoo. They are loaded here one by one
+under a stand-in package, and the parts of the controller the benchmarks
+exercise are mirrored on top of them.
+"""
+import base64
+import importlib.util
+import json
+import os
+import sys
+import types
+
+import numpy as np
+
+UTILS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'utils')
+PACKAGE = 'face_recognition_bench_utils'
+MODULES = ('descriptor_codec', 'face_matching', 'sharded_matching', 'gallery_cache')
+
+
+def _load_utils():
+    if PACKAGE not in sys.modules:
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = [UTILS_PATH]
+        sys.modules[PACKAGE] = package
+    for name in MODULES:
+        qualified = '%s.%s' % (PACKAGE, name)
+        if qualified not in sys.modules:
+            spec = importlib.util.spec_from_file_location(qualified, os.path.join(UTILS_PATH, '%s.py' % name))
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[qualified] = module
+            spec.loader.exec_module(module)
+    return [sys.modules['%s.%s' % (PACKAGE, name)] for name in MODULES]
+
+
+descriptor_codec, face_matching, sharded_matching, gallery_cache = _load_utils()
+
+DESCRIPTOR_SIZE = descriptor_codec.DESCRIPTOR_SIZE
+decode_face_descriptor = descriptor_codec.decode_face_descriptor
+FaceGallery = face_matching.FaceGallery
+build_face_gallery = sharded_matching.build_face_gallery
+shutdown_pool = sharded_matching.shutdown_pool
+GalleryCache = gallery_cache.GalleryCache
+
+
+def encode_face_data(templates):
+    """Encode templates the way ``hr.employee.face_encoding`` stores them"""
+    return base64.b64encode(json.dumps(np.asarray(templates).tolist()).encode('utf-8'))
+
+
+def encode_probe(descriptor, fmt):
+    """Encode a probe the way the kiosk sends it in ``face_data['encoding']``"""
+    if fmt == descriptor_codec.FORMAT_JSON:
+        return base64.b64encode(json.dumps(np.asarray(descriptor).tolist()).encode('utf-8')).decode('ascii')
+    dtype = '<f2' if fmt == descriptor_codec.FORMAT_FLOAT16 else '<f4'
+    return base64.b64encode(np.asarray(descriptor, dtype=dtype).tobytes()).decode('ascii')
+
+
+def build_gallery_from_records(records, shards=0, min_templates=sharded_matching.DEFAULT_MIN_SHARDED_TEMPLATES):
+    """Mirror of the controller's cache build from ``(employee_id, face_encoding)`` rows"""
+    templates_by_employee = []
+    for employee_id, face_encoding in records:
+        templates = json.loads(base64.b64decode(face_encoding).decode('utf-8'))
+        templates_by_employee.append((employee_id, face_matching.as_template_block(templates)))
+    return build_face_gallery(templates_by_employee, shards, min_templates)
+
+
+def legacy_best_match(templates_by_employee, probe):
+    """The per-template loop the gallery replaced, kept as a baseline"""
+    best_id, best_similarity = None, 0.0
+    for employee_id, templates in templates_by_employee:
+        for template in templates:
+            similarity = max(0, 1 - np.linalg.norm(np.asarray(probe) - np.asarray(template)))
+            if similarity > best_similarity:
+                best_id, best_similarity = employee_id, similarity
+    return best_id, best_similarity
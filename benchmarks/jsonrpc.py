@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Minimal asyncio JSON-RPC client for Odoo, standard library only
+
+One ``OdooConnection`` is one keep-alive HTTP/1.1 connection with its own
+session cookie, i.e. one kiosk. Only what the load tools need is
+implemented: JSON POSTs, Content-Length and chunked responses, cookies.
+"""
+import asyncio
+import itertools
+import json
+import ssl
+from http.cookies import SimpleCookie
+from urllib.parse import urlsplit
+
+
+class HttpError(Exception):
+    def __init__(self, status, body):
+        super().__init__("HTTP %s: %s" % (status, body[:200]))
+        self.status = status
+
+
+class RpcError(Exception):
+    """A JSON-RPC error response; ``data`` is Odoo's error payload"""
+
+    def __init__(self, error):
+        data = error.get('data') or {}
+        super().__init__(data.get('message') or error.get('message') or str(error))
+        self.name = data.get('name', '')
+        self.data = data
+
+
+class OdooConnection(object):
+
+    def __init__(self, url, timeout=30.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.secure = parts.scheme == 'https'
+        self.port = parts.port or (443 if self.secure else 80)
+        self.timeout = timeout
+        self.cookies = {}
+        self._ids = itertools.count(1)
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        context = ssl.create_default_context() if self.secure else None
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port, ssl=context)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+        self._reader = self._writer = None
+
+    async def _read_body(self, headers):
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self._reader.readline()).split(b';')[0], 16)
+                if not size:
+                    await self._reader.readline()
+                    return b''.join(chunks)
+                chunks.append(await self._reader.readexactly(size))
+                await self._reader.readline()
+        return await self._reader.readexactly(int(headers.get('content-length', 0)))
+
+    async def _post(self, path, body):
+        if self._writer is None:
+            await self._connect()
+        request_headers = [
+            'POST %s HTTP/1.1' % path,
+            'Host: %s:%s' % (self.host, self.port),
+            'Content-Type: application/json',
+            'Content-Length: %d' % len(body),
+            'Connection: keep-alive',
+        ]
+        if self.cookies:
+            request_headers.append('Cookie: ' + '; '.join('%s=%s' % item for item in self.cookies.items()))
+        self._writer.write(('\r\n'.join(request_headers) + '\r\n\r\n').encode('latin-1') + body)
+        await self._writer.drain()
+
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionError("Server closed the connection")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = (await self._reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _sep, value = line.partition(':')
+            name = name.strip().lower()
+            if name == 'set-cookie':
+                for morsel in SimpleCookie(value.strip()).values():
+                    self.cookies[morsel.key] = morsel.value
+            headers[name] = value.strip()
+        response = await self._read_body(headers)
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, response
+
+    async def call(self, path, params):
+        """POST a JSON-RPC call and return its ``result``"""
+        body = json.dumps({
+            'jsonrpc': '2.0', 'method': 'call', 'params': params, 'id': next(self._ids),
+        }).encode('utf-8')
+        async with self._lock:
+            try:
+                status, response = await asyncio.wait_for(self._post(path, body), self.timeout)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                # The connection state is unknown: start over next time
+                await self.close()
+                raise
+        if status != 200:
+            raise HttpError(status, response.decode('utf-8', 'replace'))
+        payload = json.loads(response)
+        if payload.get('error'):
+            raise RpcError(payload['error'])
+        return payload.get('result')
+
+    async def authenticate(self, db, login, password):
+        """Open a web session, as a kiosk user logging in does"""
+        result = await self.call('/web/session/authenticate', {
+            'db': db, 'login': login, 'password': password,
+        })
+        if not result or not result.get('uid'):
+            raise RpcError({'message': "Authentication failed for %s" % login})
+        return result['uid']
+
+    async def execute_kw(self, db, uid, password, model, method, args, kwargs=None):
+        """External API call through /jsonrpc, no session needed"""
+        return await self.call('/jsonrpc', {
+            'service': 'object',
+            'method': 'execute_kw',
+            'args': [db, uid, password, model, method, args, kwargs or {}],
+        })
+
+    async def login(self, db, login, password):
+        uid = await self.call('/jsonrpc', {
+            'service': 'common', 'method': 'login', 'args': [db, login, password],
+        })
+        if not uid:
+            raise RpcError({'message': "Authentication failed for %s" % login})
+        return uid
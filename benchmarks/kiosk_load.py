@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""Replay a kiosk morning rush against a local Odoo instance
+
+Each simulated kiosk logs in with its own session and keep-alive
+connection. Scans arrive as a Poisson process at ``--rate`` per second,
+spread over the kiosks; a kiosk handles one scan at a time, like the real
+one, and latency is measured from the scheduled arrival so a saturated
+server shows up as queueing rather than as a lower request rate. Scans
+are arrivals (check-ins) or, for ``--checkout-ratio`` of them, employees
+already in leaving (check-outs). ``--double-scan-rate`` of the scans are repeated
+from a second kiosk, as when two kiosks see the same person::
+
+    python3 -m benchmarks.kiosk_load --manifest seed.json --login kiosk \\
+        --password kiosk --kiosks 200 --rate 100 --duration 120
+
+Needs a database seeded with ``benchmarks.seed_data``.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import random
+import sys
+import time
+import uuid
+
+import numpy as np
+
+from . import adapter
+from .jsonrpc import OdooConnection, RpcError, HttpError
+from .synthetic import SyntheticGallery
+
+SERIALIZATION_MARKERS = (
+    'could not serialize',
+    'concurrent update',
+    'SerializationFailure',
+    'deadlock detected',
+    'TransactionRollbackError',
+)
+
+
+class Stats(object):
+
+    def __init__(self):
+        self.latencies = []
+        self.outcomes = {}
+        self.actions = {}
+        self.server_ms = []
+        self.errors = {}
+
+    def record(self, outcome, latency, result=None, error=None):
+        self.latencies.append(latency)
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        if result:
+            action = result.get('action')
+            if action and result.get('repeated'):
+                action = 'repeated_' + action
+            if action:
+                self.actions[action] = self.actions.get(action, 0) + 1
+            if result.get('processing_time') is not None:
+                self.server_ms.append(result['processing_time'] * 1000.0)
+        if error:
+            message = str(error)[:120]
+            self.errors[message] = self.errors.get(message, 0) + 1
+
+
+def _percentiles(samples):
+    samples = np.asarray(samples, dtype=float)
+    if not samples.size:
+        return {}
+    return {
+        'mean': float(samples.mean()),
+        'p50': float(np.percentile(samples, 50)),
+        'p95': float(np.percentile(samples, 95)),
+        'p99': float(np.percentile(samples, 99)),
+        'max': float(samples.max()),
+    }
+
+
+def _classify(error):
+    text = '%s %s' % (getattr(error, 'name', ''), error)
+    if any(marker in text for marker in SERIALIZATION_MARKERS):
+        return 'serialization_failure'
+    if isinstance(error, (RpcError, HttpError)):
+        return 'server_error'
+    return 'transport_error'
+
+
+class Kiosk(object):
+
+    def __init__(self, index, args):
+        self.index = index
+        self.args = args
+        self.connection = OdooConnection(args.url, timeout=args.timeout)
+        self.device_key = args.device_key[index % len(args.device_key)] if args.device_key else None
+
+    async def verify(self, probe, scheduled, stats):
+        face_data = {
+            'uuid': str(uuid.uuid4()),
+            'captured_at': int(time.time() * 1000),
+            'encoding': base64.b64encode(np.asarray(probe, dtype='<f4').tobytes()).decode('ascii'),
+            'format': 'f32',
+        }
+        if self.device_key:
+            face_data['kiosk'] = self.device_key
+        try:
+            result = await self.connection.call('/face_recognition/verify', {'face_data': face_data})
+        except Exception as e:
+            stats.record(_classify(e), time.perf_counter() - scheduled, error=e)
+            return
+        latency = time.perf_counter() - scheduled
+        if result.get('success'):
+            stats.record('recognized', latency, result)
+        elif result.get('busy'):
+            stats.record('busy', latency, result)
+        else:
+            message = result.get('message', '')
+            outcome = 'no_match' if 'No matching' in message else 'rejected'
+            stats.record(outcome, latency, result, error=None if outcome == 'no_match' else message)
+
+
+async def run(args):
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    synthetic = SyntheticGallery(manifest['employees'], manifest['templates'],
+                                 clusters=manifest['clusters'], seed=manifest['seed'])
+    employee_ids = manifest['employee_ids']
+    rng = random.Random(args.seed)
+
+    kiosks = [Kiosk(index, args) for index in range(args.kiosks)]
+    print("Authenticating %d kiosk sessions..." % len(kiosks), file=sys.stderr)
+    login_semaphore = asyncio.Semaphore(20)
+
+    async def login(kiosk):
+        async with login_semaphore:
+            await kiosk.connection.authenticate(args.db, args.login, args.password)
+    await asyncio.gather(*[login(kiosk) for kiosk in kiosks])
+
+    stats = Stats()
+    tasks = []
+    # Employees who are in: their next scan is a check-out. Arrivals are
+    # only drawn from the others, so nobody checks in twice in a row.
+    present = []
+    absent = list(range(len(employee_ids)))
+
+    def move(rows, other):
+        # Swap-remove a random row from rows into other
+        index = rng.randrange(len(rows))
+        rows[index], rows[-1] = rows[-1], rows[index]
+        row = rows.pop()
+        other.append(row)
+        return row
+
+    def next_probe():
+        """Return a probe, either a new arrival or a present employee leaving"""
+        leaving = present and (not absent or rng.random() < args.checkout_ratio)
+        if leaving:
+            row = move(present, absent)
+        elif rng.random() < args.impostor_rate:
+            probe, _expected = synthetic.probes(1, impostor_rate=1.0)
+            return probe[0]
+        else:
+            row = move(absent, present)
+        probe = synthetic.identities[row] + synthetic.rng.normal(0.0, 0.02, adapter.DESCRIPTOR_SIZE)
+        return probe.astype(np.float32)
+
+    print("Sending %.0f scans/s for %d s..." % (args.rate, args.duration), file=sys.stderr)
+    start = time.perf_counter()
+    scheduled = start
+    sent = 0
+    while scheduled - start < args.duration:
+        scheduled += rng.expovariate(args.rate)
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        probe = next_probe()
+        kiosk = kiosks[rng.randrange(len(kiosks))]
+        tasks.append(asyncio.ensure_future(kiosk.verify(probe, scheduled, stats)))
+        sent += 1
+        if len(kiosks) > 1 and rng.random() < args.double_scan_rate:
+            other = kiosks[(kiosk.index + 1 + rng.randrange(len(kiosks) - 1)) % len(kiosks)]
+            tasks.append(asyncio.ensure_future(other.verify(probe, scheduled, stats)))
+            sent += 1
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    cache_status = None
+    try:
+        admin = OdooConnection(args.url, timeout=args.timeout)
+        await admin.authenticate(args.db, args.admin_login or args.login, args.admin_password or args.password)
+        cache_status = await admin.call('/face_recognition/cache/status', {})
+        await admin.close()
+    except Exception as e:
+        cache_status = {'error': str(e)}
+    await asyncio.gather(*[kiosk.connection.close() for kiosk in kiosks])
+
+    total = len(stats.latencies)
+    return {
+        'parameters': {key: value for key, value in vars(args).items() if 'password' not in key},
+        'duration_seconds': elapsed,
+        'requests': total,
+        'offered_rate': sent / args.duration,
+        'throughput': total / elapsed if elapsed else 0.0,
+        'latency_ms': _percentiles(np.asarray(stats.latencies) * 1000.0),
+        'server_processing_ms': _percentiles(stats.server_ms),
+        'outcomes': stats.outcomes,
+        'actions': stats.actions,
+        'error_rate': sum(count for outcome, count in stats.outcomes.items()
+                          if outcome.endswith('_error') or outcome == 'serialization_failure') / total
+                      if total else 0.0,
+        'serialization_failure_rate': stats.outcomes.get('serialization_failure', 0) / total if total else 0.0,
+        'errors': dict(sorted(stats.errors.items(), key=lambda item: -item[1])[:20]),
+        'cache_status': cache_status,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--manifest', default='seed_manifest.json', help="Written by benchmarks.seed_data")
+    parser.add_argument('--url', help="Odoo URL (default: the manifest's)")
+    parser.add_argument('--db', help="Database (default: the manifest's)")
+    parser.add_argument('--login', required=True, help="Kiosk user")
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--admin-login', help="Attendance manager reading cache/status (default: --login)")
+    parser.add_argument('--admin-password')
+    parser.add_argument('--device-key', action='append', default=[],
+                        help="Registered kiosk device key, repeat to spread kiosks over several")
+    parser.add_argument('--kiosks', type=int, default=50)
+    parser.add_argument('--rate', type=float, default=20.0, help="Scans per second, all kiosks together")
+    parser.add_argument('--duration', type=float, default=60.0, help="Seconds of load")
+    parser.add_argument('--checkout-ratio', type=float, default=0.3,
+                        help="Share of scans that are a present employee leaving")
+    parser.add_argument('--double-scan-rate', type=float, default=0.02,
+                        help="Share of scans repeated at once from a second kiosk")
+    parser.add_argument('--impostor-rate', type=float, default=0.02, help="Share of unknown faces")
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    args.url = args.url or manifest['url']
+    args.db = args.db or manifest['db']
+
+    report = asyncio.run(run(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""Time descriptor decoding, cache build and matching on synthetic galleries
+
+Results are printed (or written with ``--output``) as one JSON document
+with an entry per gallery size. Times are in milliseconds unless a key
+says otherwise.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from . import adapter
+from .synthetic import SyntheticGallery
+
+DEFAULT_SIZES = '1000,10000,100000'
+
+
+def _percentiles(samples):
+    samples = np.asarray(samples) * 1000.0
+    return {
+        'mean': float(samples.mean()),
+        'p50': float(np.percentile(samples, 50)),
+        'p95': float(np.percentile(samples, 95)),
+        'p99': float(np.percentile(samples, 99)),
+    }
+
+
+def bench_decode(probes, repeat):
+    """Per-probe decode time of each kiosk wire format"""
+    results = {}
+    for fmt in ('json', 'f32', 'f16'):
+        payloads = [adapter.encode_probe(probe, fmt) for probe in probes]
+        samples = []
+        for _index in range(repeat):
+            start = time.perf_counter()
+            for payload in payloads:
+                adapter.decode_face_descriptor(payload, fmt)
+            samples.append((time.perf_counter() - start) / len(payloads))
+        results[fmt] = {
+            'payload_bytes': len(payloads[0]),
+            'per_probe_us': float(np.median(samples) * 1e6),
+        }
+    return results
+
+
+def bench_cache_build(synthetic, shards, min_templates, trace_memory):
+    """Build the gallery from stored face data, as a cache miss does
+
+    With ``trace_memory`` the build is run a second time under
+    tracemalloc, which is too slow to time the first one.
+    """
+    records = [(employee_id, adapter.encode_face_data(templates))
+               for employee_id, templates in synthetic.templates_by_employee()]
+
+    start = time.perf_counter()
+    gallery = adapter.build_gallery_from_records(records, shards, min_templates)
+    build_seconds = time.perf_counter() - start
+
+    result = {
+        'stored_bytes': sum(len(face_encoding) for _employee_id, face_encoding in records),
+        'build_ms': build_seconds * 1000.0,
+    }
+    if trace_memory:
+        tracemalloc.start()
+        adapter.build_gallery_from_records(records)
+        result['build_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return gallery, result
+
+
+def bench_single(gallery, probes, expected, threshold):
+    """One ``best_match`` per probe, as /face_recognition/verify does"""
+    samples = []
+    matched = 0
+    accepted = 0
+    for probe, employee_id in zip(probes, expected):
+        start = time.perf_counter()
+        best_id, similarity = gallery.best_match(probe)
+        samples.append(time.perf_counter() - start)
+        if employee_id >= 0 and best_id == employee_id:
+            matched += 1
+        if similarity * 100 >= threshold and best_id == employee_id:
+            accepted += 1
+    genuine = int((expected >= 0).sum())
+    return dict(_percentiles(samples), **{
+        'top1_accuracy': matched / genuine if genuine else 0.0,
+        'accept_rate': accepted / genuine if genuine else 0.0,
+    })
+
+
+def bench_batch(gallery, probes, batch_size, repeat):
+    """``best_matches`` on batches, as /face_recognition/verify/bulk does"""
+    samples = []
+    for _index in range(repeat):
+        for start_index in range(0, len(probes), batch_size):
+            batch = probes[start_index:start_index + batch_size]
+            start = time.perf_counter()
+            gallery.best_matches(batch)
+            samples.append((time.perf_counter() - start) / len(batch))
+    return dict(_percentiles(samples), batch_size=batch_size, unit='ms per probe')
+
+
+def bench_legacy(synthetic, probes):
+    """The former per-template Python loop, on a few probes"""
+    templates_by_employee = synthetic.templates_by_employee()
+    samples = []
+    for probe in probes:
+        start = time.perf_counter()
+        adapter.legacy_best_match(templates_by_employee, probe)
+        samples.append(time.perf_counter() - start)
+    return _percentiles(samples)
+
+
+def run_size(employees, args):
+    synthetic = SyntheticGallery(employees, args.templates, seed=args.seed)
+    probes, expected = synthetic.probes(args.probes)
+
+    gallery, cache_build = bench_cache_build(synthetic, args.shards, args.shard_min_templates, args.trace_memory)
+    result = {
+        'employees': employees,
+        'templates_per_employee': args.templates,
+        'template_count': gallery.template_count,
+        'gallery': type(gallery).__name__,
+        'memory_bytes': gallery.nbytes,
+        'max_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        'cache_build': cache_build,
+        'verify_single': bench_single(gallery, probes, expected, args.threshold),
+        'verify_batch': bench_batch(gallery, probes, args.batch, args.repeat),
+    }
+    if employees <= args.legacy_max:
+        result['verify_single_legacy'] = bench_legacy(synthetic, probes[:args.legacy_probes])
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help="Comma separated employee counts (default: %(default)s)")
+    parser.add_argument('--templates', type=int, default=5, help="Templates per employee")
+    parser.add_argument('--probes', type=int, default=500, help="Probes per size")
+    parser.add_argument('--batch', type=int, default=64, help="Batch size of batched verifies")
+    parser.add_argument('--repeat', type=int, default=3, help="Repetitions of the batch and decode runs")
+    parser.add_argument('--threshold', type=float, default=70.0, help="Match threshold, in percent")
+    parser.add_argument('--shards', type=int, default=0, help="Shards of the matching pool, 0 for in-process")
+    parser.add_argument('--shard-min-templates', type=int, default=0,
+                        help="Smallest gallery matched on the pool when --shards is set")
+    parser.add_argument('--legacy-max', type=int, default=10000,
+                        help="Also time the legacy loop up to this many employees")
+    parser.add_argument('--legacy-probes', type=int, default=5)
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Also report the peak Python allocation of the cache build (slow)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    decode_probes, _expected = SyntheticGallery(16, 1, seed=args.seed).probes(args.probes)
+
+    report = {
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'parameters': vars(args),
+        'decode': bench_decode(decode_probes, args.repeat),
+        'sizes': [],
+    }
+    try:
+        for employees in sizes:
+            print("Benchmarking %d employees..." % employees, file=sys.stderr)
+            report['sizes'].append(run_size(employees, args))
+    finally:
+        adapter.shutdown_pool()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
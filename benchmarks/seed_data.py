@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Seed a local test database with synthetic employees and face data
+
+Creates one employee per synthetic identity, with its templates stored in
+``face_encoding`` exactly as a registration would, and writes a manifest
+that ``benchmarks.kiosk_load`` uses to send probes of the same people::
+
+    python3 -m benchmarks.seed_data --url http://localhost:8069 --db loadtest \\
+        --login admin --password admin --employees 2000 --manifest seed.json
+
+Use a throwaway database: ``--delete`` removes the seeded employees again.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from . import adapter
+from .jsonrpc import OdooConnection
+from .synthetic import SyntheticGallery
+
+
+async def seed(args):
+    connection = OdooConnection(args.url, timeout=300.0)
+    uid = await connection.login(args.db, args.login, args.password)
+    synthetic = SyntheticGallery(args.employees, args.templates, clusters=args.clusters, seed=args.seed)
+
+    employee_ids = []
+    start = time.perf_counter()
+    templates_by_employee = synthetic.templates_by_employee()
+    for batch_start in range(0, len(templates_by_employee), args.batch):
+        batch = templates_by_employee[batch_start:batch_start + args.batch]
+        vals_list = []
+        for index, templates in batch:
+            vals = {
+                'name': '%s %06d' % (args.prefix, index),
+                'face_encoding': adapter.encode_face_data(templates).decode('ascii'),
+                'face_recognition_active': True,
+            }
+            if args.company_id:
+                vals['company_id'] = args.company_id
+            vals_list.append(vals)
+        employee_ids.extend(await connection.execute_kw(
+            args.db, uid, args.password, 'hr.employee', 'create', [vals_list]))
+        print("Created %d/%d employees" % (len(employee_ids), args.employees), file=sys.stderr)
+    await connection.close()
+
+    manifest = {
+        'url': args.url,
+        'db': args.db,
+        'employees': args.employees,
+        'templates': args.templates,
+        'clusters': args.clusters,
+        'seed': args.seed,
+        # Database id of each synthetic identity, in generation order
+        'employee_ids': employee_ids,
+        'seconds': time.perf_counter() - start,
+    }
+    with open(args.manifest, 'w') as f:
+        json.dump(manifest, f)
+    print("Seeded %d employees in %.1f s, manifest written to %s" % (
+        len(employee_ids), manifest['seconds'], args.manifest), file=sys.stderr)
+
+
+async def delete(args):
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    connection = OdooConnection(args.url, timeout=300.0)
+    uid = await connection.login(args.db, args.login, args.password)
+    employee_ids = manifest['employee_ids']
+    for batch_start in range(0, len(employee_ids), args.batch):
+        batch = employee_ids[batch_start:batch_start + args.batch]
+        # Attendances of the load runs block the employee deletion
+        attendance_ids = await connection.execute_kw(
+            args.db, uid, args.password, 'hr.attendance', 'search', [[('employee_id', 'in', batch)]])
+        if attendance_ids:
+            await connection.execute_kw(args.db, uid, args.password, 'hr.attendance', 'unlink', [attendance_ids])
+        await connection.execute_kw(args.db, uid, args.password, 'hr.employee', 'unlink', [batch])
+    await connection.close()
+    print("Deleted %d employees" % len(employee_ids), file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', default='http://localhost:8069')
+    parser.add_argument('--db', required=True)
+    parser.add_argument('--login', default='admin')
+    parser.add_argument('--password', default='admin')
+    parser.add_argument('--employees', type=int, default=1000)
+    parser.add_argument('--templates', type=int, default=5, help="Templates per employee")
+    parser.add_argument('--clusters', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--company-id', type=int, help="Company of the employees (default: the user's)")
+    parser.add_argument('--prefix', default='Load Test Employee', help="Employee name prefix")
+    parser.add_argument('--batch', type=int, default=200, help="Employees created per call")
+    parser.add_argument('--manifest', default='seed_manifest.json')
+    parser.add_argument('--delete', action='store_true', help="Delete the employees of --manifest instead")
+    args = parser.parse_args(argv)
+    asyncio.run(delete(args) if args.delete else seed(args))
+
+
+if __name__ == '__main__':
+    main()
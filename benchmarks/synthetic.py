@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Synthetic face descriptor galleries
+
+face-api.js descriptors of the same person sit about 0.25-0.45 apart and
+different people about 0.8-1.2 apart, with people of similar appearance
+closer together. Identities are drawn around a few population clusters,
+and templates and probes around their identity, to reproduce that.
+"""
+import numpy as np
+
+DESCRIPTOR_SIZE = 128
+
+# Per-dimension spreads giving the distances described above
+CLUSTER_SPREAD = 0.045
+IDENTITY_SPREAD = 0.045
+TEMPLATE_SPREAD = 0.02
+
+
+class SyntheticGallery(object):
+    """``employees`` identities with ``templates`` descriptors each"""
+
+    def __init__(self, employees, templates, clusters=16, seed=0):
+        self.rng = np.random.default_rng(seed)
+        centers = self.rng.normal(0.0, CLUSTER_SPREAD, (clusters, DESCRIPTOR_SIZE))
+        membership = self.rng.integers(0, clusters, employees)
+        self.identities = (centers[membership]
+                           + self.rng.normal(0.0, IDENTITY_SPREAD, (employees, DESCRIPTOR_SIZE))).astype(np.float32)
+        self.employee_ids = np.arange(1, employees + 1, dtype=np.int64)
+        self.templates = (self.identities[:, None, :]
+                          + self.rng.normal(0.0, TEMPLATE_SPREAD, (employees, templates, DESCRIPTOR_SIZE))
+                          ).astype(np.float32)
+
+    def templates_by_employee(self):
+        return list(zip(self.employee_ids.tolist(), self.templates))
+
+    def probes(self, count, impostor_rate=0.1):
+        """Return ``(probes, expected_employee_ids)``; impostors expect -1"""
+        rows = self.rng.integers(0, len(self.identities), count)
+        probes = self.identities[rows] + self.rng.normal(0.0, TEMPLATE_SPREAD, (count, DESCRIPTOR_SIZE))
+        expected = self.employee_ids[rows].copy()
+
+        impostors = self.rng.random(count) < impostor_rate
+        probes[impostors] = self.rng.normal(0.0, CLUSTER_SPREAD + IDENTITY_SPREAD,
+                                            (int(impostors.sum()), DESCRIPTOR_SIZE))
+        expected[impostors] = -1
+        return probes.astype(np.float32), expected
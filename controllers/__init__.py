@@ -1,2 +1,4 @@
 from . import main
 from . import health_check
+from . import model_files
+from . import attendance_images
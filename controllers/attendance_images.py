@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from odoo import http
+from odoo.exceptions import AccessError, UserError
+from odoo.http import request, Response
+from odoo.addons.hr_attendance_face_recognition import face_logger
+from odoo.addons.hr_attendance_face_recognition.utils.thumbnail_cache import (
+    DEFAULT_THUMBNAIL_SIZE, THUMBNAIL_SIZES, get_thumbnail, thumbnail_etag,
+)
+
+# The URL carries the capture's checksum, so its thumbnail never changes
+IMMUTABLE_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+
+
+class AttendanceImages(http.Controller):
+
+    @http.route('/face_recognition/attendance/<int:attendance_id>/thumbnail/<string:checksum>',
+                type='http', auth='user', methods=['GET'])
+    def attendance_thumbnail(self, attendance_id, checksum, size=DEFAULT_THUMBNAIL_SIZE, **kw):
+        """Serve a downscaled JPEG of an attendance's captured image
+
+        Thumbnails come from the on-disk cache and are answered with a
+        strong ETag; a browser revalidating one it holds gets a 304
+        without the capture being read. A ``checksum`` other than the
+        current capture's still gets the current thumbnail, but uncached.
+        """
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            return request.not_found()
+        if size not in THUMBNAIL_SIZES:
+            return request.not_found()
+
+        attendance = request.env['hr.attendance'].browse(attendance_id).exists()
+        try:
+            attendance.check_access_rights('read')
+            attendance.check_access_rule('read')
+        except AccessError:
+            return Response(status=403)
+        attachment = request.env['ir.attachment'].sudo().search([
+            ('res_model', '=', 'hr.attendance'),
+            ('res_field', '=', 'face_image'),
+            ('res_id', '=', attendance.id),
+        ], limit=1)
+        if not attendance or not attachment:
+            return request.not_found()
+
+        etag = thumbnail_etag(attachment.checksum, size)
+        cache_control = IMMUTABLE_CACHE_CONTROL if checksum == attachment.checksum else 'no-cache'
+        if request.httprequest.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            try:
+                data = get_thumbnail(request.db, attachment.checksum, size, lambda: attachment.raw)
+            except (ValueError, OSError, UserError) as e:
+                face_logger.warning("Thumbnail of attendance %d unavailable: %s", attendance.id, e)
+                return request.not_found()
+            response = Response(data, content_type='image/jpeg')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        return response
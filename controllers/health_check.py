@@ -1,22 +1,178 @@
 # -*- coding: utf-8 -*-
-import os
-import sys
 import json
 import logging
-import time
-import platform
+import os
 import psutil
+import threading
+import time
 from datetime import datetime, timedelta
-from odoo import http, fields, _
-from odoo.http import request, Response
+
+import odoo
+from odoo import api, http, fields, SUPERUSER_ID, _
+from odoo.modules.registry import Registry
 from odoo.tools import config
+from odoo.http import request, Response
 from odoo.addons.hr_attendance_face_recognition import face_logger
+from odoo.addons.hr_attendance_face_recognition.utils.tracing import get_slow_traces, slow_trace_threshold
+from odoo.addons.hr_attendance_face_recognition.utils.admission import (
+    verify_admission, get_shared_slots, SHED_WARNING_SECONDS
+)
+from odoo.addons.hr_attendance_face_recognition.utils.read_replica import report_query
+from odoo.addons.hr_attendance_face_recognition.models.hr_attendance_face_health import HEALTH_CHANNEL
+from .main import FaceRecognitionController
+from .model_files import MODELS_PATH, FACE_API_NETS
+
+# Colliding employee pairs listed one by one in the diagnostics
+MAX_COLLISION_ISSUES = 20
+
+# Seconds a readiness answer is reused, so probes cost no more than a
+# dictionary lookup between two refreshes
+PROBE_CACHE_SECONDS = 5
+
+# database -> (monotonic time, readiness checks)
+_readiness = {}
+# database -> 'warming', 'failed', or the partition keys this worker's
+# gallery cache was warmed with
+_warm_state = {}
+_probe_lock = threading.Lock()
+
+
+def _models_present():
+    return all(
+        os.path.exists(os.path.join(MODELS_PATH, '%s-weights_manifest.json' % prefix))
+        for prefix in FACE_API_NETS.values()
+    )
+
+
+def _warm_gallery_cache(dbname):
+    """Build this worker's galleries for ``dbname``, in a thread of its own"""
+    try:
+        with odoo.registry(dbname).cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            # The matching daemon holds the galleries instead
+            partitions = []
+            if not env['hr.employee']._get_face_matching_client():
+                partitions = FaceRecognitionController()._warm_gallery_cache(env)
+        face_logger.info("Gallery cache of %s warmed with %d kiosk partitions", dbname, len(partitions))
+        state = tuple(partitions)
+    except Exception as e:
+        face_logger.warning("Could not warm the gallery cache of %s: %s", dbname, e)
+        state = 'failed'
+    with _probe_lock:
+        _warm_state[dbname] = state
+
+
+def _start_warm_up(dbname):
+    """Warm this worker's gallery cache of ``dbname`` unless it already is warming"""
+    with _probe_lock:
+        if _warm_state.get(dbname) == 'warming':
+            return
+        _warm_state[dbname] = 'warming'
+    threading.Thread(target=_warm_gallery_cache, args=(dbname,), daemon=True,
+                     name='face-recognition-warmup').start()
+
+
+def _warm_after_fork():
+    """Warm a new prefork worker's galleries of the preloaded databases
+
+    The cache is per process, so each worker builds its own as it starts
+    rather than on its first scan or probe. The registries were loaded,
+    and the connection pool emptied, before the workers were forked.
+    """
+    _warm_state.clear()
+    _readiness.clear()
+    for dbname in (config['db_name'] or '').split(','):
+        dbname = dbname.strip()
+        if dbname in Registry.registries and 'hr.attendance.face.kiosk' in Registry.registries[dbname]:
+            _start_warm_up(dbname)
+
+
+os.register_at_fork(after_in_child=_warm_after_fork)
+
+
+def _check_readiness(dbname):
+    """Return the readiness checks of this worker for ``dbname``
+
+    The database answers ``SELECT 1`` and tells which matching backend is
+    in use. With the matching daemon, it must answer; with in-process
+    matching, this worker's galleries of the kiosk partitions must be
+    built and current. A call finding them missing, expired or
+    invalidated (re)builds them in the background.
+    """
+    checks = {'models': _models_present(), 'database': False, 'gallery': False}
+    try:
+        with odoo.registry(dbname).cursor() as cr:
+            cr.execute("SELECT 1")
+            checks['database'] = True
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            client = env['hr.employee']._get_face_matching_client()
+            if client:
+                # The daemon is shared by the host's workers and loads its
+                # gallery on the first scan any of them sends
+                client.status()
+                checks['gallery'] = True
+                return checks
+    except Exception as e:
+        face_logger.warning("Readiness check of %s failed: %s", dbname, e)
+        return checks
+    
+    cache = FaceRecognitionController._gallery_cache
+    with _probe_lock:
+        state = _warm_state.get(dbname)
+        warm = isinstance(state, tuple) and all(cache.valid(key) for key in state)
+    if not warm:
+        _start_warm_up(dbname)
+    checks['gallery'] = warm
+    return checks
 
 class FaceRecognitionHealthCheck(http.Controller):
     
+    @http.route('/face_recognition/live', type='http', auth='none', methods=['GET'], save_session=False)
+    def liveness(self):
+        """Answer as long as the worker serves requests; touches nothing else"""
+        return Response(json.dumps({'status': 'alive'}), content_type='application/json')
+    
+    @http.route('/face_recognition/ready', type='http', auth='none', methods=['GET'], save_session=False)
+    def readiness(self):
+        """Answer 200 once this worker can serve kiosks, 503 until then
+
+        Checks that the face models are installed, the database answers
+        and the galleries are loaded, from results at most
+        ``PROBE_CACHE_SECONDS`` old.
+
+        Readiness is that of the worker answering the probe: the gallery
+        cache is per process. Under prefork, every worker starts warming
+        the preloaded databases (``--database``) as it is forked, so they
+        are warm at about the same time; databases not preloaded are only
+        warmed by the workers that get a probe or a scan for them.
+        """
+        dbname = request.db
+        checks = {'models': _models_present(), 'database': False, 'gallery': False}
+        if dbname:
+            now = time.monotonic()
+            with _probe_lock:
+                cached = _readiness.get(dbname)
+            if cached and now - cached[0] < PROBE_CACHE_SECONDS:
+                checks = cached[1]
+            else:
+                checks = _check_readiness(dbname)
+                with _probe_lock:
+                    _readiness[dbname] = (now, checks)
+        
+        ready = all(checks.values())
+        return Response(
+            json.dumps({'status': 'ready' if ready else 'not_ready', 'database': dbname, 'checks': checks}),
+            status=200 if ready else 503,
+            content_type='application/json'
+        )
+    
     @http.route('/face_recognition/health', type='json', auth='user')
     def health_check(self):
-        """Return health status of the face recognition service"""
+        """Return health status of the face recognition service
+
+        Computes every check now; open dashboards get the same checks
+        pushed over the bus instead, see ``health_subscribe``.
+        """
         # Check if user has admin rights
         if not request.env.user.has_group('hr_attendance.group_hr_attendance_manager'):
             return {
@@ -26,322 +182,68 @@ class FaceRecognitionHealthCheck(http.Controller):
             
         face_logger.info(f"Health check initiated by {request.env.user.name}")
         
-        start_time = time.time()
-        status = {
-            'status': 'ok',
-            'timestamp': fields.Datetime.now(),
-            'checks': {
-                'models_check': self._check_face_models(),
-                'database_check': self._check_database(),
-                'system_check': self._check_system_resources(),
-                'usage_statistics': self._get_usage_statistics(),
-                'recognition_performance': self._check_recognition_performance()
-            }
-        }
-        
-        # Determine overall status based on individual checks
-        if any(check.get('status') == 'error' for check in status['checks'].values()):
-            status['status'] = 'error'
-        elif any(check.get('status') == 'warning' for check in status['checks'].values()):
-            status['status'] = 'warning'
-            
-        # Add response time
-        status['response_time'] = time.time() - start_time
+        Health = request.env['hr.attendance.face.health']
+        status = Health._collect_health()
+        status['checks']['request_tracing'] = self._get_slow_requests()
+        status['checks']['admission_control'] = self._get_admission_status()
+        status['status'] = Health._overall_status(status['checks'])
         
         return status
         
-    def _check_face_models(self):
-        """Verify face recognition models exist and are accessible"""
-        result = {
-            'status': 'ok',
-            'message': 'Face recognition models are properly installed'
-        }
-        
-        try:
-            # Get module path
-            module_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            models_path = os.path.join(module_path, 'static', 'models')
-            
-            # Required model files
-            required_models = [
-                'face_landmark_68_model-weights_manifest.json',
-                'face_recognition_model-weights_manifest.json',
-                'tiny_face_detector_model-weights_manifest.json'
-            ]
-            
-            # Check if models directory exists
-            if not os.path.exists(models_path):
-                result['status'] = 'error'
-                result['message'] = f"Models directory not found at {models_path}"
-                return result
-                
-            # Check for required model files
-            missing_models = []
-            for model in required_models:
-                if not os.path.exists(os.path.join(models_path, model)):
-                    missing_models.append(model)
-            
-            if missing_models:
-                result['status'] = 'error'
-                result['message'] = f"Missing required model files: {', '.join(missing_models)}"
-                result['models_path'] = models_path
-                result['missing_models'] = missing_models
-            else:
-                # Count total model files for info
-                model_files = os.listdir(models_path)
-                result['model_count'] = len(model_files)
-                result['models_path'] = models_path
-                
-        except Exception as e:
-            result['status'] = 'error'
-            result['message'] = f"Error checking face models: {str(e)}"
-            
-        return result
-        
-    def _check_database(self):
-        """Check database connectivity and face recognition data"""
-        result = {
-            'status': 'ok',
-            'message': 'Database checks passed'
-        }
-        
-        try:
-            # Check if we can query employees
-            employee_count = request.env['hr.employee'].sudo().search_count([])
-            result['employee_count'] = employee_count
-            
-            # Check how many employees have face recognition data
-            face_count = request.env['hr.employee'].sudo().search_count([
-                ('face_encoding', '!=', False),
-                ('face_recognition_active', '=', True)
-            ])
-            result['face_registered_count'] = face_count
-            
-            # Warning if no employees have face data
-            if employee_count > 0 and face_count == 0:
-                result['status'] = 'warning'
-                result['message'] = 'No employees have registered face data'
-                
-            # Check for recent attendances using face recognition
-            one_week_ago = fields.Datetime.now() - timedelta(days=7)
-            face_attendance_count = request.env['hr.attendance'].sudo().search_count([
-                '|', 
-                ('check_in_method', '=', 'face'), 
-                ('check_out_method', '=', 'face'),
-                ('create_date', '>=', one_week_ago)
-            ])
-            result['recent_face_attendance_count'] = face_attendance_count
-            
-        except Exception as e:
-            result['status'] = 'error'
-            result['message'] = f"Database check failed: {str(e)}"
-            
-        return result
-        
-    def _check_system_resources(self):
-        """Check system resources (memory, disk space, etc.)"""
-        result = {
-            'status': 'ok',
-            'message': 'System resources are adequate',
-            'system_info': {
-                'platform': platform.platform(),
-                'python_version': sys.version,
-                'odoo_version': config.get('version', 'Unknown')
-            }
-        }
-        
-        try:
-            # Check memory usage
-            memory = psutil.virtual_memory()
-            result['memory'] = {
-                'total': memory.total,
-                'available': memory.available,
-                'percent_used': memory.percent,
-                'used': memory.used,
-                'free': memory.free
-            }
-            
-            # Warning if memory usage is high
-            if memory.percent > 90:
-                result['status'] = 'warning'
-                result['message'] = f"High memory usage: {memory.percent}%"
-                
-            # Check disk space
-            disk = psutil.disk_usage('/')
-            result['disk'] = {
-                'total': disk.total,
-                'used': disk.used,
-                'free': disk.free,
-                'percent_used': disk.percent
-            }
-            
-            # Warning if disk usage is high
-            if disk.percent > 90:
-                result['status'] = 'warning'
-                result['message'] = f"Low disk space: {disk.percent}% used"
-                
-            # Check CPU usage
-            cpu_percent = psutil.cpu_percent(interval=0.5)
-            result['cpu'] = {
-                'percent_used': cpu_percent,
-                'cores': psutil.cpu_count()
+    @http.route('/face_recognition/health/subscribe', type='json', auth='user')
+    def health_subscribe(self):
+        """Return the latest published health snapshot for a dashboard
+
+        The dashboard then listens on the bus channel for the changes a
+        single cron job publishes, and calls this again every few minutes
+        to keep the job running. ``request_tracing`` and
+        ``admission_control`` are this worker's own and are not published.
+        """
+        if not request.env.user.has_group('hr_attendance.group_hr_attendance_manager'):
+            return {
+                'status': 'error',
+                'message': _("Insufficient permissions to check system health")
             }
             
-            # Warning if CPU usage is high
-            if cpu_percent > 90:
-                result['status'] = 'warning'
-                result['message'] = f"High CPU usage: {cpu_percent}%"
-                
-        except Exception as e:
-            # Non-critical error, just log it
-            result['status'] = 'warning'
-            result['message'] = f"Could not check system resources: {str(e)}"
-            
+        result = request.env['hr.attendance.face.health']._subscribe()
+        result.update(
+            channel=HEALTH_CHANNEL,
+            request_tracing=self._get_slow_requests(),
+            admission_control=self._get_admission_status()
+        )
         return result
         
-    def _get_usage_statistics(self):
-        """Get usage statistics for face recognition"""
+    def _get_slow_requests(self):
+        """Report the slow verify/register traces recorded by this worker"""
+        slow_requests = get_slow_traces()
         result = {
             'status': 'ok',
-            'message': 'Usage statistics retrieved successfully'
+            'message': 'No slow requests recorded',
+            'threshold_ms': slow_trace_threshold * 1000,
+            'slow_requests': slow_requests
         }
         
-        try:
-            # Last 30 days
-            thirty_days_ago = fields.Datetime.now() - timedelta(days=30)
-            
-            # Total attendances using face recognition
-            total_face_attendances = request.env['hr.attendance'].sudo().search_count([
-                '|', 
-                ('check_in_method', '=', 'face'), 
-                ('check_out_method', '=', 'face')
-            ])
-            result['total_face_attendances'] = total_face_attendances
-            
-            # Recent attendances (last 30 days)
-            recent_face_attendances = request.env['hr.attendance'].sudo().search_count([
-                '|', 
-                ('check_in_method', '=', 'face'), 
-                ('check_out_method', '=', 'face'),
-                ('create_date', '>=', thirty_days_ago)
-            ])
-            result['recent_face_attendances'] = recent_face_attendances
-            
-            # Get usage by day for the last 7 days
-            seven_days_ago = fields.Datetime.now() - timedelta(days=7)
-            
-            # This query gets the count of attendances per day
-            request.env.cr.execute("""
-                SELECT DATE(create_date) as date, COUNT(*) as count
-                FROM hr_attendance
-                WHERE (check_in_method = 'face' OR check_out_method = 'face')
-                AND create_date >= %s
-                GROUP BY DATE(create_date)
-                ORDER BY date
-            """, (seven_days_ago,))
-            
-            daily_counts = request.env.cr.dictfetchall()
-            result['daily_usage'] = daily_counts
-            
-            # Most active employees
-            request.env.cr.execute("""
-                SELECT employee_id, COUNT(*) as count
-                FROM hr_attendance
-                WHERE (check_in_method = 'face' OR check_out_method = 'face')
-                AND create_date >= %s
-                GROUP BY employee_id
-                ORDER BY count DESC
-                LIMIT 5
-            """, (thirty_days_ago,))
-            
-            top_employees_data = request.env.cr.dictfetchall()
-            
-            # Get employee names
-            top_employees = []
-            for item in top_employees_data:
-                employee = request.env['hr.employee'].sudo().browse(item['employee_id'])
-                top_employees.append({
-                    'employee_id': item['employee_id'],
-                    'name': employee.name if employee.exists() else 'Unknown',
-                    'count': item['count']
-                })
-            
-            result['top_employees'] = top_employees
-            
-        except Exception as e:
-            result['status'] = 'warning'
-            result['message'] = f"Error retrieving usage statistics: {str(e)}"
+        if slow_requests:
+            result['message'] = f"{len(slow_requests)} request(s) slower than {slow_trace_threshold * 1000:.0f} ms"
             
         return result
         
-    def _check_recognition_performance(self):
-        """Check face recognition performance metrics"""
-        result = {
-            'status': 'ok',
-            'message': 'Recognition performance is acceptable'
-        }
+    def _get_admission_status(self):
+        """Report this worker's verify queue, the requests it shed and its shared slots"""
+        result = dict(verify_admission.stats(), status='ok')
+        if not result['enabled']:
+            result['message'] = 'Admission control disabled'
+            return result
         
-        try:
-            # Get average confidence score for recent recognitions
-            thirty_days_ago = fields.Datetime.now() - timedelta(days=30)
-            
-            request.env.cr.execute("""
-                SELECT AVG(confidence_score) as avg_confidence
-                FROM hr_attendance
-                WHERE (check_in_method = 'face' OR check_out_method = 'face')
-                AND confidence_score > 0
-                AND create_date >= %s
-            """, (thirty_days_ago,))
-            
-            avg_result = request.env.cr.dictfetchone()
-            avg_confidence = avg_result.get('avg_confidence', 0) if avg_result else 0
-            
-            result['avg_confidence'] = avg_confidence
-            
-            # Warning if average confidence is low
-            if avg_confidence and avg_confidence < 80:
-                result['status'] = 'warning'
-                result['message'] = f"Low average recognition confidence: {avg_confidence:.2f}%"
-                
-            # Get confidence score distribution
-            request.env.cr.execute("""
-                SELECT
-                    CASE
-                        WHEN confidence_score >= 90 THEN '90-100%'
-                        WHEN confidence_score >= 80 THEN '80-90%'
-                        WHEN confidence_score >= 70 THEN '70-80%'
-                        ELSE 'Below 70%'
-                    END as range,
-                    COUNT(*) as count
-                FROM hr_attendance
-                WHERE (check_in_method = 'face' OR check_out_method = 'face')
-                AND confidence_score > 0
-                AND create_date >= %s
-                GROUP BY range
-                ORDER BY range
-            """, (thirty_days_ago,))
-            
-            confidence_distribution = request.env.cr.dictfetchall()
-            result['confidence_distribution'] = confidence_distribution
-            
-            # Calculate total entries for percentage
-            total_entries = sum(item['count'] for item in confidence_distribution)
-            if total_entries > 0:
-                for item in result['confidence_distribution']:
-                    item['percentage'] = (item['count'] / total_entries) * 100
-                    
-            # Warning if more than 10% of recognitions are below 70% confidence
-            below_70_item = next((item for item in confidence_distribution if item['range'] == 'Below 70%'), None)
-            if below_70_item and total_entries > 0:
-                below_70_percent = (below_70_item['count'] / total_entries) * 100
-                if below_70_percent > 10:
-                    result['status'] = 'warning'
-                    result['message'] = f"{below_70_percent:.2f}% of recognitions have confidence below 70%"
-            
-        except Exception as e:
+        shared = get_shared_slots(request.db)
+        result['shared'] = shared.status()
+        result['message'] = f"{result['active']} verifying, {result['queue_depth']} queued, {result['shed']} shed"
+        if not result['shared']['available']:
             result['status'] = 'warning'
-            result['message'] = f"Error checking recognition performance: {str(e)}"
-            
+            result['message'] += f" (shared slots unavailable: {result['shared']['last_error']})"
+        elif result['last_shed'] and time.time() - result['last_shed'] < SHED_WARNING_SECONDS:
+            result['status'] = 'warning'
+            result['message'] += f" (shedding within the last {SHED_WARNING_SECONDS // 60} minutes)"
         return result
         
     @http.route('/face_recognition/diagnostics', type='json', auth='user')
@@ -371,6 +273,9 @@ class FaceRecognitionHealthCheck(http.Controller):
         # Check for unusual patterns
         self._check_attendance_patterns(diagnostics)
         
+        # Report employees the last identity audit found mistakable
+        self._check_identity_collisions(diagnostics)
+        
         # Generate recommendations based on findings
         self._generate_recommendations(diagnostics)
         
@@ -472,7 +377,7 @@ class FaceRecognitionHealthCheck(http.Controller):
             # Check for employees with low recognition confidence
             thirty_days_ago = fields.Datetime.now() - timedelta(days=30)
             
-            request.env.cr.execute("""
+            low_confidence_employees = report_query(request.env, """
                 SELECT employee_id, AVG(confidence_score) as avg_confidence
                 FROM hr_attendance
                 WHERE (check_in_method = 'face' OR check_out_method = 'face')
@@ -483,8 +388,6 @@ class FaceRecognitionHealthCheck(http.Controller):
                 ORDER BY avg_confidence
             """, (thirty_days_ago,))
             
-            low_confidence_employees = request.env.cr.dictfetchall()
-            
             for entry in low_confidence_employees:
                 employee = request.env['hr.employee'].sudo().browse(entry['employee_id'])
                 diagnostics['issues'].append({
@@ -506,6 +409,41 @@ class FaceRecognitionHealthCheck(http.Controller):
                 'message': f"Error checking attendance patterns: {str(e)}"
             })
             
+    def _check_identity_collisions(self, diagnostics):
+        """Report the colliding employee pairs of the latest identity audit"""
+        try:
+            audit = request.env['hr.attendance.face.audit'].sudo().search([], limit=1)
+            
+            if not audit or audit.create_date < fields.Datetime.now() - timedelta(days=30):
+                diagnostics['issues'].append({
+                    'type': 'identity_audit',
+                    'severity': 'warning',
+                    'message': "No face identity audit in the last 30 days"
+                })
+                
+            for line in audit.line_ids[:MAX_COLLISION_ISSUES]:
+                diagnostics['issues'].append({
+                    'type': 'identity_collision',
+                    'severity': 'error',
+                    'message': f"Employees {line.employee_a_id.name} and {line.employee_b_id.name} have face "
+                               f"templates {line.similarity:.1f}% similar and may be recognized as each other"
+                })
+                
+            if audit.pair_count > MAX_COLLISION_ISSUES:
+                diagnostics['issues'].append({
+                    'type': 'identity_collision',
+                    'severity': 'error',
+                    'message': f"{audit.pair_count - MAX_COLLISION_ISSUES} more colliding employee pairs, "
+                               f"see the identity audit of {audit.create_date}"
+                })
+                
+        except Exception as e:
+            diagnostics['issues'].append({
+                'type': 'system',
+                'severity': 'error',
+                'message': f"Error checking identity collisions: {str(e)}"
+            })
+            
     def _generate_recommendations(self, diagnostics):
         """Generate recommendations based on diagnostic issues"""
         issue_types = [issue['type'] for issue in diagnostics['issues']]
@@ -541,6 +479,16 @@ class FaceRecognitionHealthCheck(http.Controller):
                 "Re-register face templates for employees with consistently low recognition confidence"
             )
             
+        # Identity audit recommendations
+        if 'identity_collision' in issue_types:
+            diagnostics['recommendations'].append(
+                "Review the face identity audit and re-register employees enrolled with someone else's face"
+            )
+        elif 'identity_audit' in issue_types:
+            diagnostics['recommendations'].append(
+                "Run a face identity audit from Attendances > Configuration"
+            )
+            
         # General recommendations
         diagnostics['recommendations'].append(
             "Regularly clean the camera lens for optimal recognition"
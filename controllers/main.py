@@ -1,13 +1,21 @@
 # -*- coding: utf-8 -*-
 import json
 import logging
+import os
 import base64
 import numpy as np
 import time
 import traceback
-from datetime import datetime
-from odoo import http, fields, _
-from odoo.http import request, Response
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_READ_COMMITTED
+
+from odoo import api, http, fields, SUPERUSER_ID, _
+from odoo.tools import config
+from odoo.exceptions import UserError, ValidationError
+from odoo.http import request, Response, content_disposition
 from odoo.addons.web.controllers.main import ensure_db
 
 # Import dedicated logger and utils
@@ -16,42 +24,188 @@ from odoo.addons.hr_attendance_face_recognition.utils.logging_utils import (
     log_entry_exit, log_face_recognition_attempt, 
     log_face_registration, log_system_error, log_recognition_metrics
 )
+from odoo.addons.hr_attendance_face_recognition.utils.tracing import trace_request, span
+from odoo.addons.hr_attendance_face_recognition.utils.admission import (
+    verify_admission, get_shared_slots, ServerBusy
+)
+from odoo.addons.hr_attendance_face_recognition.utils.read_replica import report_query
+from odoo.addons.hr_attendance_face_recognition.utils.profiling import (
+    DEFAULT_SAMPLE_INTERVAL, PROFILE_FORMATS, capture_path, current_capture, list_captures, profiled,
+    start_capture, trace_allocations,
+)
+from odoo.addons.hr_attendance_face_recognition.utils.descriptor_codec import decode_face_descriptor
+from odoo.addons.hr_attendance_face_recognition.utils.face_matching import (
+    as_template_block, similarity_from_distance
+)
+from odoo.addons.hr_attendance_face_recognition.utils.gallery_bundle import get_bundle_signer
+from odoo.addons.hr_attendance_face_recognition.utils.sharded_matching import (
+    build_face_gallery, max_pool_processes, DEFAULT_MIN_SHARDED_TEMPLATES
+)
+from odoo.addons.hr_attendance_face_recognition.utils.matching_service import (
+    SidecarGallery, MatchingServiceError, employee_subset
+)
+from odoo.addons.hr_attendance_face_recognition.utils.gallery_cache import GalleryCache
+from odoo.addons.hr_attendance_face_recognition.utils.face_import import read_face_import
+from odoo.addons.hr_attendance_face_recognition.utils.probe_memo import (
+    ProbeMemo, DEFAULT_MEMO_TTL, DEFAULT_MEMO_DISTANCE
+)
+from odoo.addons.hr_attendance_face_recognition.utils.tiered_gallery import (
+    HotTier, TierStats, DEFAULT_HOT_TIER_HOURS, DEFAULT_HOT_TIER_MARGIN, HOT_TIER_SYNC_OVERLAP
+)
+
+# Seconds between two gallery bundle updates of a kiosk matching on the
+# device, and age after which it fetches a full bundle again
+BUNDLE_REFRESH_INTERVAL = 5 * 60
+BUNDLE_MAX_AGE = 24 * 60 * 60
+
+# Longest side (px) and JPEG quality of the face crop the kiosk uploads
+# when attendance images are stored
+SNAPSHOT_MAX_SIZE = 240
+SNAPSHOT_QUALITY = 0.7
+
+# Largest batch of offline events accepted by /face_recognition/verify/bulk
+MAX_BULK_EVENTS = 500
+
+# Offline events older than this are refused rather than backdating attendance
+MAX_EVENT_AGE = timedelta(days=7)
+# Tolerated kiosk clock drift into the future
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+# First key of the per-employee advisory locks serializing attendance
+# toggles, the second being the employee id ('FACE' in ASCII)
+ATTENDANCE_LOCK_NAMESPACE = 0x46414345
+# Default seconds during which another scan of the same employee repeats
+# the last check-in/out instead of toggling it back
+DEFAULT_RESCAN_INTERVAL = 60
+
+
+def _parse_capture_time(captured_at):
+    """Convert a kiosk timestamp in epoch milliseconds to a naive UTC datetime"""
+    timestamp = datetime.utcfromtimestamp(float(captured_at) / 1000.0).replace(microsecond=0)
+    now = datetime.utcnow()
+    if timestamp > now + MAX_CLOCK_SKEW:
+        raise ValueError("Capture time is in the future")
+    if timestamp < now - MAX_EVENT_AGE:
+        raise ValueError("Capture time is too old to replay")
+    return timestamp
 
 class FaceRecognitionController(http.Controller):
-    # Class variables for caching
-    _face_encodings_cache = {}
-    _cache_timestamp = None
+    # Galleries per kiosk partition, shared by every request of this worker
     _cache_validity = 600  # 10 minutes in seconds
+    _gallery_cache = GalleryCache(_cache_validity)
+    # Employee subsets per partition, when matching runs in the matching daemon
+    _partition_ids_cache = GalleryCache(_cache_validity)
+    # Recent results per kiosk, reused for the next frames of the same face;
+    # ``face_recognition_probe_memo_ttl = 0`` in the server config disables it
+    _probe_memo = ProbeMemo(
+        ttl=float(config.get('face_recognition_probe_memo_ttl', DEFAULT_MEMO_TTL)),
+        max_distance=float(config.get('face_recognition_probe_memo_distance', DEFAULT_MEMO_DISTANCE)),
+    )
+    # Recently active employees, matched before the rest of their partition
+    _hot_tier = HotTier()
+    _tier_stats = TierStats()
+    # Claims of kiosks matching on the device, by outcome
+    _edge_claims = {'confirmed': 0, 'rejected': 0}
     
-    @log_entry_exit
-    def _get_all_face_encodings(self):
-        """Cache all employee face encodings for faster recognition"""
-        current_time = time.time()
+    def _get_kiosk_partition(self, device_key=None):
+        """Return ``(partition_key, employee_domain)`` for the requesting kiosk
+
+        Registered kiosks send their device key and are scoped to their
+        company, department or work location. Other kiosks are scoped to
+        the companies of the kiosk user. Returns ``(None, None)`` for an
+        unknown device key.
+        """
+        if device_key:
+            return request.env['hr.attendance.face.kiosk']._get_partition(device_key)
+        return self._get_companies_partition(request.env.user)
+    
+    def _get_companies_partition(self, user):
+        """Return the partition of an unregistered kiosk run as ``user``"""
+        company_ids = tuple(sorted(user.company_ids.ids))
+        return ('companies',) + company_ids, [('company_id', 'in', list(company_ids))]
+    
+    def _get_face_matcher(self, partition):
+        """Return what to match probes against for a kiosk partition
+
+        That is the matching daemon when the ``matching_backend`` parameter
+        is 'sidecar', or this worker's own gallery cache. An unreachable
+        daemon falls back to the local cache.
+        """
+        # Bulk changes made by any worker bump the database's generation
+        generation = request.env['hr.employee']._get_face_gallery_generation()
+        self._gallery_cache.set_generation(generation)
+        self._partition_ids_cache.set_generation(generation)
         
-        # Return cached data if valid
-        if self._cache_timestamp and (current_time - self._cache_timestamp < self._cache_validity):
-            face_logger.debug(f"Using cached face encodings for {len(self._face_encodings_cache)} employees")
-            return self._face_encodings_cache
-            
-        # Rebuild cache
-        start_time = time.time()
-        self._face_encodings_cache = {}
-        employees = request.env['hr.employee'].search([
+        client = request.env['hr.employee']._get_face_matching_client()
+        if client:
+            key, domain = partition
+            subset = self._partition_ids_cache.get(key, lambda: employee_subset(
+                repr(key), request.env['hr.employee'].sudo().search(domain).ids))
+            gallery = SidecarGallery(client, self._load_face_templates_fresh, subset)
+            try:
+                gallery.ensure_loaded()
+                return gallery
+            except MatchingServiceError as e:
+                log_system_error("matcher_unavailable", "Face matcher unavailable, matching in-process", {
+                    "socket": client.socket_path,
+                    "error": str(e)
+                })
+        return self._get_all_face_encodings(partition)
+    
+    def _get_matcher_generation(self, partition, matcher):
+        """Return what identifies the gallery state ``matcher`` matches against"""
+        if isinstance(matcher, SidecarGallery):
+            return ('sidecar', matcher.generation)
+        return ('local', self._gallery_cache.version(partition[0]))
+    
+    def _get_tiered_gallery(self, partition, gallery, hours):
+        """Return the partition gallery with its recently active employees as a hot tier
+
+        The activity is read in full every few minutes and, in between,
+        only the attendances written since the previous read.
+        """
+        hot_tier = self._hot_tier
+        now = datetime.utcnow()
+        since = now - timedelta(hours=hours)
+        Attendance = request.env['hr.attendance'].sudo()
+        # One request reads the attendances, outside the lock; the others
+        # go on with the activity known so far rather than wait for it
+        with hot_tier.lock:
+            due = hot_tier.due()
+            if due:
+                hot_tier.refreshing = True
+                synced_at = hot_tier.synced_at
+        if due:
+            try:
+                if due == 'load':
+                    activity, synced_at = Attendance._get_face_activity(since=since)
+                else:
+                    activity, synced_at = Attendance._get_face_activity(
+                        changed_since=synced_at - HOT_TIER_SYNC_OVERLAP)
+                with hot_tier.lock:
+                    if due == 'load':
+                        hot_tier.load(activity, synced_at or now)
+                    else:
+                        hot_tier.merge(activity, synced_at)
+            finally:
+                hot_tier.refreshing = False
+        with hot_tier.lock:
+            return hot_tier.tiered_gallery(partition[0], gallery, since)
+    
+    def _load_face_templates(self, env, domain=None):
+        """Return ``(employee_id, templates)`` for every active employee with face data"""
+        employees = env['hr.employee'].sudo().search([
             ('face_encoding', '!=', False),
             ('face_recognition_active', '=', True)
-        ])
+        ] + (domain or []))
         
-        face_logger.info(f"Rebuilding face encoding cache for {len(employees)} employees")
+        face_logger.info("Loading face templates for %d employees", len(employees))
         
-        valid_employees = 0
+        templates_by_employee = []
         for employee in employees:
             try:
                 templates = json.loads(base64.b64decode(employee.face_encoding).decode('utf-8'))
-                self._face_encodings_cache[employee.id] = {
-                    'employee': employee,
-                    'templates': templates
-                }
-                valid_employees += 1
+                templates_by_employee.append((employee.id, as_template_block(templates)))
             except Exception as e:
                 log_system_error("template_decode_error", 
                     f"Error loading face template for employee {employee.name}", {
@@ -59,15 +213,59 @@ class FaceRecognitionController(http.Controller):
                         "error": str(e)
                     }
                 )
+        return templates_by_employee
+    
+    def _warm_gallery_cache(self, env):
+        """Build the gallery of every partition a kiosk may ask for
+
+        Those of the registered kiosks, and those unregistered kiosks get,
+        one per set of companies of the attendance officers they run as.
+        Run before a worker takes kiosk traffic, so the first scans do not
+        pay for the build. Returns the partition keys.
+        """
+        Kiosk = env['hr.attendance.face.kiosk'].sudo()
+        partitions = dict(Kiosk._get_partition(device_key) for device_key in Kiosk.search([]).mapped('device_key'))
+        officers = env.ref('hr_attendance.group_hr_attendance_user').sudo().users
+        partitions.update(self._get_companies_partition(user) for user in officers)
+        for key, domain in partitions.items():
+            self._gallery_cache.get(key, lambda: self._build_face_gallery(key, domain, env))
+        return list(partitions)
+    
+    def _load_face_templates_fresh(self):
+        """Load the templates in a new transaction
         
-        self._cache_timestamp = current_time
+        The daemon's generation is read before this is called, so the
+        snapshot must not predate it, or changes pushed in between would be
+        overwritten with older data.
+        """
+        with request.env.registry.cursor() as cr:
+            return self._load_face_templates(api.Environment(cr, SUPERUSER_ID, {}))
+    
+    @log_entry_exit
+    def _get_all_face_encodings(self, partition):
+        """Cache a partition's face templates as one matrix for faster recognition"""
+        key, domain = partition
+        return self._gallery_cache.get(key, lambda: self._build_face_gallery(key, domain))
+    
+    def _build_face_gallery(self, key, domain, env=None):
+        start_time = time.time()
+        with trace_allocations('cache_build %s' % (key,)):
+            templates_by_employee = self._load_face_templates(env or request.env, domain)
+            
+            # Large galleries can be scored across a process pool, one shard per
+            # process; set ``face_recognition_match_shards`` in the server config.
+            # Each HTTP worker has its own pool, so the CPUs are split among them
+            shards = int(config.get('face_recognition_match_shards', 0) or 0)
+            shards = min(shards, max_pool_processes(config['workers']))
+            min_templates = int(config.get('face_recognition_shard_min_templates', DEFAULT_MIN_SHARDED_TEMPLATES))
+            gallery = build_face_gallery(templates_by_employee, shards, min_templates)
         cache_build_time = time.time() - start_time
         face_logger.info(
-            f"Face encoding cache rebuilt with {valid_employees}/{len(employees)} "
-            f"employees in {cache_build_time:.2f} seconds"
+            "Face encoding cache for partition %s rebuilt with %d employees (%d templates) in %.2f seconds",
+            key, len(templates_by_employee), gallery.template_count, cache_build_time
         )
         
-        return self._face_encodings_cache
+        return gallery
     
     @http.route('/face_recognition/kiosk', type='http', auth='user', website=True)
     def face_kiosk_mode(self, **kw):
@@ -75,13 +273,85 @@ class FaceRecognitionController(http.Controller):
         face_logger.info(f"Kiosk mode accessed by user {request.env.user.name} (ID: {request.env.user.id})")
         return request.render('hr_attendance_face_recognition.kiosk_face_mode')
     
+    @http.route('/face_recognition/kiosk/config', type='json', auth='user')
+    def kiosk_config(self, device_key=None):
+        """Return the settings the kiosk needs at startup"""
+        if device_key and not self._get_kiosk_partition(device_key)[0]:
+            return {'success': False, 'message': _("This kiosk is not registered")}
+        
+        store_images = request.env['ir.config_parameter'].sudo().get_param(
+            'hr_attendance_face_recognition.store_images', 'False') == 'True'
+        
+        settings = {
+            'success': True,
+            'store_images': store_images,
+            'snapshot_max_size': SNAPSHOT_MAX_SIZE,
+            'snapshot_quality': SNAPSHOT_QUALITY,
+            'edge_matching': False
+        }
+        if device_key:
+            kiosk = request.env['hr.attendance.face.kiosk'].sudo().search([('device_key', '=', device_key)], limit=1)
+            if kiosk.edge_matching:
+                settings.update(
+                    edge_matching=True,
+                    threshold=float(request.env['ir.config_parameter'].sudo().get_param(
+                        'hr_attendance_face_recognition.threshold', '70.0')),
+                    bundle_refresh=BUNDLE_REFRESH_INTERVAL,
+                    bundle_max_age=BUNDLE_MAX_AGE
+                )
+        return settings
+    
+    @http.route('/face_recognition/bundle', type='json', auth='user')
+    def gallery_bundle(self, device_key, generation=0):
+        """Return the signed gallery bundle of a kiosk that matches on the device
+
+        ``generation`` is that of the bundle the kiosk holds, 0 for none;
+        the answer is then a delta on top of it when that is smaller. Only
+        attendance officers, the users kiosks run as, may fetch one.
+        """
+        if not request.env.user.has_group('hr_attendance.group_hr_attendance_user'):
+            face_logger.warning(
+                f"Unauthorized gallery bundle request by user {request.env.user.name} "
+                f"(ID: {request.env.user.id})"
+            )
+            return {'success': False, 'message': _("Insufficient permissions")}
+        
+        kiosk = request.env['hr.attendance.face.kiosk'].sudo().search([('device_key', '=', device_key)], limit=1)
+        if not kiosk.edge_matching:
+            return {'success': False, 'message': _("This kiosk does not match on the device")}
+        
+        key, domain = self._get_kiosk_partition(device_key)
+        with trace_request('gallery_bundle', remote_addr=request.httprequest.remote_addr):
+            with span('build'):
+                bundle = request.env['hr.employee']._get_face_bundle(
+                    domain, '/'.join(str(part) for part in key), int(generation or 0))
+            with span('sign'):
+                signer = get_bundle_signer(kiosk._get_bundle_signing_key())
+                signed = signer.sign_bundle(bundle)
+        
+        face_logger.info("Gallery bundle generation %s (%s) sent to kiosk %s",
+                         bundle['generation'], 'delta' if bundle['base_generation'] else 'full', kiosk.name)
+        return dict(signed, success=True)
+    
     @http.route('/face_recognition/register', type='json', auth='user')
     @log_entry_exit
-    def register_face(self, employee_id, face_data):
-        """Register a new face for an employee"""
+    def register_face(self, employee_id, face_data, debug=False):
+        """Register a new face for an employee
+
+        When ``debug`` is set the response carries a per-stage ``timing``
+        breakdown of the request.
+        """
+        with profiled('register_face'), trace_request('register_face', employee_id=employee_id) as trace:
+            result = self._register_face(employee_id, face_data)
+        if debug:
+            result['timing'] = trace.as_dict()
+        return result
+
+    def _register_face(self, employee_id, face_data):
+        """Append the new templates to the employee, one span per stage"""
         employee = request.env['hr.employee'].browse(int(employee_id))
         
-        face_logger.info(f"Face registration initiated for employee ID {employee_id} by {request.env.user.name}")
+        face_logger.info("Face registration initiated for employee ID %s by %s", employee_id, request.env.user.name)
         
         if not employee.exists():
             log_face_registration(employee_id, "Not Found", 0, False)
@@ -91,32 +361,35 @@ class FaceRecognitionController(http.Controller):
             templates_count = 0
             
             # face_data should be a base64 encoded JSON string of face encodings
-            if employee.face_encoding:
-                # If the employee already has face data, load it and append
-                current_data = json.loads(base64.b64decode(employee.face_encoding).decode('utf-8'))
-                new_data = json.loads(base64.b64decode(face_data).decode('utf-8'))
-                
-                face_logger.debug(f"Adding {len(new_data)} templates to existing {len(current_data)} templates")
-                
-                # Combine and deduplicate face templates
-                combined_data = current_data + new_data
-                templates_count = len(combined_data)
-                
-                # Save the updated data
-                encoded_data = base64.b64encode(json.dumps(combined_data).encode('utf-8'))
-            else:
-                # First time registration
-                encoded_data = face_data
-                new_data = json.loads(base64.b64decode(face_data).decode('utf-8'))
-                templates_count = len(new_data)
-                face_logger.debug(f"First-time registration with {templates_count} templates")
+            with span('decode'):
+                if employee.face_encoding:
+                    # If the employee already has face data, load it and append
+                    current_data = json.loads(base64.b64decode(employee.face_encoding).decode('utf-8'))
+                    new_data = json.loads(base64.b64decode(face_data).decode('utf-8'))
+                    
+                    face_logger.debug("Adding %d templates to existing %d templates", len(new_data), len(current_data))
+                    
+                    # Combine and deduplicate face templates
+                    combined_data = current_data + new_data
+                    templates_count = len(combined_data)
+                    
+                    # Save the updated data
+                    encoded_data = base64.b64encode(json.dumps(combined_data).encode('utf-8'))
+                else:
+                    # First time registration
+                    encoded_data = face_data
+                    new_data = json.loads(base64.b64decode(face_data).decode('utf-8'))
+                    templates_count = len(new_data)
+                    face_logger.debug("First-time registration with %d templates", templates_count)
                 
-            employee.write({
-                'face_encoding': encoded_data
-            })
+            with span('write'):
+                employee.write({
+                    'face_encoding': encoded_data
+                })
             
             # Invalidate the cache since we've updated an employee's face data
-            self.__class__._cache_timestamp = None
+            self._gallery_cache.invalidate()
+            self._partition_ids_cache.invalidate()
             
             log_face_registration(employee_id, employee.name, templates_count, True)
             
@@ -144,15 +417,19 @@ class FaceRecognitionController(http.Controller):
     
     @http.route('/face_recognition/verify', type='json', auth='public')
     @log_entry_exit
-    def verify_face(self, face_data):
-        """Verify a face against all employees and check in/out if matched"""
+    def verify_face(self, face_data, debug=False):
+        """Verify a face against all employees and check in/out if matched
+
+        When ``debug`` is set the response carries a per-stage ``timing``
+        breakdown of the request.
+        """
         ensure_db()
         
         # Get client info for logging
         user_agent = request.httprequest.user_agent.string
         remote_addr = request.httprequest.remote_addr
         
-        face_logger.info(f"Face verification request from {remote_addr} ({user_agent})")
+        face_logger.info("Face verification request from %s (%s)", remote_addr, user_agent)
         
         # Security check for public access
         if not request.session.uid:
@@ -161,19 +438,58 @@ class FaceRecognitionController(http.Controller):
                 "user_agent": user_agent
             })
             return {'success': False, 'message': _("Authentication required")}
-            
+
+        # Kiosk-side FPS and detection timings, kept with the trace
+        client_metrics = face_data.get('client_metrics') if isinstance(face_data, dict) else None
+        kiosk = face_data.get('kiosk') if isinstance(face_data, dict) else None
+        
+        # A saturated server answers at once rather than letting the scan
+        # wait until the kiosk times out and sends it again; the slots are
+        # counted in this process and across the workers of the database
+        try:
+            with verify_admission.admit(kiosk or remote_addr, get_shared_slots(request.db)), \
+                    profiled('verify_face'):
+                with trace_request('verify_face', remote_addr=remote_addr, client=client_metrics) as trace:
+                    result = self._verify_face(face_data, remote_addr, user_agent)
+        except ServerBusy as busy:
+            log_system_error("verify_shed", "Face verification shed, server busy", {
+                "reason": busy.reason,
+                "retry_after": busy.retry_after,
+                "remote_addr": remote_addr
+            })
+            return {
+                'success': False,
+                'busy': True,
+                'retry_after': busy.retry_after,
+                'message': _("Server busy, retrying in a moment")
+            }
+        if debug:
+            result['timing'] = trace.as_dict()
+        return result
+
+    def _verify_face(self, face_data, remote_addr, user_agent):
+        """Match the probe and toggle attendance, one span per stage"""
         try:
             start_time = time.time()
             
-            # Get the threshold from settings
-            threshold = float(request.env['ir.config_parameter'].sudo().get_param(
-                'hr_attendance_face_recognition.threshold', '70.0'))
-            
-            # Check if we should store captured images
-            store_images = request.env['ir.config_parameter'].sudo().get_param(
-                'hr_attendance_face_recognition.store_images', 'False') == 'True'
+            with span('config'):
+                # Get the threshold from settings
+                threshold = float(request.env['ir.config_parameter'].sudo().get_param(
+                    'hr_attendance_face_recognition.threshold', '70.0'))
+                
+                # Check if we should store captured images
+                store_images = request.env['ir.config_parameter'].sudo().get_param(
+                    'hr_attendance_face_recognition.store_images', 'False') == 'True'
+                
+                # Recently active employees are matched first
+                hot_tier_hours = int(request.env['ir.config_parameter'].sudo().get_param(
+                    'hr_attendance_face_recognition.hot_tier_hours', DEFAULT_HOT_TIER_HOURS) or 0)
+                hot_tier_margin = float(request.env['ir.config_parameter'].sudo().get_param(
+                    'hr_attendance_face_recognition.hot_tier_margin', DEFAULT_HOT_TIER_MARGIN) or 0.0)
             
-            # face_data should be an object with encoding and optionally an image
+            # face_data should be an object with encoding and optionally an image.
+            # 'format' tags the encoding: 'f32'/'f16' raw little-endian floats,
+            # or the legacy base64 JSON list when absent.
             face_encoding = face_data.get('encoding')
             face_image = face_data.get('image') if store_images else False
             
@@ -183,87 +499,135 @@ class FaceRecognitionController(http.Controller):
                 })
                 return {'success': False, 'message': _("Missing face encoding data")}
             
-            # Find the employee with the highest match confidence
-            best_match = None
-            highest_confidence = 0
-            
-            # Get all employee face encodings from cache
-            employee_encodings = self._get_all_face_encodings()
+            # Kiosks tag scans with a UUID so that a scan whose response was
+            # lost and which is later replayed is only applied once
+            event_uuid = face_data.get('uuid')
+            if event_uuid:
+                known_event = request.env['hr.attendance.face.event'].sudo().search([
+                    ('uuid', '=', event_uuid)
+                ], limit=1)
+                if known_event:
+                    return self._face_event_result(known_event)
             
-            if not employee_encodings:
-                log_system_error("empty_cache", "No face templates available for matching", {
-                    "cache_timestamp": self._cache_timestamp
+            # Only the employees this kiosk serves are matched
+            partition = self._get_kiosk_partition(face_data.get('kiosk'))
+            if not partition[0]:
+                log_system_error("unknown_kiosk", "Face verification from an unregistered kiosk device", {
+                    "remote_addr": remote_addr
                 })
-                return {'success': False, 'message': _("No registered faces available for matching")}
+                return {'success': False, 'message': _("This kiosk is not registered")}
             
             # Convert input face encoding
             try:
-                input_encoding = json.loads(base64.b64decode(face_encoding).decode('utf-8'))
+                with span('decode'):
+                    input_encoding = decode_face_descriptor(face_encoding, face_data.get('format'))
             except Exception as e:
                 log_system_error("encoding_decode_error", "Failed to decode input face encoding", {
+                    "format": face_data.get('format'),
                     "error": str(e)
                 })
                 return {'success': False, 'message': _("Invalid face encoding format")}
             
-            # Compare against all employees in the cache
-            comparison_count = 0
-            for employee_id, data in employee_encodings.items():
-                employee = data['employee']
-                templates = data['templates']
+            # A kiosk matching on the device sends the employee it found;
+            # confirming the claim only scores that employee's templates
+            claimed = None
+            if face_data.get('claim') and face_data.get('kiosk'):
+                with span('claim'):
+                    claimed = self._verify_face_claim(partition, face_data['claim'], input_encoding, threshold)
+            
+            gallery = None
+            if claimed:
+                employee_id, highest_confidence = claimed
+            else:
+                # Get the partition's face encodings from cache
+                with span('cache'):
+                    gallery = self._get_face_matcher(partition)
+            
+                if not gallery:
+                    log_system_error("empty_cache", "No face templates available for matching", {
+                        "partition": partition[0]
+                    })
+                    return {'success': False, 'message': _("No registered faces available for matching")}
+            
+                # A repeat frame of a face this kiosk just sent reuses its result
+                # when the probes are too close for the decision to differ
+                memo_hit = None
+                if self._probe_memo:
+                    memo_kiosk = face_data.get('kiosk') or remote_addr
+                    memo_generation = self._get_matcher_generation(partition, gallery)
+                    with span('memo'):
+                        memo_hit = self._probe_memo.lookup(memo_kiosk, memo_generation, input_encoding)
+                    # Every similarity can move by up to the distance either way:
+                    # reuse only a result that stays on the same side of the
+                    # threshold, with a lead over the runner-up that no such
+                    # move can close
+                    if memo_hit:
+                        employee_id, highest_confidence, runner_up, distance = memo_hit
+                        if (abs(highest_confidence - threshold / 100.0) <= distance
+                                or highest_confidence - runner_up <= 2 * distance):
+                            memo_hit = None
+            
+                if not memo_hit:
+                    # The matching daemon holds its own gallery; an in-process one
+                    # is searched among the recently active employees first
+                    tiered = None
+                    if hot_tier_hours > 0 and not isinstance(gallery, SidecarGallery):
+                        with span('tiers'):
+                            tiered = self._get_tiered_gallery(partition, gallery, hot_tier_hours)
                 
-                # Compare against all templates for this employee
-                for template in templates:
-                    comparison_count += 1
-                    # Calculate similarity between face templates
-                    confidence = calculate_face_similarity(input_encoding, template)
-                    
-                    if confidence > highest_confidence:
-                        highest_confidence = confidence
-                        best_match = employee
+                    # Find the employee with the highest match confidence, comparing
+                    # against every template in the cache in one pass
+                    # The daemon reports no runner-up, so its results are not memoized
+                    runner_up = None
+                    with span('match'):
+                        if tiered is not None:
+                            employee_id, highest_confidence, _tier, runner_up = tiered.best_match(
+                                input_encoding, threshold / 100.0, hot_tier_margin / 100.0, self._tier_stats)
+                        elif isinstance(gallery, SidecarGallery):
+                            employee_id, highest_confidence = gallery.best_match(input_encoding)
+                        else:
+                            employee_id, highest_confidence, runner_up = gallery.best_match_with_runner_up(
+                                input_encoding)
+                    if self._probe_memo and runner_up is not None:
+                        self._probe_memo.store(memo_kiosk, memo_generation, input_encoding,
+                                               employee_id, highest_confidence, runner_up)
+            best_match = request.env['hr.employee'].browse(employee_id) if employee_id else None
             
             # Convert to percentage for easier understanding
             confidence_percentage = highest_confidence * 100
             
-            face_logger.debug(
-                f"Compared against {comparison_count} templates from {len(employee_encodings)} employees. "
-                f"Best match: {best_match.name if best_match else 'None'} with {confidence_percentage:.2f}% confidence"
-            )
+            if gallery is not None and face_logger.isEnabledFor(logging.DEBUG):
+                face_logger.debug(
+                    "Compared against %d templates from %d employees. Best match: %s with %.2f%% confidence",
+                    gallery.template_count, len(gallery),
+                    best_match.name if best_match else 'None', confidence_percentage
+                )
             
             # Record metrics
             processing_time = time.time() - start_time
             log_recognition_metrics(confidence_percentage, processing_time, {
                 "user_agent": user_agent,
-                "remote_addr": remote_addr
+                "remote_addr": remote_addr,
+                "client": face_data.get('client_metrics')
             })
             
             # Check if we have a match above the threshold
             if best_match and confidence_percentage >= threshold:
-                # Check if employee is already checked in
-                attendance = request.env['hr.attendance'].search([
-                    ('employee_id', '=', best_match.id),
-                    ('check_out', '=', False)
-                ], limit=1)
-                
-                attendance_vals = {
-                    'confidence_score': confidence_percentage,
-                    'face_image': face_image if store_images else False,
-                }
-                
-                action = "check_out" if attendance else "check_in"
-                
-                if attendance:  # Check out
-                    attendance.write({
-                        'check_out': fields.Datetime.now(),
-                        'check_out_method': 'face',
-                        **attendance_vals
-                    })
-                else:  # Check in
-                    request.env['hr.attendance'].create({
+                event_vals = None
+                if event_uuid:
+                    event_vals = {
+                        'uuid': event_uuid,
+                        'captured_at': fields.Datetime.now(),
                         'employee_id': best_match.id,
-                        'check_in': fields.Datetime.now(),
-                        'check_in_method': 'face',
-                        **attendance_vals
-                    })
+                        'confidence_score': confidence_percentage,
+                    }
+                try:
+                    action, _attendance_id, repeated = self._toggle_attendance(
+                        best_match, confidence_percentage, face_image if store_images else False,
+                        event_vals=event_vals)
+                except psycopg2.IntegrityError:
+                    # The same scan was replayed concurrently and recorded first
+                    return self._known_face_event_result(event_uuid)
                 
                 log_face_recognition_attempt(
                     best_match.id, confidence_percentage, True, action
@@ -272,6 +636,7 @@ class FaceRecognitionController(http.Controller):
                 return {
                     'success': True,
                     'action': action,
+                    'repeated': repeated,
                     'name': best_match.name,
                     'confidence': confidence_percentage,
                     'employee_id': best_match.id,
@@ -304,6 +669,296 @@ class FaceRecognitionController(http.Controller):
                 'message': _("Face verification failed: %s") % str(e)
             }
 
+    def _verify_face_claim(self, partition, claim, probe, threshold):
+        """Return ``(employee_id, similarity)`` if the claimed employee matches the probe
+
+        The employee must belong to the kiosk's partition and one of their
+        templates reach the threshold; only those templates are scored.
+        Returns None otherwise, and the probe is then matched as usual.
+        """
+        try:
+            employee_id = int(claim.get('employee_id'))
+        except (AttributeError, TypeError, ValueError):
+            return None
+        
+        Employee = request.env['hr.employee'].sudo()
+        templates = None
+        if Employee.search_count([('id', '=', employee_id), ('face_recognition_active', '=', True)] + partition[1]):
+            templates = Employee._read_face_templates([employee_id]).get(employee_id)
+        similarity = 0.0
+        if templates is not None:
+            distance = np.sqrt(np.min(np.sum((templates - probe) ** 2, axis=1)))
+            similarity = float(similarity_from_distance(distance))
+        
+        if similarity * 100 < threshold:
+            self._edge_claims['rejected'] += 1
+            face_logger.info("Kiosk claim for employee %s not confirmed (%.2f%%), matching on the server",
+                             employee_id, similarity * 100)
+            return None
+        self._edge_claims['confirmed'] += 1
+        return employee_id, similarity
+    
+    @contextmanager
+    def _attendance_env(self):
+        """Yield an environment on a new READ COMMITTED transaction, committed on exit
+
+        The request's transaction is REPEATABLE READ with a snapshot taken
+        by its first query, so it would not see an attendance committed by
+        a concurrent scan it waited for, and updating that attendance again
+        would fail with a serialization error.
+        """
+        with request.env.registry.cursor() as cr:
+            # Test cursors share the test's transaction and have no own connection
+            if hasattr(cr, '_cnx'):
+                cr._cnx.set_isolation_level(ISOLATION_LEVEL_READ_COMMITTED)
+            yield api.Environment(cr, request.env.uid, request.env.context)
+
+    def _toggle_attendance(self, employee, confidence_percentage, face_image=False, timestamp=None,
+                           event_vals=None):
+        """Check the employee out if an attendance is open, in otherwise
+
+        ``timestamp`` defaults to now; replayed offline scans pass their
+        capture time. Scans of one employee are serialized by a
+        transaction-level advisory lock and each toggle commits in its own
+        transaction, so the second of two simultaneous scans reads the
+        first one's result instead of failing and being retried. A scan
+        within the rescan interval of the last check-in/out, typically the
+        same person seen by two kiosks, repeats that action.
+
+        ``event_vals`` records the scan's ``hr.attendance.face.event`` in
+        the same transaction. Returns ``(action, attendance_id, repeated)``.
+        """
+        timestamp = timestamp or fields.Datetime.now()
+        rescan_interval = timedelta(seconds=int(request.env['ir.config_parameter'].sudo().get_param(
+            'hr_attendance_face_recognition.rescan_interval', DEFAULT_RESCAN_INTERVAL)))
+        
+        with self._attendance_env() as env:
+            # On its own statement: a READ COMMITTED snapshot is taken when
+            # the statement starts, i.e. before waiting for the lock
+            with span('attendance_lock'):
+                env.cr.execute("SELECT pg_advisory_xact_lock(%s, %s)",
+                               (ATTENDANCE_LOCK_NAMESPACE, employee.id))
+            
+            # The last attendance is the open one, if any
+            with span('attendance_search'):
+                env.cr.execute("""
+                    SELECT id, check_in, check_out FROM hr_attendance
+                    WHERE employee_id = %s
+                    ORDER BY check_in DESC LIMIT 1
+                """, (employee.id,))
+                last = env.cr.fetchone()
+            
+            attendance_id = last and last[0]
+            is_open = bool(last and not last[2])
+            last_scan = last and (last[2] or last[1])
+            repeated = bool(last_scan and abs(timestamp - last_scan) < rescan_interval)
+            
+            if repeated:
+                action = "check_in" if is_open else "check_out"
+            else:
+                attendance_vals = {
+                    'confidence_score': confidence_percentage,
+                    'face_image': face_image,
+                }
+                action = "check_out" if is_open else "check_in"
+                
+                with span('attendance_write'):
+                    if is_open:  # Check out
+                        env['hr.attendance'].browse(attendance_id).write({
+                            'check_out': timestamp,
+                            'check_out_method': 'face',
+                            **attendance_vals
+                        })
+                    else:  # Check in
+                        attendance_id = env['hr.attendance'].create({
+                            'employee_id': employee.id,
+                            'check_in': timestamp,
+                            'check_in_method': 'face',
+                            **attendance_vals
+                        }).id
+            
+            if event_vals is not None:
+                env['hr.attendance.face.event'].sudo().create({
+                    'attendance_id': attendance_id,
+                    'state': action,
+                    'message': _("Repeated scan") if repeated else False,
+                    **event_vals
+                })
+        
+        return action, attendance_id, repeated
+
+    def _record_face_event(self, event_uuid, vals, captured_at=None):
+        """Store the outcome of a UUID-tagged kiosk scan"""
+        return request.env['hr.attendance.face.event'].sudo().create({
+            'uuid': event_uuid,
+            'captured_at': captured_at or fields.Datetime.now(),
+            **vals
+        })
+
+    def _face_event_result(self, event):
+        """Answer a scan that was already processed with its recorded outcome"""
+        result = {
+            'success': event.state in ('check_in', 'check_out'),
+            'uuid': event.uuid,
+            'status': 'duplicate',
+            'action': event.state,
+            'confidence': event.confidence_score,
+        }
+        if event.employee_id:
+            result.update(name=event.employee_id.name, employee_id=event.employee_id.id)
+        return result
+
+    def _known_face_event_result(self, event_uuid):
+        """Answer a scan recorded by a concurrent request after this one started
+
+        The request's own snapshot predates that event, so it is read from
+        a new transaction.
+        """
+        with self._attendance_env() as env:
+            event = env['hr.attendance.face.event'].sudo().search([('uuid', '=', event_uuid)], limit=1)
+            if not event:
+                raise UserError(_("Face event %s could not be recorded") % event_uuid)
+            return self._face_event_result(event)
+
+    @http.route('/face_recognition/verify/bulk', type='json', auth='public')
+    @log_entry_exit
+    def verify_face_bulk(self, events, kiosk=None):
+        """Replay scans a kiosk buffered while the server was unreachable
+
+        ``events`` is a list of ``{'uuid', 'captured_at', 'encoding',
+        'format'}`` with ``captured_at`` in milliseconds since the epoch;
+        ``kiosk`` is the device key of a registered kiosk.
+        Returns one result per event; every result is final, so the kiosk
+        can drop all events it sent.
+        """
+        ensure_db()
+        
+        remote_addr = request.httprequest.remote_addr
+        
+        if not request.session.uid:
+            log_system_error("authentication_error", "Authentication required for bulk face verification", {
+                "remote_addr": remote_addr
+            })
+            return {'success': False, 'message': _("Authentication required")}
+        
+        if not isinstance(events, list) or len(events) > MAX_BULK_EVENTS:
+            return {
+                'success': False,
+                'message': _("Send at most %d events per request") % MAX_BULK_EVENTS
+            }
+        
+        partition = self._get_kiosk_partition(kiosk)
+        if not partition[0]:
+            return {'success': False, 'message': _("This kiosk is not registered")}
+        
+        face_logger.info("Replaying %d offline face events from %s", len(events), remote_addr)
+        
+        with trace_request('verify_face_bulk', remote_addr=remote_addr, events=len(events)):
+            results = self._verify_face_bulk(events, partition)
+        
+        return {'success': True, 'results': results}
+
+    def _verify_face_bulk(self, events, partition):
+        """Match all probes in one pass, then apply them in capture order"""
+        Event = request.env['hr.attendance.face.event'].sudo()
+        results = {}
+        
+        with span('config'):
+            threshold = float(request.env['ir.config_parameter'].sudo().get_param(
+                'hr_attendance_face_recognition.threshold', '70.0'))
+        
+        # Validate, and skip the events that were already applied
+        uuids = []
+        pending = []
+        with span('decode'):
+            event_uuids = [event.get('uuid') for event in events if isinstance(event, dict)]
+            known = {
+                event.uuid: event
+                for event in Event.search([('uuid', 'in', [uuid for uuid in event_uuids if uuid])])
+            }
+            for event in events:
+                event_uuid = event.get('uuid') if isinstance(event, dict) else None
+                if not event_uuid or event_uuid in results:
+                    continue
+                uuids.append(event_uuid)
+                if event_uuid in known:
+                    results[event_uuid] = self._face_event_result(known[event_uuid])
+                    continue
+                try:
+                    captured_at = _parse_capture_time(event.get('captured_at'))
+                    descriptor = decode_face_descriptor(event.get('encoding'), event.get('format'))
+                except Exception as e:
+                    results[event_uuid] = {'success': False, 'uuid': event_uuid, 'status': 'invalid',
+                                           'message': str(e)}
+                    continue
+                pending.append((captured_at, event_uuid, descriptor))
+        
+        if pending:
+            with span('cache'):
+                gallery = self._get_face_matcher(partition)
+            
+            with span('match'):
+                employee_ids, similarities = gallery.best_matches(
+                    np.stack([descriptor for _captured_at, _uuid, descriptor in pending]))
+            
+            # Capture order across the batch is also each employee's order,
+            # so every check-in is applied before its check-out
+            order = sorted(range(len(pending)), key=lambda i: pending[i][0])
+            for i in order:
+                captured_at, event_uuid, _descriptor = pending[i]
+                confidence_percentage = float(similarities[i]) * 100
+                employee_id = int(employee_ids[i]) if employee_ids[i] >= 0 else False
+                results[event_uuid] = self._apply_face_event(
+                    event_uuid, captured_at, employee_id, confidence_percentage, threshold)
+        
+        return [results[event_uuid] for event_uuid in uuids]
+
+    def _apply_face_event(self, event_uuid, captured_at, employee_id, confidence_percentage, threshold):
+        """Toggle attendance for one replayed scan and record its outcome
+
+        A recognized scan is applied and recorded in its own transaction
+        (see ``_toggle_attendance``); a rejected event (e.g. a check-out
+        earlier than the open check-in) rolls back alone and is recorded
+        as rejected, and a concurrent replay of the same UUID answers with
+        the outcome recorded first.
+        """
+        vals = {
+            'uuid': event_uuid,
+            'captured_at': captured_at,
+            'employee_id': employee_id,
+            'confidence_score': confidence_percentage,
+        }
+        result = {
+            'success': False,
+            'uuid': event_uuid,
+            'confidence': confidence_percentage,
+        }
+        if employee_id:
+            employee = request.env['hr.employee'].browse(employee_id)
+            result.update(name=employee.name, employee_id=employee_id)
+        
+        try:
+            if employee_id and confidence_percentage >= threshold:
+                action, _attendance_id, repeated = self._toggle_attendance(
+                    employee, confidence_percentage, timestamp=captured_at, event_vals=vals)
+                log_face_recognition_attempt(employee_id, confidence_percentage, True, action)
+                result.update(success=True, status=action, action=action, repeated=repeated)
+                return result
+            
+            log_face_recognition_attempt(employee_id or None, confidence_percentage, False)
+            vals['state'] = 'no_match'
+            with request.env.cr.savepoint():
+                self._record_face_event(event_uuid, vals, captured_at)
+        except psycopg2.IntegrityError:
+            # Another request recorded this UUID first
+            return self._known_face_event_result(event_uuid)
+        except (ValidationError, UserError) as e:
+            vals.update(state='rejected', message=str(e))
+            self._record_face_event(event_uuid, vals, captured_at)
+        
+        result.update(status=vals['state'], action=vals['state'])
+        return result
+
     @http.route('/face_recognition/cache/status', type='json', auth='user')
     def cache_status(self):
         """Return status of the face encoding cache"""
@@ -314,18 +969,31 @@ class FaceRecognitionController(http.Controller):
             )
             return {'success': False, 'message': _("Insufficient permissions")}
             
-        current_time = time.time()
-        cache_age = current_time - (self._cache_timestamp or 0)
-        is_valid = self._cache_timestamp and (cache_age < self._cache_validity)
-        
         face_logger.info(f"Cache status requested by {request.env.user.name}")
         
+        # The daemon's own gallery, when matching runs there
+        matcher = False
+        client = request.env['hr.employee']._get_face_matching_client()
+        if client:
+            try:
+                matcher = dict(client.status(), backend='sidecar', socket=client.socket_path)
+            except MatchingServiceError as e:
+                matcher = {'backend': 'sidecar', 'socket': client.socket_path, 'error': str(e)}
+        
+        # One entry per kiosk partition, with its size and hit statistics
+        partitions = self._gallery_cache.stats()
+        
         return {
             'success': True,
-            'cache_exists': self._cache_timestamp is not None,
-            'cache_valid': is_valid,
-            'cache_age_seconds': cache_age if self._cache_timestamp else 0,
-            'cache_size': len(self._face_encodings_cache),
+            'matcher': matcher,
+            'cache_exists': bool(partitions),
+            'cache_valid': any(partition['valid'] for partition in partitions),
+            'cache_size': sum(partition['employees'] for partition in partitions),
+            'template_count': sum(partition['templates'] for partition in partitions),
+            'partitions': partitions,
+            'probe_memo': self._probe_memo.stats(),
+            'hot_tier': dict(self._tier_stats.stats(), partitions=self._hot_tier.stats()),
+            'edge_claims': dict(self._edge_claims),
             'validity_period': self._cache_validity
         }
         
@@ -341,23 +1009,129 @@ class FaceRecognitionController(http.Controller):
             
         face_logger.info(f"Cache refresh requested by {request.env.user.name}")
         
-        # Reset cache timestamp to force rebuild
-        self.__class__._cache_timestamp = None
+        # Force a rebuild of every partition, starting with this user's
+        self._gallery_cache.invalidate()
+        self._partition_ids_cache.invalidate()
         
         # Rebuild cache
         start_time = time.time()
-        employee_encodings = self._get_all_face_encodings()
+        gallery = self._get_all_face_encodings(self._get_kiosk_partition())
+        
+        # Reload the matching daemon too, if one is in use
+        client = request.env['hr.employee']._get_face_matching_client()
+        if client:
+            try:
+                SidecarGallery(client, self._load_face_templates_fresh).reload()
+            except MatchingServiceError as e:
+                return {'success': False, 'message': _("Face matcher unavailable: %s") % str(e)}
         refresh_time = time.time() - start_time
         
-        face_logger.info(f"Cache refreshed in {refresh_time:.2f} seconds with {len(employee_encodings)} employees")
+        face_logger.info("Cache refreshed in %.2f seconds with %d employees", refresh_time, len(gallery))
         
         return {
             'success': True,
             'message': _("Face encoding cache refreshed successfully"),
-            'cache_size': len(employee_encodings),
+            'cache_size': len(gallery),
             'refresh_time': refresh_time
         }
 
+    def _profile_directory(self):
+        return os.path.join(config['data_dir'], 'face_recognition_profiles', request.db)
+
+    @http.route('/face_recognition/profile/start', type='json', auth='user')
+    def start_profile(self, requests=None, seconds=None, interval_ms=None):
+        """Sample the next ``requests`` verify/register requests of this worker
+
+        Or those of the next ``seconds``; the capture stops by itself after
+        either, and at the latest after ten minutes. Each worker process
+        profiles only the requests it serves.
+        """
+        if not request.env.user.has_group('hr_attendance.group_hr_attendance_manager'):
+            face_logger.warning(
+                f"Unauthorized profiling attempt by user {request.env.user.name} "
+                f"(ID: {request.env.user.id})"
+            )
+            return {'success': False, 'message': _("Insufficient permissions")}
+        try:
+            requests = int(requests) if requests else None
+            seconds = float(seconds) if seconds else None
+            interval = float(interval_ms) / 1000 if interval_ms else DEFAULT_SAMPLE_INTERVAL
+        except (TypeError, ValueError):
+            return {'success': False, 'message': _("Invalid profiling parameters")}
+        if not requests and not seconds:
+            return {'success': False, 'message': _("Give a number of requests or seconds to profile")}
+        
+        capture = start_capture(self._profile_directory(), requests, seconds, interval)
+        face_logger.info(
+            "Profiling capture %s started by %s (requests: %s, seconds: %s)",
+            capture.id, request.env.user.name, requests, seconds
+        )
+        return {'success': True, 'capture': capture.summary()}
+
+    @http.route('/face_recognition/profile/status', type='json', auth='user')
+    def profile_status(self):
+        """Return the capture running in this worker and those stored"""
+        if not request.env.user.has_group('hr_attendance.group_hr_attendance_manager'):
+            return {'success': False, 'message': _("Insufficient permissions")}
+        capture = current_capture()
+        return {
+            'success': True,
+            'current': capture.summary() if capture else False,
+            'captures': list_captures(self._profile_directory()),
+            'formats': list(PROFILE_FORMATS),
+        }
+
+    @http.route('/face_recognition/profile/download', type='http', auth='user', methods=['GET'])
+    def download_profile(self, capture, format='collapsed', **kw):
+        """Download a finished capture as collapsed stacks, pstats or allocations"""
+        if not request.env.user.has_group('hr_attendance.group_hr_attendance_manager'):
+            return Response(status=403)
+        path = capture_path(self._profile_directory(), capture, format)
+        if not path:
+            return request.not_found()
+        with open(path, 'rb') as f:
+            data = f.read()
+        content_type, suffix = PROFILE_FORMATS[format]
+        return request.make_response(data, headers=[
+            ('Content-Type', content_type),
+            ('Content-Disposition', content_disposition('face_recognition_%s%s' % (capture, suffix))),
+        ])
+
+    @http.route('/face_recognition/import', type='json', auth='user')
+    @log_entry_exit
+    def import_faces(self, data, filename='import.csv', match_by='barcode', mode='replace'):
+        """Bulk import precomputed face templates
+
+        ``data`` is the base64 content of a CSV file or ZIP archive laid out
+        as for the Import Faces wizard; ``match_by`` is the employee field
+        the file identifies employees by. Everything is written in this
+        request's transaction and the galleries are refreshed once.
+        Returns the imported counts and one ``{'row', 'employee',
+        'message'}`` per rejected row in ``errors``.
+        """
+        if not request.env.user.has_group('hr_attendance.group_hr_attendance_manager'):
+            face_logger.warning(
+                f"Unauthorized face import attempt by user {request.env.user.name} "
+                f"(ID: {request.env.user.id})"
+            )
+            return {'success': False, 'message': _("Insufficient permissions")}
+        
+        if mode not in ('replace', 'append'):
+            return {'success': False, 'message': _("Unknown import mode: %s") % mode}
+        
+        face_logger.info(f"Face import of {filename} requested by {request.env.user.name}")
+        
+        try:
+            with trace_request('import_faces', filename=filename):
+                with span('read'):
+                    rows = read_face_import(base64.b64decode(data), filename)
+                with span('write'):
+                    result = request.env['hr.employee']._import_face_templates(rows, match_by, mode)
+        except (ValueError, UserError) as e:
+            return {'success': False, 'message': str(e)}
+        
+        return {'success': True, **result}
+
     @http.route('/face_recognition/logs', type='json', auth='user')
     def get_logs(self, limit=100):
         """Return recent face recognition logs"""
@@ -370,30 +1144,28 @@ class FaceRecognitionController(http.Controller):
             
         face_logger.info(f"Logs requested by {request.env.user.name}")
         
-        # Fetch recent attendance logs with face recognition
-        attendances = request.env['hr.attendance'].search_read(
-            domain=['|', 
-                ('check_in_method', '=', 'face'), 
-                ('check_out_method', '=', 'face')
-            ],
-            fields=[
-                'employee_id', 'check_in', 'check_out', 
-                'check_in_method', 'check_out_method', 'confidence_score'
-            ],
-            limit=limit,
-            order='create_date desc'
-        )
+        # Fetch recent attendance logs with face recognition, on the read
+        # replica when one is configured; the companies filter stands in
+        # for the multi-company record rules the ORM would apply
+        attendances = report_query(request.env, """
+            SELECT a.employee_id, e.name as employee_name, a.check_in, a.check_out,
+                   a.check_in_method, a.check_out_method, a.confidence_score
+            FROM hr_attendance a
+            JOIN hr_employee e ON e.id = a.employee_id
+            WHERE (a.check_in_method = 'face' OR a.check_out_method = 'face')
+            AND e.company_id = ANY(%s)
+            ORDER BY a.create_date DESC
+            LIMIT %s
+        """, (request.env.companies.ids, int(limit)))
         
         # Format logs for display
         logs = []
         for attendance in attendances:
-            employee = request.env['hr.employee'].browse(attendance['employee_id'][0])
-            
             if attendance['check_in_method'] == 'face':
                 logs.append({
                     'timestamp': attendance['check_in'],
-                    'employee_id': employee.id,
-                    'employee_name': employee.name,
+                    'employee_id': attendance['employee_id'],
+                    'employee_name': attendance['employee_name'],
                     'action': 'check_in',
                     'confidence': attendance['confidence_score']
                 })
@@ -401,8 +1173,8 @@ class FaceRecognitionController(http.Controller):
             if attendance['check_out_method'] == 'face' and attendance['check_out']:
                 logs.append({
                     'timestamp': attendance['check_out'],
-                    'employee_id': employee.id,
-                    'employee_name': employee.name,
+                    'employee_id': attendance['employee_id'],
+                    'employee_name': attendance['employee_name'],
                     'action': 'check_out',
                     'confidence': attendance['confidence_score']
                 })
@@ -416,7 +1188,6 @@ class FaceRecognitionController(http.Controller):
         }
 
 
-@log_entry_exit
 def calculate_face_similarity(encoding1, encoding2):
     """
     Calculate similarity between two face encodings
@@ -424,8 +1195,8 @@ def calculate_face_similarity(encoding1, encoding2):
     """
     try:
         # Convert to numpy arrays for vector operations
-        arr1 = np.array(encoding1)
-        arr2 = np.array(encoding2)
+        arr1 = np.asarray(encoding1)
+        arr2 = np.asarray(encoding2)
         
         # Calculate Euclidean distance
         distance = np.linalg.norm(arr1 - arr2)
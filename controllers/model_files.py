@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import threading
+
+from odoo import http, _
+from odoo.http import request, Stream
+from odoo.addons.hr_attendance_face_recognition import face_logger
+
+MODULE_NAME = 'hr_attendance_face_recognition'
+MODULE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODELS_PATH = os.path.join(MODULE_PATH, 'static', 'models')
+LIBRARY_PATH = os.path.join(MODULE_PATH, 'static', 'lib', 'face-api.js')
+
+# face-api.js net name -> weights file prefix in static/models
+FACE_API_NETS = {
+    'tinyFaceDetector': 'tiny_face_detector_model',
+    'faceLandmark68Net': 'face_landmark_68_model',
+    'faceRecognitionNet': 'face_recognition_model',
+}
+
+# (path, mtime, size) -> sha256 hex digest
+_digest_cache = {}
+_digest_lock = threading.Lock()
+
+
+def _file_digest(*paths):
+    """Content hash of one or more files, cached until they change on disk"""
+    key = tuple((path, os.path.getmtime(path), os.path.getsize(path)) for path in paths)
+    with _digest_lock:
+        digest = _digest_cache.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        for path in paths:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(chunk)
+        digest = sha.hexdigest()
+        with _digest_lock:
+            _digest_cache[key] = digest
+    return digest
+
+
+def get_net_files(prefix):
+    """Return the manifest and shard file names of a net, manifest first"""
+    manifest = '%s-weights_manifest.json' % prefix
+    with open(os.path.join(MODELS_PATH, manifest)) as f:
+        groups = json.load(f)
+    shards = [path for group in groups for path in group.get('paths', [])]
+    return [manifest] + shards
+
+
+def get_model_versions():
+    """Return ``{net: {'hash', 'files'}}`` for every installed face-api.js net
+
+    The hash covers the manifest and all of its shards, so any weight change
+    produces a new version and new URLs.
+    """
+    versions = {}
+    for net, prefix in FACE_API_NETS.items():
+        try:
+            files = get_net_files(prefix)
+            versions[net] = {
+                'hash': _file_digest(*[os.path.join(MODELS_PATH, name) for name in files]),
+                'files': files,
+            }
+        except (OSError, ValueError) as e:
+            face_logger.warning("Face model %s unavailable: %s", net, e)
+    return versions
+
+
+class FaceModelFiles(http.Controller):
+
+    @http.route('/face_recognition/models/info', type='json', auth='user')
+    def model_info(self):
+        """Describe the face-api.js library and model weights to load
+
+        Each entry comes with its content hash, which the kiosk uses as its
+        IndexedDB cache key, and a versioned URL served as immutable.
+        """
+        versions = get_model_versions()
+        if len(versions) != len(FACE_API_NETS):
+            return {
+                'success': False,
+                'message': _("Face recognition models are missing on the server")
+            }
+
+        library_hash = _file_digest(LIBRARY_PATH)
+        return {
+            'success': True,
+            'library': {
+                'hash': library_hash,
+                'url': '/face_recognition/lib/%s/face-api.js' % library_hash,
+            },
+            'nets': {
+                net: {
+                    'hash': version['hash'],
+                    'manifest': version['files'][0],
+                    'base_url': '/face_recognition/models/%s/' % version['hash'],
+                }
+                for net, version in versions.items()
+            }
+        }
+
+    @http.route('/face_recognition/models/<string:version>/<string:filename>', type='http', auth='public')
+    def model_file(self, version, filename):
+        """Serve a model file under a content-versioned, immutable URL"""
+        for net_version in get_model_versions().values():
+            if filename in net_version['files']:
+                # Stale versions still resolve, but must not be cached forever
+                immutable = net_version['hash'] == version
+                return self._stream_file('static/models/%s' % filename, immutable)
+        return request.not_found()
+
+    @http.route('/face_recognition/lib/<string:version>/face-api.js', type='http', auth='public')
+    def library_file(self, version):
+        """Serve face-api.js under a content-versioned, immutable URL"""
+        immutable = _file_digest(LIBRARY_PATH) == version
+        return self._stream_file('static/lib/face-api.js', immutable)
+
+    def _stream_file(self, relative_path, immutable):
+        stream = Stream.from_path('%s/%s' % (MODULE_NAME, relative_path))
+        if immutable:
+            return stream.get_response(immutable=True)
+        return stream.get_response(max_age=0)
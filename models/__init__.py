@@ -1,3 +1,9 @@
 from . import hr_employee
 from . import hr_attendance
 from . import hr_employee_face_wizard
+from . import hr_attendance_face_event
+from . import hr_attendance_face_kiosk
+from . import hr_employee_face_import_wizard
+from . import hr_attendance_face_audit
+from . import hr_attendance_face_health
+from . import ir_websocket
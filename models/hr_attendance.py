@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 from odoo import models, fields, api, _
 
+from odoo.addons.hr_attendance_face_recognition.utils.thumbnail_cache import (
+    DEFAULT_THUMBNAIL_SIZE, prune_thumbnails,
+)
+
 class HrAttendanceFace(models.Model):
     _inherit = 'hr.attendance'
     
@@ -31,6 +35,57 @@ class HrAttendanceFace(models.Model):
         copy=False
     )
 
+    face_thumbnail_url = fields.Char(
+        string='Captured Image Thumbnail',
+        compute='_compute_face_thumbnail_url',
+        help="Cached, downscaled copy of the captured image, for list and form views"
+    )
+
+    @api.depends('face_image')
+    def _compute_face_thumbnail_url(self):
+        # The checksum versions the URL, so browsers may cache it for good
+        attachments = self.env['ir.attachment'].sudo().search_read([
+            ('res_model', '=', self._name),
+            ('res_field', '=', 'face_image'),
+            ('res_id', 'in', self.ids),
+        ], ['res_id', 'checksum'])
+        checksums = {attachment['res_id']: attachment['checksum'] for attachment in attachments}
+        for attendance in self:
+            checksum = checksums.get(attendance.id)
+            attendance.face_thumbnail_url = checksum and '/face_recognition/attendance/%d/thumbnail/%s?size=%d' % (
+                attendance.id, checksum, DEFAULT_THUMBNAIL_SIZE)
+
+    @api.autovacuum
+    def _gc_face_thumbnails(self):
+        prune_thumbnails(self.env.cr.dbname)
+
+    @api.model
+    def _get_face_activity(self, since=None, changed_since=None):
+        """Return ``({employee_id: (last_activity, checked_in)}, last_write_date)``
+
+        Reads the attendances still open or with a check-in or check-out at
+        or after ``since`` or, with ``changed_since``, only those written
+        after it. The last activity is the latest check-in or check-out read.
+        """
+        self.flush_model(['employee_id', 'check_in', 'check_out'])
+        if changed_since:
+            where, params = "write_date > %s", [changed_since]
+        else:
+            where, params = "check_out IS NULL OR COALESCE(check_out, check_in) >= %s", [since]
+        self.env.cr.execute("""
+            SELECT employee_id, MAX(COALESCE(check_out, check_in)), BOOL_OR(check_out IS NULL), MAX(write_date)
+              FROM hr_attendance
+             WHERE %s
+          GROUP BY employee_id
+        """ % where, params)
+        activity = {}
+        last_write = None
+        for employee_id, last_seen, checked_in, write_date in self.env.cr.fetchall():
+            activity[employee_id] = (last_seen, checked_in)
+            if write_date and (not last_write or write_date > last_write):
+                last_write = write_date
+        return activity, last_write
+
 
 class FaceRecognitionSettings(models.TransientModel):
     _inherit = 'res.config.settings'
@@ -55,3 +110,46 @@ class FaceRecognitionSettings(models.TransientModel):
         default=True,
         help="Run the face recognition interface in fullscreen kiosk mode"
     )
+    
+    face_recognition_matching_backend = fields.Selection(
+        [('local', 'In each Odoo worker'),
+        ('sidecar', 'Shared matching daemon')],
+        string='Face Matching Backend',
+        config_parameter='hr_attendance_face_recognition.matching_backend',
+        default='local',
+        help="Where probes are matched. The shared daemon (scripts/face_matcher.py) holds "
+             "one gallery for all workers of the host instead of one per worker; run one "
+             "daemon per database"
+    )
+    
+    face_recognition_matching_socket = fields.Char(
+        string='Face Matcher Socket',
+        config_parameter='hr_attendance_face_recognition.matching_socket',
+        help="Unix socket the face matching daemon of this database listens on; by default "
+             "<database>-face_matcher.sock in the run directory of the Odoo data directory. "
+             "Never share a socket between databases"
+    )
+    
+    face_recognition_rescan_interval = fields.Integer(
+        string='Repeated Scan Interval',
+        config_parameter='hr_attendance_face_recognition.rescan_interval',
+        default=60,
+        help="Seconds after a check-in or check-out during which another scan of the same "
+             "employee, e.g. by a second kiosk, repeats it instead of toggling attendance"
+    )
+    
+    face_recognition_hot_tier_hours = fields.Integer(
+        string='Recently Active Window',
+        config_parameter='hr_attendance_face_recognition.hot_tier_hours',
+        default=48,
+        help="Employees checked in, or with an attendance within this many hours, are matched "
+             "first. 0 matches every probe against the whole gallery"
+    )
+    
+    face_recognition_hot_tier_margin = fields.Float(
+        string='Recently Active Match Margin',
+        config_parameter='hr_attendance_face_recognition.hot_tier_margin',
+        default=10.0,
+        help="Confidence points (0-100) by which the best recently active employee must lead "
+             "the next one to be accepted without searching the other employees"
+    )
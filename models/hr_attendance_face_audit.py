@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api, _
+import logging
+import time
+
+from odoo.addons.hr_attendance_face_recognition.utils.face_matching import FaceGallery
+from odoo.addons.hr_attendance_face_recognition.utils.identity_audit import find_identity_collisions
+
+_logger = logging.getLogger(__name__)
+
+# Audit reports kept; older ones are deleted when a new one is stored
+AUDIT_HISTORY = 10
+
+
+class HrAttendanceFaceAudit(models.Model):
+    """Employees whose face templates are close enough to be mistaken
+
+    Every template is compared with every template of the other employees;
+    pairs whose closest templates fall within the match threshold are
+    duplicate enrollments, or people a kiosk may check in as each other.
+    """
+    _name = 'hr.attendance.face.audit'
+    _description = 'Face Identity Audit'
+    _order = 'create_date desc, id desc'
+
+    threshold = fields.Float(
+        string='Match Threshold',
+        readonly=True,
+        help="Confidence threshold (0-100) in force when the audit ran"
+    )
+
+    employee_count = fields.Integer(string='Employees', readonly=True)
+    template_count = fields.Integer(string='Templates', readonly=True)
+    pair_count = fields.Integer(string='Colliding Pairs', readonly=True)
+    duration = fields.Float(string='Duration (s)', readonly=True)
+
+    line_ids = fields.One2many(
+        'hr.attendance.face.audit.line',
+        'audit_id',
+        string='Colliding Pairs',
+        readonly=True
+    )
+
+    def name_get(self):
+        return [(audit.id, _("Identity audit of %s") % fields.Datetime.to_string(audit.create_date))
+                for audit in self]
+
+    @api.model
+    def _run_identity_audit(self):
+        """Audit the whole gallery and store the report"""
+        start_time = time.time()
+        threshold = float(self.env['ir.config_parameter'].sudo().get_param(
+            'hr_attendance_face_recognition.threshold', '70.0'))
+
+        Employee = self.env['hr.employee'].sudo()
+        employees = Employee.search([
+            ('face_encoding', '!=', False),
+            ('face_recognition_active', '=', True)
+        ])
+        templates = Employee._read_face_templates(employees.ids)
+        gallery = FaceGallery.from_templates(sorted(templates.items()))
+
+        # Similarity is 1 - distance, see similarity_from_distance
+        pairs = find_identity_collisions(gallery, 1.0 - threshold / 100.0)
+
+        audit = self.sudo().create({
+            'threshold': threshold,
+            'employee_count': len(gallery),
+            'template_count': gallery.template_count,
+            'pair_count': len(pairs),
+            'duration': time.time() - start_time,
+            'line_ids': [(0, 0, {
+                'employee_a_id': pair['employee_a'],
+                'employee_b_id': pair['employee_b'],
+                'similarity': max(0.0, 1.0 - pair['distance']) * 100,
+                'template_a': pair['template_a'] + 1,
+                'template_b': pair['template_b'] + 1,
+                'template_pairs': pair['template_pairs'],
+            }) for pair in pairs],
+        })
+        self.sudo().search([], offset=AUDIT_HISTORY).unlink()
+
+        _logger.info("Face identity audit of %d templates from %d employees found %d colliding pairs in %.1f s",
+                     gallery.template_count, len(gallery), len(pairs), audit.duration)
+        return audit
+
+    @api.model
+    def _cron_run_identity_audit(self):
+        self._run_identity_audit()
+
+    @api.model
+    def action_run_identity_audit(self):
+        """Run an audit now and open its report"""
+        audit = self._run_identity_audit()
+        return {
+            'name': _('Identity Audit'),
+            'type': 'ir.actions.act_window',
+            'view_mode': 'form',
+            'res_model': self._name,
+            'res_id': audit.id,
+        }
+
+
+class HrAttendanceFaceAuditLine(models.Model):
+    _name = 'hr.attendance.face.audit.line'
+    _description = 'Face Identity Audit Pair'
+    _order = 'similarity desc, id'
+
+    audit_id = fields.Many2one(
+        'hr.attendance.face.audit',
+        string='Audit',
+        required=True,
+        ondelete='cascade',
+        index=True
+    )
+
+    employee_a_id = fields.Many2one(
+        'hr.employee',
+        string='Employee',
+        required=True,
+        ondelete='cascade'
+    )
+
+    employee_b_id = fields.Many2one(
+        'hr.employee',
+        string='Mistakable For',
+        required=True,
+        ondelete='cascade'
+    )
+
+    similarity = fields.Float(
+        string='Similarity',
+        help="Confidence (0-100) a kiosk would give one employee's closest template for the other's"
+    )
+
+    template_a = fields.Integer(string='Template #', help="Position of the closest template in the employee's face data")
+    template_b = fields.Integer(string='Other Template #')
+    template_pairs = fields.Integer(
+        string='Close Template Pairs',
+        help="Pairs of templates of the two employees within the match threshold"
+    )
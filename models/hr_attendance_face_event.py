@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields
+
+
+class HrAttendanceFaceEvent(models.Model):
+    """A face scan identified by the kiosk-generated UUID
+
+    Kiosks tag each scan with a UUID and replay scans captured while the
+    server was unreachable. Recording the outcome per UUID makes replays
+    idempotent: a scan that was already applied is never applied twice.
+    """
+    _name = 'hr.attendance.face.event'
+    _description = 'Face Recognition Event'
+    _order = 'captured_at desc, id desc'
+
+    uuid = fields.Char(
+        string='Event UUID',
+        required=True,
+        index=True,
+        readonly=True
+    )
+
+    captured_at = fields.Datetime(
+        string='Captured At',
+        required=True,
+        readonly=True,
+        help="Time the kiosk captured the face, used as check-in/out time"
+    )
+
+    employee_id = fields.Many2one(
+        'hr.employee',
+        string='Employee',
+        ondelete='set null',
+        index=True,
+        readonly=True
+    )
+
+    attendance_id = fields.Many2one(
+        'hr.attendance',
+        string='Attendance',
+        ondelete='set null',
+        readonly=True
+    )
+
+    state = fields.Selection(
+        [('check_in', 'Check In'),
+        ('check_out', 'Check Out'),
+        ('no_match', 'No Match'),
+        ('rejected', 'Rejected')],
+        string='Outcome',
+        required=True,
+        readonly=True
+    )
+
+    confidence_score = fields.Float(
+        string='Recognition Confidence',
+        readonly=True
+    )
+
+    message = fields.Char(
+        string='Message',
+        readonly=True
+    )
+
+    _sql_constraints = [
+        ('uuid_unique', 'unique(uuid)', 'Face events must have a unique UUID.'),
+    ]
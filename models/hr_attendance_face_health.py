@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import time
+import platform
+import psutil
+from datetime import timedelta
+from odoo import models, fields, api
+from odoo.tools import config
+
+from odoo.addons.hr_attendance_face_recognition.utils.snapshot_delta import diff_snapshot
+from odoo.addons.hr_attendance_face_recognition.utils.read_replica import read_replica, report_query
+
+# Bus channel the health dashboards listen on
+HEALTH_CHANNEL = 'hr_attendance_face_recognition.health'
+HEALTH_NOTIFICATION = 'face_recognition_health'
+
+# A dashboard keeps the producer running this long after it last subscribed
+HEALTH_WATCH_SECONDS = 10 * 60
+
+
+class HrAttendanceFaceHealth(models.Model):
+    """Latest health snapshot, published to the dashboards over the bus
+
+    A single cron job computes the checks and sends them to every open
+    dashboard: the full snapshot once, then only what changed. The cost
+    no longer depends on how many dashboards are open, and the job skips
+    its run when none was opened lately.
+    """
+    _name = 'hr.attendance.face.health'
+    _description = 'Face Recognition Health Snapshot'
+
+    sequence = fields.Integer(string='Sequence', readonly=True)
+    snapshot = fields.Text(string='Snapshot', readonly=True, help="Latest health checks, as JSON")
+    watched_until = fields.Datetime(string='Watched Until', readonly=True)
+
+    @api.model
+    def _get_state(self):
+        # Created with the module, so concurrent first callers never each create one
+        return self.env.ref('hr_attendance_face_recognition.face_health_state').sudo()
+
+    @api.model
+    def _collect_health(self):
+        """Run the health checks that do not depend on the serving worker"""
+        start_time = time.time()
+        status = {
+            'status': 'ok',
+            'timestamp': fields.Datetime.now(),
+            'checks': {
+                'models_check': self._check_face_models(),
+                'database_check': self._check_database(),
+                'system_check': self._check_system_resources(),
+                'usage_statistics': self._get_usage_statistics(),
+                'recognition_performance': self._check_recognition_performance(),
+            }
+        }
+        status['status'] = self._overall_status(status['checks'])
+        status['response_time'] = time.time() - start_time
+        # Plain JSON types, so snapshots compare as they are sent
+        return json.loads(json.dumps(status, default=str))
+
+    @api.model
+    def _overall_status(self, checks):
+        """Worst status of the individual checks"""
+        if any(check.get('status') == 'error' for check in checks.values()):
+            return 'error'
+        if any(check.get('status') == 'warning' for check in checks.values()):
+            return 'warning'
+        return 'ok'
+
+    @api.model
+    def _subscribe(self):
+        """Return the latest snapshot and keep the producer running for a while
+
+        Triggers the producer at once when the snapshot is missing or was
+        not refreshed while nobody was watching.
+        """
+        state = self._get_state()
+        now = fields.Datetime.now()
+        if not state.watched_until or state.watched_until < now:
+            self.env.ref('hr_attendance_face_recognition.ir_cron_publish_face_health').sudo()._trigger()
+        state.write({'watched_until': now + timedelta(seconds=HEALTH_WATCH_SECONDS)})
+        return {
+            'sequence': state.sequence,
+            'snapshot': json.loads(state.snapshot) if state.snapshot else None,
+        }
+
+    @api.model
+    def _cron_publish_health(self):
+        """Compute the health checks once and push them to the open dashboards"""
+        state = self._get_state()
+        if not state.watched_until or state.watched_until < fields.Datetime.now():
+            return
+
+        snapshot = self._collect_health()
+        previous = json.loads(state.snapshot) if state.snapshot else None
+        message = {'sequence': state.sequence + 1, 'base': state.sequence}
+        if previous is None:
+            message['snapshot'] = snapshot
+        else:
+            message['changes'], message['removed'] = diff_snapshot(previous, snapshot)
+
+        state.write({'sequence': message['sequence'], 'snapshot': json.dumps(snapshot)})
+        self.env['bus.bus']._sendone(HEALTH_CHANNEL, HEALTH_NOTIFICATION, message)
+
+    def _check_face_models(self):
+        """Verify face recognition models exist and are accessible"""
+        result = {
+            'status': 'ok',
+            'message': 'Face recognition models are properly installed'
+        }
+        
+        try:
+            # Get module path
+            module_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            models_path = os.path.join(module_path, 'static', 'models')
+            
+            # Required model files
+            required_models = [
+                'face_landmark_68_model-weights_manifest.json',
+                'face_recognition_model-weights_manifest.json',
+                'tiny_face_detector_model-weights_manifest.json'
+            ]
+            
+            # Check if models directory exists
+            if not os.path.exists(models_path):
+                result['status'] = 'error'
+                result['message'] = f"Models directory not found at {models_path}"
+                return result
+                
+            # Check for required model files
+            missing_models = []
+            for model in required_models:
+                if not os.path.exists(os.path.join(models_path, model)):
+                    missing_models.append(model)
+            
+            if missing_models:
+                result['status'] = 'error'
+                result['message'] = f"Missing required model files: {', '.join(missing_models)}"
+                result['models_path'] = models_path
+                result['missing_models'] = missing_models
+            else:
+                # Count total model files for info
+                model_files = os.listdir(models_path)
+                result['model_count'] = len(model_files)
+                result['models_path'] = models_path
+                
+        except Exception as e:
+            result['status'] = 'error'
+            result['message'] = f"Error checking face models: {str(e)}"
+            
+        return result
+        
+    def _check_database(self):
+        """Check database connectivity and face recognition data"""
+        result = {
+            'status': 'ok',
+            'message': 'Database checks passed'
+        }
+        
+        try:
+            # Check if we can query employees
+            employee_count = self.env['hr.employee'].sudo().search_count([])
+            result['employee_count'] = employee_count
+            
+            # Check how many employees have face recognition data
+            face_count = self.env['hr.employee'].sudo().search_count([
+                ('face_encoding', '!=', False),
+                ('face_recognition_active', '=', True)
+            ])
+            result['face_registered_count'] = face_count
+            
+            # Warning if no employees have face data
+            if employee_count > 0 and face_count == 0:
+                result['status'] = 'warning'
+                result['message'] = 'No employees have registered face data'
+                
+            # Check for recent attendances using face recognition
+            one_week_ago = fields.Datetime.now() - timedelta(days=7)
+            face_attendance_count = report_query(self.env, """
+                SELECT COUNT(*) as count
+                FROM hr_attendance
+                WHERE (check_in_method = 'face' OR check_out_method = 'face')
+                AND create_date >= %s
+            """, (one_week_ago,))[0]['count']
+            result['recent_face_attendance_count'] = face_attendance_count
+            
+            # Where the attendance reports ran
+            result['read_replica'] = read_replica.status()
+            if result['status'] == 'ok' and read_replica.serves(self.env.cr.dbname) \
+                    and not result['read_replica']['available']:
+                result['status'] = 'warning'
+                result['message'] = 'Read replica unavailable, reports run on the primary database'
+            
+        except Exception as e:
+            result['status'] = 'error'
+            result['message'] = f"Database check failed: {str(e)}"
+            
+        return result
+        
+    def _check_system_resources(self):
+        """Check system resources (memory, disk space, etc.)"""
+        result = {
+            'status': 'ok',
+            'message': 'System resources are adequate',
+            'system_info': {
+                'platform': platform.platform(),
+                'python_version': sys.version,
+                'odoo_version': config.get('version', 'Unknown')
+            }
+        }
+        
+        try:
+            # Check memory usage
+            memory = psutil.virtual_memory()
+            result['memory'] = {
+                'total': memory.total,
+                'available': memory.available,
+                'percent_used': memory.percent,
+                'used': memory.used,
+                'free': memory.free
+            }
+            
+            # Warning if memory usage is high
+            if memory.percent > 90:
+                result['status'] = 'warning'
+                result['message'] = f"High memory usage: {memory.percent}%"
+                
+            # Check disk space
+            disk = psutil.disk_usage('/')
+            result['disk'] = {
+                'total': disk.total,
+                'used': disk.used,
+                'free': disk.free,
+                'percent_used': disk.percent
+            }
+            
+            # Warning if disk usage is high
+            if disk.percent > 90:
+                result['status'] = 'warning'
+                result['message'] = f"Low disk space: {disk.percent}% used"
+                
+            # Check CPU usage
+            cpu_percent = psutil.cpu_percent(interval=0.5)
+            result['cpu'] = {
+                'percent_used': cpu_percent,
+                'cores': psutil.cpu_count()
+            }
+            
+            # Warning if CPU usage is high
+            if cpu_percent > 90:
+                result['status'] = 'warning'
+                result['message'] = f"High CPU usage: {cpu_percent}%"
+                
+        except Exception as e:
+            # Non-critical error, just log it
+            result['status'] = 'warning'
+            result['message'] = f"Could not check system resources: {str(e)}"
+            
+        return result
+        
+    def _get_usage_statistics(self):
+        """Get usage statistics for face recognition"""
+        result = {
+            'status': 'ok',
+            'message': 'Usage statistics retrieved successfully'
+        }
+        
+        try:
+            # Last 30 days
+            thirty_days_ago = fields.Datetime.now() - timedelta(days=30)
+            
+            # Total attendances using face recognition, and those of the last 30 days
+            counts = report_query(self.env, """
+                SELECT COUNT(*) as total, COUNT(*) FILTER (WHERE create_date >= %s) as recent
+                FROM hr_attendance
+                WHERE (check_in_method = 'face' OR check_out_method = 'face')
+            """, (thirty_days_ago,))[0]
+            result['total_face_attendances'] = counts['total']
+            result['recent_face_attendances'] = counts['recent']
+            
+            # Get usage by day for the last 7 days
+            seven_days_ago = fields.Datetime.now() - timedelta(days=7)
+            
+            # This query gets the count of attendances per day
+            daily_counts = report_query(self.env, """
+                SELECT DATE(create_date) as date, COUNT(*) as count
+                FROM hr_attendance
+                WHERE (check_in_method = 'face' OR check_out_method = 'face')
+                AND create_date >= %s
+                GROUP BY DATE(create_date)
+                ORDER BY date
+            """, (seven_days_ago,))
+            result['daily_usage'] = daily_counts
+            
+            # Most active employees
+            top_employees_data = report_query(self.env, """
+                SELECT employee_id, COUNT(*) as count
+                FROM hr_attendance
+                WHERE (check_in_method = 'face' OR check_out_method = 'face')
+                AND create_date >= %s
+                GROUP BY employee_id
+                ORDER BY count DESC
+                LIMIT 5
+            """, (thirty_days_ago,))
+            
+            # Get employee names
+            top_employees = []
+            for item in top_employees_data:
+                employee = self.env['hr.employee'].sudo().browse(item['employee_id'])
+                top_employees.append({
+                    'employee_id': item['employee_id'],
+                    'name': employee.name if employee.exists() else 'Unknown',
+                    'count': item['count']
+                })
+            
+            result['top_employees'] = top_employees
+            
+        except Exception as e:
+            result['status'] = 'warning'
+            result['message'] = f"Error retrieving usage statistics: {str(e)}"
+            
+        return result
+        
+    def _check_recognition_performance(self):
+        """Check face recognition performance metrics"""
+        result = {
+            'status': 'ok',
+            'message': 'Recognition performance is acceptable'
+        }
+        
+        try:
+            # Get average confidence score for recent recognitions
+            thirty_days_ago = fields.Datetime.now() - timedelta(days=30)
+            
+            avg_result = report_query(self.env, """
+                SELECT AVG(confidence_score) as avg_confidence
+                FROM hr_attendance
+                WHERE (check_in_method = 'face' OR check_out_method = 'face')
+                AND confidence_score > 0
+                AND create_date >= %s
+            """, (thirty_days_ago,))[0]
+            
+            avg_confidence = avg_result.get('avg_confidence', 0) if avg_result else 0
+            
+            result['avg_confidence'] = avg_confidence
+            
+            # Warning if average confidence is low
+            if avg_confidence and avg_confidence < 80:
+                result['status'] = 'warning'
+                result['message'] = f"Low average recognition confidence: {avg_confidence:.2f}%"
+                
+            # Get confidence score distribution; the labels' % are doubled
+            # as the query has parameters
+            confidence_distribution = report_query(self.env, """
+                SELECT
+                    CASE
+                        WHEN confidence_score >= 90 THEN '90-100%%'
+                        WHEN confidence_score >= 80 THEN '80-90%%'
+                        WHEN confidence_score >= 70 THEN '70-80%%'
+                        ELSE 'Below 70%%'
+                    END as range,
+                    COUNT(*) as count
+                FROM hr_attendance
+                WHERE (check_in_method = 'face' OR check_out_method = 'face')
+                AND confidence_score > 0
+                AND create_date >= %s
+                GROUP BY range
+                ORDER BY range
+            """, (thirty_days_ago,))
+            result['confidence_distribution'] = confidence_distribution
+            
+            # Calculate total entries for percentage
+            total_entries = sum(item['count'] for item in confidence_distribution)
+            if total_entries > 0:
+                for item in result['confidence_distribution']:
+                    item['percentage'] = (item['count'] / total_entries) * 100
+                    
+            # Warning if more than 10% of recognitions are below 70% confidence
+            below_70_item = next((item for item in confidence_distribution if item['range'] == 'Below 70%'), None)
+            if below_70_item and total_entries > 0:
+                below_70_percent = (below_70_item['count'] / total_entries) * 100
+                if below_70_percent > 10:
+                    result['status'] = 'warning'
+                    result['message'] = f"{below_70_percent:.2f}% of recognitions have confidence below 70%"
+            
+        except Exception as e:
+            result['status'] = 'warning'
+            result['message'] = f"Error checking recognition performance: {str(e)}"
+            
+        return result
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import uuid
+
+from odoo import models, fields, api, tools
+
+from odoo.addons.hr_attendance_face_recognition.utils.gallery_bundle import generate_signing_key
+
+# Private key the gallery bundles are signed with, created on install
+BUNDLE_SIGNING_KEY_PARAM = 'hr_attendance_face_recognition.bundle_signing_key'
+
+
+class HrAttendanceFaceKiosk(models.Model):
+    """A registered kiosk device and the employees it may recognize
+
+    Kiosks with the same company, department and work location share one
+    gallery partition, so a verify only scans the employees the kiosk
+    serves and never matches an employee of another company.
+    """
+    _name = 'hr.attendance.face.kiosk'
+    _description = 'Face Recognition Kiosk'
+    _order = 'name'
+
+    name = fields.Char(
+        string='Kiosk Name',
+        required=True
+    )
+
+    active = fields.Boolean(
+        default=True
+    )
+
+    device_key = fields.Char(
+        string='Device Key',
+        required=True,
+        readonly=True,
+        copy=False,
+        default=lambda self: uuid.uuid4().hex,
+        groups='hr_attendance.group_hr_attendance_manager',
+        help="Identifies the kiosk device; open the kiosk URL once on the device to register it"
+    )
+
+    kiosk_url = fields.Char(
+        string='Kiosk URL',
+        compute='_compute_kiosk_url',
+        groups='hr_attendance.group_hr_attendance_manager'
+    )
+
+    company_id = fields.Many2one(
+        'res.company',
+        string='Company',
+        required=True,
+        default=lambda self: self.env.company
+    )
+
+    department_id = fields.Many2one(
+        'hr.department',
+        string='Department',
+        domain="['|', ('company_id', '=', False), ('company_id', '=', company_id)]",
+        help="Only recognize employees of this department and its sub-departments"
+    )
+
+    work_location_id = fields.Many2one(
+        'hr.work.location',
+        string='Work Location',
+        domain="['|', ('company_id', '=', False), ('company_id', '=', company_id)]",
+        help="Only recognize employees working at this location"
+    )
+
+    edge_matching = fields.Boolean(
+        string='Match on Device',
+        help="The kiosk keeps a signed copy of its employees' face templates and matches scans "
+             "itself; the server only confirms the employee it found. For sites with a slow or "
+             "unreliable connection"
+    )
+
+    _sql_constraints = [
+        ('device_key_unique', 'unique(device_key)', 'Kiosk device keys must be unique.'),
+    ]
+
+    @api.depends('device_key')
+    def _compute_kiosk_url(self):
+        base_url = self.env['ir.config_parameter'].sudo().get_param('web.base.url')
+        for kiosk in self:
+            kiosk.kiosk_url = '%s/face_recognition/kiosk?device=%s' % (base_url, kiosk.device_key)
+
+    def _get_employee_domain(self):
+        """Domain of the employees this kiosk may recognize"""
+        self.ensure_one()
+        domain = [('company_id', '=', self.company_id.id)]
+        if self.department_id:
+            domain.append(('department_id', 'child_of', self.department_id.id))
+        if self.work_location_id:
+            domain.append(('work_location_id', '=', self.work_location_id.id))
+        return domain
+
+    @api.model
+    @tools.ormcache('device_key')
+    def _get_partition(self, device_key):
+        """Return ``(partition_key, employee_domain)`` of a kiosk device
+
+        ``(None, None)`` when the key belongs to no active kiosk. Cached,
+        as it is looked up on every verify.
+        """
+        kiosk = self.sudo().search([('device_key', '=', device_key)], limit=1)
+        if not kiosk:
+            return None, None
+        key = ('company', kiosk.company_id.id, kiosk.department_id.id or 0, kiosk.work_location_id.id or 0)
+        return key, kiosk._get_employee_domain()
+
+    def init(self):
+        super().init()
+        self._get_bundle_signing_key()
+
+    @api.model
+    def _get_bundle_signing_key(self):
+        """Return the PEM private key gallery bundles are signed with
+
+        Created on install; should the parameter be gone, the first of
+        concurrent requests stores a new one and the others read it (or
+        are retried on the serialization failure), so kiosks never pin a
+        key the server does not use.
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        key = params.get_param(BUNDLE_SIGNING_KEY_PARAM)
+        if not key:
+            self.env.cr.execute("""
+                INSERT INTO ir_config_parameter (key, value, create_uid, create_date, write_uid, write_date)
+                VALUES (%s, %s, %s, now() at time zone 'UTC', %s, now() at time zone 'UTC')
+                ON CONFLICT (key) DO NOTHING
+            """, (BUNDLE_SIGNING_KEY_PARAM, generate_signing_key(), self.env.uid, self.env.uid))
+            params.clear_caches()
+            key = params.get_param(BUNDLE_SIGNING_KEY_PARAM)
+        return key
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        kiosks = super().create(vals_list)
+        self.clear_caches()
+        return kiosks
+
+    def write(self, vals):
+        result = super().write(vals)
+        self.clear_caches()
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        self.clear_caches()
+        return result
+
+    def action_regenerate_device_key(self):
+        """Unregister the current device; the kiosk must be opened again with the new URL"""
+        for kiosk in self:
+            kiosk.device_key = uuid.uuid4().hex
+        return True
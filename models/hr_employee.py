@@ -1,11 +1,46 @@
 # -*- coding: utf-8 -*-
 from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools import config
 import base64
 import logging
 import json
 
+import numpy as np
+
+from odoo.addons.hr_attendance_face_recognition.utils.face_matching import as_template_block
+from odoo.addons.hr_attendance_face_recognition.utils.face_import import validate_templates
+from odoo.addons.hr_attendance_face_recognition.utils.gallery_bundle import build_bundle
+from odoo.addons.hr_attendance_face_recognition.utils.matching_service import (
+    get_matching_client, default_socket_path, LEGACY_SOCKET_PATH
+)
+
 _logger = logging.getLogger(__name__)
 
+# Fields whose change alters an employee's place in the face gallery
+FACE_GALLERY_FIELDS = {'face_encoding', 'face_recognition_active', 'active'}
+
+# Bumped by bulk changes; every worker rebuilds its galleries when it moves
+FACE_GALLERY_GENERATION_PARAM = 'hr_attendance_face_recognition.gallery_generation'
+
+# Fields whose change moves an employee between kiosk partitions
+FACE_PARTITION_FIELDS = {'company_id', 'department_id', 'work_location_id'}
+
+# Numbers the face data revisions; the highest is a gallery bundle's generation
+FACE_REVISION_SEQUENCE = 'hr_employee_face_revision_seq'
+# Advisory lock taken while a revision is assigned and committed
+FACE_REVISION_LOCK = 0x46616365
+
+# Employees whose face data is written per batch of a bulk import
+FACE_IMPORT_BATCH_SIZE = 1000
+
+# Employee fields a bulk import can identify employees by
+FACE_IMPORT_MATCH_FIELDS = [
+    ('barcode', 'Badge ID'),
+    ('identification_id', 'Identification No'),
+    ('id', 'Database ID'),
+]
+
 class HrEmployeeFace(models.Model):
     _inherit = 'hr.employee'
     
@@ -28,6 +63,19 @@ class HrEmployeeFace(models.Model):
         help="Whether this employee can use face recognition for attendance"
     )
     
+    face_revision = fields.Integer(
+        string='Face Data Revision',
+        readonly=True,
+        copy=False,
+        index=True,
+        help="Set when the employee's face data or kiosk partition changes, for the gallery "
+             "bundles of the kiosks that match on the device"
+    )
+    
+    def init(self):
+        super().init()
+        self.env.cr.execute("CREATE SEQUENCE IF NOT EXISTS %s" % FACE_REVISION_SEQUENCE)
+    
     @api.depends('face_encoding')
     def _compute_face_template_count(self):
         for employee in self:
@@ -42,6 +90,263 @@ class HrEmployeeFace(models.Model):
             else:
                 employee.face_template_count = 0
     
+    @api.model
+    def _get_face_matching_client(self):
+        """Return the matching daemon client, or None for in-process matching"""
+        params = self.env['ir.config_parameter'].sudo()
+        if params.get_param('hr_attendance_face_recognition.matching_backend', 'local') != 'sidecar':
+            return None
+        socket_path = params.get_param('hr_attendance_face_recognition.matching_socket')
+        if not socket_path or socket_path == LEGACY_SOCKET_PATH:
+            socket_path = default_socket_path(config['data_dir'], self.env.cr.dbname)
+        return get_matching_client(socket_path)
+    
+    def _push_face_gallery_changes(self, removed=False):
+        """Send these employees' templates to the matching daemon on commit"""
+        if not self or not self._get_face_matching_client():
+            return
+        
+        upserts = []
+        removed_ids = list(self.ids) if removed else []
+        if not removed:
+            for employee in self.sudo().with_context(active_test=False):
+                if employee.active and employee.face_recognition_active and employee.face_encoding:
+                    try:
+                        templates = json.loads(base64.b64decode(employee.face_encoding).decode('utf-8'))
+                        upserts.append((employee.id, as_template_block(templates)))
+                        continue
+                    except Exception as e:
+                        _logger.error("Error reading face templates of employee %s: %s", employee.id, e)
+                removed_ids.append(employee.id)
+        self._schedule_face_gallery_push(upserts, removed_ids)
+    
+    @api.model
+    def _schedule_face_gallery_push(self, upserts, removed_ids=()):
+        """Send ``(employee_id, templates)`` pairs and removals to the matching daemon on commit"""
+        client = self._get_face_matching_client()
+        if not client:
+            return
+        
+        def push():
+            try:
+                for employee_id, templates in upserts:
+                    client.upsert(employee_id, templates)
+                client.remove(removed_ids)
+            except Exception as e:
+                # The daemon reloads from the database when it restarts
+                _logger.warning("Could not update the face matcher: %s", e)
+        
+        self.env.cr.postcommit.add(push)
+    
+    @api.model
+    def _get_face_gallery_generation(self):
+        return self.env['ir.config_parameter'].sudo().get_param(FACE_GALLERY_GENERATION_PARAM, '0')
+    
+    @api.model
+    def _bump_face_gallery_generation(self):
+        """Make every worker rebuild its face galleries on its next scan"""
+        generation = int(self._get_face_gallery_generation() or 0) + 1
+        self.env['ir.config_parameter'].sudo().set_param(FACE_GALLERY_GENERATION_PARAM, str(generation))
+    
+    def _bump_face_revision(self):
+        """Give these employees a new face data revision once the transaction commits
+
+        Revisions are taken and committed one small transaction at a time,
+        under an advisory lock, so every revision up to the highest one a
+        reader sees is committed. Taken within the caller's transaction, a
+        revision could commit after a higher one had been served as a
+        bundle's generation, and deltas would skip it.
+        """
+        if not self.ids:
+            return
+        employee_ids = tuple(self.ids)
+        registry = self.pool
+        
+        def bump():
+            try:
+                with registry.cursor() as cr:
+                    cr.execute("SELECT pg_advisory_xact_lock(%s)", (FACE_REVISION_LOCK,))
+                    cr.execute(
+                        "UPDATE hr_employee SET face_revision = nextval(%s) WHERE id IN %s",
+                        (FACE_REVISION_SEQUENCE, employee_ids))
+            except Exception as e:
+                # Kiosks still get the change with their daily full bundle
+                _logger.warning("Could not bump the face revision of employees %s: %s", employee_ids, e)
+        
+        self.env.cr.postcommit.add(bump)
+    
+    @api.model
+    def _get_face_bundle(self, domain, partition, base_generation=0):
+        """Return the gallery bundle of the employees of ``domain``
+
+        A delta on top of ``base_generation`` when the kiosk has one and
+        less than half the partition changed since, a full bundle
+        otherwise. The generation is the highest revision of any employee,
+        so that one leaving the partition moves it as well; revisions being
+        committed in order, none at or below it can still appear.
+        """
+        self.env.cr.execute("SELECT COALESCE(MAX(face_revision), 0) FROM hr_employee")
+        generation = self.env.cr.fetchone()[0]
+        employees = self.sudo().search(domain + [
+            ('face_encoding', '!=', False),
+            ('face_recognition_active', '=', True)
+        ])
+        
+        changed = employees
+        if 0 < base_generation <= generation:
+            changed = employees.filtered(lambda employee: employee.face_revision > base_generation)
+            if len(changed) * 2 > len(employees):
+                changed = employees
+        delta = changed is not employees
+        
+        templates = self._read_face_templates(changed.ids)
+        return build_bundle(
+            partition, generation, sorted(templates.items()),
+            employee_ids=employees.ids if delta else None,
+            base_generation=base_generation if delta else None
+        )
+    
+    @api.model
+    def _find_face_import_employees(self, identifiers, match_by):
+        """Map import identifiers to employee ids
+
+        Returns ``(employee_by_identifier, ambiguous)``, the latter being
+        the identifiers shared by several employees.
+        """
+        if match_by not in dict(FACE_IMPORT_MATCH_FIELDS):
+            raise UserError(_("Employees cannot be matched by %s") % match_by)
+        values = list(identifiers)
+        if match_by == 'id':
+            values = [int(value) for value in values if value.isdigit()]
+        employee_by_identifier = {}
+        ambiguous = set()
+        for employee in self.search_read([(match_by, 'in', values)], [match_by]):
+            identifier = str(employee[match_by])
+            if identifier in employee_by_identifier:
+                ambiguous.add(identifier)
+            employee_by_identifier[identifier] = employee['id']
+        for identifier in ambiguous:
+            del employee_by_identifier[identifier]
+        return employee_by_identifier, ambiguous
+    
+    @api.model
+    def _read_face_templates(self, employee_ids):
+        """Return ``{employee_id: templates}`` of the employees with face data"""
+        templates = {}
+        for employee in self.browse(employee_ids).sudo().with_context(prefetch_fields=False):
+            if not employee.face_encoding:
+                continue
+            try:
+                templates[employee.id] = as_template_block(
+                    json.loads(base64.b64decode(employee.face_encoding).decode('utf-8')))
+            except Exception as e:
+                _logger.error("Error reading face templates of employee %s: %s", employee.id, e)
+        return templates
+    
+    @api.model
+    def _import_face_templates(self, rows, match_by='barcode', mode='replace'):
+        """Store the templates of a bulk import, batch by batch
+
+        ``rows`` is a ``FaceImportRows``. All templates are validated at
+        once, the face data of FACE_IMPORT_BATCH_SIZE employees is written
+        per batch of attachment INSERTs within the caller's transaction,
+        and galleries are refreshed once at the end. With ``mode``
+        'append' the templates are added to the registered ones, with
+        'replace' they replace them.
+        Returns ``{'employees', 'templates', 'errors'}``, ``errors`` being
+        one ``{'row', 'employee', 'message'}`` per rejected row.
+        """
+        errors = list(rows.errors)
+        matrix = rows.as_matrix()
+        messages = validate_templates(matrix)
+        employee_by_identifier, ambiguous = self._find_face_import_employees(
+            set(rows.identifiers), match_by)
+        owners = np.array([employee_by_identifier.get(identifier, 0) for identifier in rows.identifiers],
+                          dtype=np.int64)
+        
+        valid = np.equal(messages, None) & (owners > 0)
+        for i in np.flatnonzero(~valid):
+            identifier = rows.identifiers[i]
+            message = messages[i]
+            if not message:
+                message = (_("Several employees match %s") if identifier in ambiguous
+                           else _("No employee matches %s")) % identifier
+            errors.append({'row': rows.rows[i], 'employee': identifier, 'message': message})
+        
+        # One block of templates per employee, in file order
+        owners = owners[valid]
+        order = np.argsort(owners, kind='stable')
+        employee_ids, starts = np.unique(owners[order], return_index=True)
+        blocks = np.split(matrix[valid][order], starts[1:]) if len(order) else []
+        employee_ids = [int(employee_id) for employee_id in employee_ids]
+        
+        Attachment = self.env['ir.attachment'].sudo()
+        upserts = []
+        for batch_start in range(0, len(employee_ids), FACE_IMPORT_BATCH_SIZE):
+            batch_ids = employee_ids[batch_start:batch_start + FACE_IMPORT_BATCH_SIZE]
+            batch_blocks = blocks[batch_start:batch_start + FACE_IMPORT_BATCH_SIZE]
+            if mode == 'append':
+                current = self._read_face_templates(batch_ids)
+                batch_blocks = [
+                    np.vstack([current[employee_id], block]) if employee_id in current else block
+                    for employee_id, block in zip(batch_ids, batch_blocks)
+                ]
+            Attachment.search([
+                ('res_model', '=', self._name),
+                ('res_field', '=', 'face_encoding'),
+                ('res_id', 'in', batch_ids),
+            ]).unlink()
+            Attachment.create([{
+                'name': 'face_encoding',
+                'res_model': self._name,
+                'res_field': 'face_encoding',
+                'res_id': employee_id,
+                'type': 'binary',
+                'raw': json.dumps(block.tolist()).encode('utf-8'),
+            } for employee_id, block in zip(batch_ids, batch_blocks)])
+            upserts.extend(zip(batch_ids, batch_blocks))
+        self.invalidate_model(['face_encoding'])
+        
+        if upserts:
+            self.browse(employee_ids)._bump_face_revision()
+            self._bump_face_gallery_generation()
+            self._schedule_face_gallery_push(upserts)
+        
+        template_count = sum(len(block) for _employee_id, block in upserts)
+        _logger.info("Imported %d face templates for %d employees, %d rows rejected",
+                     template_count, len(upserts), len(errors))
+        return {
+            'employees': len(upserts),
+            'templates': template_count,
+            'errors': errors,
+        }
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        employees = super().create(vals_list)
+        with_faces = employees.filtered('face_encoding')
+        with_faces._bump_face_revision()
+        with_faces._push_face_gallery_changes()
+        return employees
+    
+    def write(self, vals):
+        result = super().write(vals)
+        if FACE_GALLERY_FIELDS.intersection(vals) or FACE_PARTITION_FIELDS.intersection(vals):
+            self._bump_face_revision()
+        if FACE_GALLERY_FIELDS.intersection(vals):
+            self._push_face_gallery_changes()
+        if FACE_PARTITION_FIELDS.intersection(vals) and self.filtered('face_encoding'):
+            # Kiosk partitions are cached per worker, by employee ids for the
+            # daemon too: have every worker rebuild, so a transferred
+            # employee is no longer matched at the old site's kiosks
+            self._bump_face_gallery_generation()
+        return result
+    
+    def unlink(self):
+        employees = self.filtered('face_encoding')
+        employees._push_face_gallery_changes(removed=True)
+        return super().unlink()
+    
     def action_register_face(self):
         """Open wizard to register employee face"""
         self.ensure_one()
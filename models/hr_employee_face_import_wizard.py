@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, _
+from odoo.exceptions import UserError
+import base64
+import csv
+import io
+import logging
+
+from odoo.addons.hr_attendance_face_recognition.utils.face_import import read_face_import
+from .hr_employee import FACE_IMPORT_MATCH_FIELDS
+
+_logger = logging.getLogger(__name__)
+
+# Rejected rows listed in the wizard; the full list is in the CSV report
+ERROR_PREVIEW_ROWS = 50
+
+
+class HrEmployeeFaceImportWizard(models.TransientModel):
+    _name = 'hr.employee.face.import.wizard'
+    _description = 'Face Templates Bulk Import'
+
+    import_file = fields.Binary(
+        string='File',
+        attachment=False,
+        help="CSV file, or ZIP archive of CSV files and of <identifier>.npy / <identifier>.json template files"
+    )
+
+    filename = fields.Char(string='File Name')
+
+    match_by = fields.Selection(
+        FACE_IMPORT_MATCH_FIELDS,
+        string='Identify Employees By',
+        default='barcode',
+        required=True
+    )
+
+    mode = fields.Selection(
+        [('replace', 'Replace registered templates'),
+        ('append', 'Add to registered templates')],
+        string='Import Mode',
+        default='replace',
+        required=True
+    )
+
+    state = fields.Selection(
+        [('draft', 'Draft'),
+        ('done', 'Done')],
+        default='draft'
+    )
+
+    imported_employees = fields.Integer(string='Employees Imported', readonly=True)
+    imported_templates = fields.Integer(string='Templates Imported', readonly=True)
+    error_count = fields.Integer(string='Rejected Rows', readonly=True)
+    error_preview = fields.Text(string='Rejected Rows Preview', readonly=True)
+    error_report = fields.Binary(string='Error Report', readonly=True, attachment=False)
+    error_report_name = fields.Char(string='Error Report Name', readonly=True)
+
+    def action_import(self):
+        """Import the file and show the per-row report"""
+        self.ensure_one()
+        if not self.env.user.has_group('hr_attendance.group_hr_attendance_manager'):
+            raise UserError(_("Only attendance managers can import face data"))
+        if not self.import_file:
+            raise UserError(_("Select a file to import"))
+
+        try:
+            rows = read_face_import(base64.b64decode(self.import_file), self.filename or '')
+        except ValueError as e:
+            raise UserError(str(e))
+        result = self.env['hr.employee']._import_face_templates(rows, self.match_by, self.mode)
+
+        errors = result['errors']
+        vals = {
+            'state': 'done',
+            'import_file': False,
+            'imported_employees': result['employees'],
+            'imported_templates': result['templates'],
+            'error_count': len(errors),
+            'error_preview': '\n'.join(
+                '%(row)s  %(employee)s  %(message)s' % error for error in errors[:ERROR_PREVIEW_ROWS]),
+            'error_report': False,
+            'error_report_name': False,
+        }
+        if errors:
+            output = io.StringIO()
+            writer = csv.DictWriter(output, fieldnames=['row', 'employee', 'message'])
+            writer.writeheader()
+            writer.writerows(errors)
+            vals.update(
+                error_report=base64.b64encode(output.getvalue().encode('utf-8')),
+                error_report_name='face_import_errors.csv',
+            )
+        self.write(vals)
+
+        return {
+            'name': _('Import Faces'),
+            'type': 'ir.actions.act_window',
+            'view_mode': 'form',
+            'res_model': self._name,
+            'res_id': self.id,
+            'target': 'new',
+        }
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+from odoo import models
+
+from .hr_attendance_face_health import HEALTH_CHANNEL
+
+
+class IrWebsocket(models.AbstractModel):
+    _inherit = 'ir.websocket'
+
+    def _build_bus_channel_list(self, channels):
+        # Health snapshots are for attendance managers only
+        if HEALTH_CHANNEL in channels and not self.env.user.has_group('hr_attendance.group_hr_attendance_manager'):
+            channels = [channel for channel in channels if channel != HEALTH_CHANNEL]
+        return super()._build_bus_channel_list(channels)
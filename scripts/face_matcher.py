@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Face matching daemon shared by the Odoo workers of one host
+
+Run one per database next to the Odoo server, as the Odoo user::
+
+    python3 scripts/face_matcher.py --data-dir /var/lib/odoo -d <database>
+
+then set ``hr_attendance_face_recognition.matching_backend`` to
+``sidecar`` in that database. The socket is
+``<data_dir>/run/<database>-face_matcher.sock``, which Odoo finds by
+itself with the same ``data_dir``; with ``--socket``, set
+``hr_attendance_face_recognition.matching_socket`` to the same path. Its
+directory must belong to the Odoo user and be closed to others. Employee
+ids are only unique within a database, so a daemon must never serve two.
+The first verify request loads the gallery from the database; employee
+face data changes are pushed by Odoo as they are committed.
+
+Only numpy is required: the matching modules are loaded from ``utils``
+without importing Odoo.
+"""
+import argparse
+import importlib.util
+import logging
+import os
+import signal
+import sys
+import types
+
+UTILS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'utils')
+PACKAGE = 'face_recognition_utils'
+
+
+def _load_matching_service():
+    """Import utils/matching_service.py, bypassing the Odoo addon package"""
+    package = types.ModuleType(PACKAGE)
+    package.__path__ = [UTILS_PATH]
+    sys.modules[PACKAGE] = package
+    for name in ('descriptor_codec', 'face_matching', 'matching_service'):
+        spec = importlib.util.spec_from_file_location(
+            '%s.%s' % (PACKAGE, name), os.path.join(UTILS_PATH, '%s.py' % name))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+    return sys.modules['%s.matching_service' % PACKAGE]
+
+
+def main():
+    matching_service = _load_matching_service()
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--data-dir', default=matching_service.DEFAULT_DATA_DIR,
+                        help="Odoo data_dir, holding the socket (default: %(default)s)")
+    parser.add_argument('-d', '--database', required=True,
+                        help="The one database whose employees this daemon matches")
+    parser.add_argument('--socket', help="Unix socket to listen on (default: <data-dir>/run/<database>-%s)"
+                        % matching_service.SOCKET_NAME)
+    parser.add_argument('--log-level', default='INFO')
+    args = parser.parse_args()
+
+    args.socket = args.socket or matching_service.default_socket_path(args.data_dir, args.database)
+
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    server = matching_service.MatchingServer(args.socket)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logging.getLogger(__name__).info("Face matcher for database %s listening on %s", args.database, args.socket)
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+odoo.define('hr_attendance_face_recognition.face_edge_gallery', function (require) {
+"use strict";
+
+/**
+ * Gallery of a kiosk that matches scans on the device.
+ *
+ * The server sends signed bundles (see utils/gallery_bundle.py): a full
+ * one first, then deltas on top of the generation the kiosk holds. Each
+ * is checked with WebCrypto against the public key seen with the first
+ * bundle, then applied and stored in IndexedDB so the kiosk can match
+ * after a reload without waiting for the network. The server confirms
+ * every claim against the claimed employee's templates, so a stale
+ * gallery costs a server-side match, never a wrong check-in.
+ */
+
+const DB_NAME = 'hr_attendance_face_recognition_gallery';
+const DB_VERSION = 1;
+const STORE_NAME = 'galleries';
+const BUNDLE_VERSION = 1;
+
+let dbPromise = null;
+
+function openStore() {
+    if (!dbPromise) {
+        dbPromise = new Promise(function (resolve) {
+            if (!window.indexedDB) {
+                resolve(null);
+                return;
+            }
+            const request = window.indexedDB.open(DB_NAME, DB_VERSION);
+            request.onupgradeneeded = function () {
+                request.result.createObjectStore(STORE_NAME, { keyPath: 'deviceKey' });
+            };
+            request.onsuccess = function () { resolve(request.result); };
+            request.onerror = function () {
+                console.warn('Kiosk gallery storage unavailable:', request.error);
+                resolve(null);
+            };
+        });
+    }
+    return dbPromise;
+}
+
+function storeRequest(db, mode, action) {
+    return new Promise(function (resolve, reject) {
+        const transaction = db.transaction(STORE_NAME, mode);
+        const request = action(transaction.objectStore(STORE_NAME));
+        transaction.oncomplete = function () { resolve(request && request.result); };
+        transaction.onerror = function () { reject(transaction.error); };
+    });
+}
+
+function base64Bytes(text) {
+    const binary = atob(text);
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    return bytes;
+}
+
+function halfToFloat(bits) {
+    const sign = bits & 0x8000 ? -1 : 1;
+    const exponent = (bits >> 10) & 0x1f;
+    const mantissa = bits & 0x3ff;
+    if (exponent === 0) {
+        return sign * Math.pow(2, -14) * (mantissa / 1024);
+    }
+    if (exponent === 0x1f) {
+        return mantissa ? NaN : sign * Infinity;
+    }
+    return sign * Math.pow(2, exponent - 15) * (1 + mantissa / 1024);
+}
+
+/**
+ * Return an empty gallery: ``{generation, fetchedAt, publicKey, size, employees}``,
+ * ``employees`` mapping employee ids to their templates, one Float32Array
+ * of ``count * size`` values each.
+ */
+function emptyGallery() {
+    return {generation: 0, fetchedAt: 0, publicKey: null, size: 128, employees: new Map()};
+}
+
+/**
+ * Check a ``{data, signature, public_key}`` answer of /face_recognition/bundle
+ * and return the bundle it signs. The key must be the one the gallery
+ * pinned, if any, unless ``repin``: a full bundle replaces the whole
+ * gallery and may come with the key the server signs with now.
+ */
+async function verifyBundle(gallery, signed, repin) {
+    if (!repin && gallery.publicKey && gallery.publicKey !== signed.public_key) {
+        throw new Error('Gallery bundle signed with an unknown key');
+    }
+    const key = await window.crypto.subtle.importKey(
+        'spki', base64Bytes(signed.public_key),
+        {name: 'ECDSA', namedCurve: 'P-256'}, false, ['verify']);
+    const valid = await window.crypto.subtle.verify(
+        {name: 'ECDSA', hash: 'SHA-256'}, key,
+        base64Bytes(signed.signature), new TextEncoder().encode(signed.data));
+    if (!valid) {
+        throw new Error('Gallery bundle signature does not match');
+    }
+    const bundle = JSON.parse(signed.data);
+    if (bundle.version !== BUNDLE_VERSION) {
+        throw new Error('Unsupported gallery bundle version ' + bundle.version);
+    }
+    return bundle;
+}
+
+/**
+ * Apply a verified bundle; a delta must be based on the gallery's generation.
+ * Returns false when it is not, and a full bundle is needed.
+ */
+function applyBundle(gallery, bundle, publicKey) {
+    if (bundle.base_generation !== null && bundle.base_generation !== gallery.generation) {
+        return false;
+    }
+    const ids = new Int32Array(base64Bytes(bundle.template_employee_ids).buffer);
+    const counts = new Uint16Array(base64Bytes(bundle.template_counts).buffer);
+    const halves = new Uint16Array(base64Bytes(bundle.templates).buffer);
+    const size = bundle.descriptor_size;
+
+    if (bundle.base_generation === null) {
+        gallery.employees = new Map();
+    } else {
+        // Employees no longer in the partition are dropped
+        const kept = new Set(new Int32Array(base64Bytes(bundle.employee_ids).buffer));
+        for (const employeeId of Array.from(gallery.employees.keys())) {
+            if (!kept.has(employeeId)) {
+                gallery.employees.delete(employeeId);
+            }
+        }
+    }
+    let offset = 0;
+    for (let i = 0; i < ids.length; i++) {
+        const templates = new Float32Array(counts[i] * size);
+        for (let j = 0; j < templates.length; j++) {
+            templates[j] = halfToFloat(halves[offset + j]);
+        }
+        offset += templates.length;
+        gallery.employees.set(ids[i], templates);
+    }
+    gallery.generation = bundle.generation;
+    gallery.size = size;
+    gallery.publicKey = publicKey;
+    if (bundle.base_generation === null) {
+        gallery.fetchedAt = Date.now();
+    }
+    return true;
+}
+
+/**
+ * Return ``{employee_id, score}`` of the closest template, score being the
+ * 0-1 similarity the server computes, or null for an empty gallery.
+ */
+function match(gallery, descriptor) {
+    const size = gallery.size;
+    let best = null;
+    let bestDistance = Infinity;
+    gallery.employees.forEach(function (templates, employeeId) {
+        for (let start = 0; start < templates.length; start += size) {
+            let sum = 0;
+            for (let k = 0; k < size && sum < bestDistance; k++) {
+                const d = templates[start + k] - descriptor[k];
+                sum += d * d;
+            }
+            if (sum < bestDistance) {
+                bestDistance = sum;
+                best = employeeId;
+            }
+        }
+    });
+    if (best === null) {
+        return null;
+    }
+    return {employee_id: best, score: Math.max(0, 1 - Math.sqrt(bestDistance))};
+}
+
+async function load(deviceKey) {
+    const db = await openStore();
+    const stored = db && await storeRequest(db, 'readonly', store => store.get(deviceKey));
+    return stored ? Object.assign(emptyGallery(), stored.gallery) : emptyGallery();
+}
+
+async function save(deviceKey, gallery) {
+    const db = await openStore();
+    if (db) {
+        await storeRequest(db, 'readwrite', store => store.put({deviceKey: deviceKey, gallery: gallery}));
+    }
+}
+
+return {
+    emptyGallery: emptyGallery,
+    verifyBundle: verifyBundle,
+    applyBundle: applyBundle,
+    match: match,
+    load: load,
+    save: save,
+};
+
+});
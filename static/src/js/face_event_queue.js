@@ -0,0 +1,138 @@
+odoo.define('hr_attendance_face_recognition.face_event_queue', function (require) {
+"use strict";
+
+/**
+ * Persistent queue of kiosk scans captured while the server is unreachable.
+ *
+ * Events are stored in IndexedDB under their UUID, so they survive a kiosk
+ * reload, and are read back in capture order for replay through
+ * /face_recognition/verify/bulk. The server records every UUID it applies,
+ * which makes replaying an event twice harmless. Without IndexedDB the
+ * queue only lives as long as the page.
+ */
+
+const DB_NAME = 'hr_attendance_face_recognition_events';
+const DB_VERSION = 1;
+const STORE_NAME = 'events';
+
+let dbPromise = null;
+let memoryQueue = [];
+
+function openQueue() {
+    if (!dbPromise) {
+        dbPromise = new Promise(function (resolve) {
+            if (!window.indexedDB) {
+                resolve(null);
+                return;
+            }
+            const request = window.indexedDB.open(DB_NAME, DB_VERSION);
+            request.onupgradeneeded = function () {
+                const store = request.result.createObjectStore(STORE_NAME, { keyPath: 'uuid' });
+                store.createIndex('captured_at', 'captured_at');
+            };
+            request.onsuccess = function () { resolve(request.result); };
+            request.onerror = function () {
+                console.warn('Offline event queue unavailable:', request.error);
+                resolve(null);
+            };
+        });
+    }
+    return dbPromise;
+}
+
+function queueRequest(db, mode, action) {
+    return new Promise(function (resolve, reject) {
+        const transaction = db.transaction(STORE_NAME, mode);
+        const request = action(transaction.objectStore(STORE_NAME));
+        transaction.oncomplete = function () { resolve(request && request.result); };
+        transaction.onerror = function () { reject(transaction.error); };
+    });
+}
+
+/**
+ * Return a random RFC 4122 version 4 UUID.
+ */
+function newUuid() {
+    if (window.crypto && window.crypto.randomUUID) {
+        return window.crypto.randomUUID();
+    }
+    const bytes = new Uint8Array(16);
+    window.crypto.getRandomValues(bytes);
+    bytes[6] = (bytes[6] & 0x0f) | 0x40;
+    bytes[8] = (bytes[8] & 0x3f) | 0x80;
+    const hex = Array.from(bytes, byte => byte.toString(16).padStart(2, '0')).join('');
+    return [hex.slice(0, 8), hex.slice(8, 12), hex.slice(12, 16), hex.slice(16, 20), hex.slice(20)].join('-');
+}
+
+/**
+ * Store an event ``{uuid, captured_at, encoding, format}``.
+ */
+async function push(event) {
+    const db = await openQueue();
+    if (!db) {
+        memoryQueue.push(event);
+        return;
+    }
+    await queueRequest(db, 'readwrite', store => store.put(event));
+}
+
+/**
+ * Return up to ``limit`` of the oldest events, oldest first.
+ */
+async function peek(limit) {
+    const db = await openQueue();
+    if (!db) {
+        return memoryQueue
+            .slice()
+            .sort((a, b) => a.captured_at - b.captured_at)
+            .slice(0, limit);
+    }
+    return new Promise(function (resolve, reject) {
+        const events = [];
+        const transaction = db.transaction(STORE_NAME, 'readonly');
+        const cursorRequest = transaction.objectStore(STORE_NAME).index('captured_at').openCursor();
+        cursorRequest.onsuccess = function () {
+            const cursor = cursorRequest.result;
+            if (cursor && events.length < limit) {
+                events.push(cursor.value);
+                cursor.continue();
+            }
+        };
+        transaction.oncomplete = function () { resolve(events); };
+        transaction.onerror = function () { reject(transaction.error); };
+    });
+}
+
+/**
+ * Drop the events the server has answered for.
+ */
+async function remove(uuids) {
+    const db = await openQueue();
+    if (!db) {
+        const done = new Set(uuids);
+        memoryQueue = memoryQueue.filter(event => !done.has(event.uuid));
+        return;
+    }
+    await queueRequest(db, 'readwrite', function (store) {
+        uuids.forEach(uuid => store.delete(uuid));
+        return null;
+    });
+}
+
+async function size() {
+    const db = await openQueue();
+    if (!db) {
+        return memoryQueue.length;
+    }
+    return queueRequest(db, 'readonly', store => store.count());
+}
+
+return {
+    newUuid: newUuid,
+    push: push,
+    peek: peek,
+    remove: remove,
+    size: size,
+};
+
+});
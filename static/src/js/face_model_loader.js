@@ -0,0 +1,193 @@
+odoo.define('hr_attendance_face_recognition.face_model_loader', function (require) {
+"use strict";
+
+/**
+ * Loads face-api.js and its model weights, caching both in IndexedDB.
+ *
+ * Entries are keyed by the content hashes the server reports on
+ * /face_recognition/models/info, so a kiosk reboot reads everything from
+ * the local cache and a model update on the server invalidates it. The
+ * three nets are loaded in parallel. When IndexedDB is unavailable the
+ * versioned URLs are still served with immutable cache headers, so the
+ * browser HTTP cache takes over.
+ */
+
+var ajax = require('web.ajax');
+
+const DB_NAME = 'hr_attendance_face_recognition';
+const DB_VERSION = 1;
+const STORE_NAME = 'face_api_assets';
+
+let dbPromise = null;
+let assetsPromise = null;
+let loadPromise = null;
+
+function openCache() {
+    if (!dbPromise) {
+        dbPromise = new Promise(function (resolve) {
+            if (!window.indexedDB) {
+                resolve(null);
+                return;
+            }
+            const request = window.indexedDB.open(DB_NAME, DB_VERSION);
+            request.onupgradeneeded = function () {
+                request.result.createObjectStore(STORE_NAME);
+            };
+            request.onsuccess = function () { resolve(request.result); };
+            request.onerror = function () {
+                console.warn('Face model cache unavailable:', request.error);
+                resolve(null);
+            };
+        });
+    }
+    return dbPromise;
+}
+
+function cacheRequest(db, mode, action) {
+    return new Promise(function (resolve, reject) {
+        const transaction = db.transaction(STORE_NAME, mode);
+        const request = action(transaction.objectStore(STORE_NAME));
+        transaction.oncomplete = function () { resolve(request.result); };
+        transaction.onerror = function () { reject(transaction.error); };
+    });
+}
+
+/**
+ * Return the cached body for ``key``, fetching and storing it on a miss.
+ */
+async function fetchCached(key, url, type) {
+    const db = await openCache();
+    if (db) {
+        try {
+            const cached = await cacheRequest(db, 'readonly', store => store.get(key));
+            if (cached !== undefined) {
+                return cached;
+            }
+        } catch (error) {
+            console.warn('Face model cache read failed:', error);
+        }
+    }
+
+    const response = await fetch(url, { credentials: 'same-origin' });
+    if (!response.ok) {
+        throw new Error('Failed to fetch ' + url + ' (' + response.status + ')');
+    }
+    const body = type === 'text' ? await response.text() : await response.arrayBuffer();
+
+    if (db) {
+        try {
+            await cacheRequest(db, 'readwrite', store => store.put(body, key));
+        } catch (error) {
+            // Quota errors only cost us the cache, not the load
+            console.warn('Face model cache write failed:', error);
+        }
+    }
+    return body;
+}
+
+/**
+ * Drop cache entries whose hash is no longer served.
+ */
+async function pruneCache(validPrefixes) {
+    const db = await openCache();
+    if (!db) {
+        return;
+    }
+    try {
+        const keys = await cacheRequest(db, 'readonly', store => store.getAllKeys());
+        const stale = keys.filter(key => !validPrefixes.some(prefix => key.startsWith(prefix)));
+        if (stale.length) {
+            await cacheRequest(db, 'readwrite', function (store) {
+                stale.forEach(key => store.delete(key));
+                return store.count();
+            });
+        }
+    } catch (error) {
+        console.warn('Face model cache cleanup failed:', error);
+    }
+}
+
+async function fetchNetAssets(net) {
+    const manifest = JSON.parse(
+        await fetchCached(net.hash + ':' + net.manifest, net.base_url + net.manifest, 'text'));
+
+    // Shards in manifest order, which is the order face-api reads them in
+    const filenames = [].concat.apply([], manifest.map(group => group.paths));
+    const buffers = await Promise.all(filenames.map(
+        filename => fetchCached(net.hash + ':' + filename, net.base_url + filename, 'arraybuffer')));
+
+    return { manifest: manifest, buffers: buffers };
+}
+
+async function fetchAssets() {
+    const info = await ajax.jsonRpc('/face_recognition/models/info', 'call', {});
+    if (!info.success) {
+        throw new Error(info.message);
+    }
+
+    const names = Object.keys(info.nets);
+    const results = await Promise.all([
+        fetchCached(info.library.hash + ':face-api.js', info.library.url, 'text'),
+    ].concat(names.map(name => fetchNetAssets(info.nets[name]))));
+
+    const nets = {};
+    names.forEach((name, index) => { nets[name] = results[index + 1]; });
+
+    const validPrefixes = [info.library.hash + ':'].concat(
+        Object.values(info.nets).map(net => net.hash + ':'));
+    pruneCache(validPrefixes);
+
+    return { library: results[0], nets: nets };
+}
+
+/**
+ * Return the face-api.js source and, per net, its manifest and weight
+ * buffers, e.g. to hand them to a worker. Fetched once per page.
+ */
+function loadAssets() {
+    if (!assetsPromise) {
+        assetsPromise = fetchAssets().catch(function (error) {
+            assetsPromise = null;
+            throw error;
+        });
+    }
+    return assetsPromise;
+}
+
+async function loadAll() {
+    const assets = await loadAssets();
+
+    if (!window.faceapi) {
+        const script = document.createElement('script');
+        script.text = assets.library;
+        document.head.appendChild(script);
+    }
+
+    await Promise.all(Object.keys(assets.nets).map(async function (name) {
+        const net = assets.nets[name];
+        // face-api's own loader, fed from the cache instead of the network
+        const loadWeights = faceapi.tf.io.weightsLoaderFactory(() => Promise.resolve(net.buffers));
+        faceapi.nets[name].loadFromWeightMap(await loadWeights(net.manifest, ''));
+    }));
+}
+
+/**
+ * Load face-api.js and the detector, landmark and recognition nets.
+ * Concurrent callers share one load; a failed load can be retried.
+ */
+function load() {
+    if (!loadPromise) {
+        loadPromise = loadAll().catch(function (error) {
+            loadPromise = null;
+            throw error;
+        });
+    }
+    return loadPromise;
+}
+
+return {
+    load: load,
+    loadAssets: loadAssets,
+};
+
+});
@@ -5,16 +5,10 @@ var core = require('web.core');
 var FormController = require('web.FormController');
 var FormView = require('web.FormView');
 var viewRegistry = require('web.view_registry');
+var faceModelLoader = require('hr_attendance_face_recognition.face_model_loader');
 
 var _t = core._t;
 
-// Load face-api.js from CDN
-const script = document.createElement('script');
-script.src = '/hr_attendance_face_recognition/static/lib/face-api.js';
-//script.src = 'https://cdn.jsdelivr.net/npm/@vladmandic/face-api@1.7.2/dist/face-api.js';
-script.crossOrigin = 'anonymous';
-document.head.appendChild(script);
-
 var FaceRegistrationFormController = FormController.extend({
     events: _.extend({}, FormController.prototype.events, {
         'click .o_capture_face': '_onCaptureFace',
@@ -32,10 +26,8 @@ var FaceRegistrationFormController = FormController.extend({
     start: function () {
         var self = this;
         return this._super.apply(this, arguments).then(function () {
-            // Initialize face detection when script is loaded
-            script.onload = function() {
-                self._loadFaceDetectionModels();
-            };
+            // Load face-api.js and its models (cached locally after the first run)
+            self._loadFaceDetectionModels();
             
             // Initialize webcam when view is fully rendered
             self.renderer.on('renderComplete', self, function() {
@@ -56,17 +48,8 @@ var FaceRegistrationFormController = FormController.extend({
             statusElement.removeClass('invisible alert-danger').addClass('alert alert-info');
             statusElement.text(_t('Loading face detection models...'));
             
-            // Log the model URLs for debugging
-            const modelUrl = '/hr_attendance_face_recognition/static/models';
-            console.log('Loading face registration models from:', modelUrl);
-            
-            // Load required models with logging
-            console.log('Loading tinyFaceDetector model...');
-            await faceapi.nets.tinyFaceDetector.loadFromUri(modelUrl);
-            console.log('Loading faceLandmark68Net model...');
-            await faceapi.nets.faceLandmark68Net.loadFromUri(modelUrl);
-            console.log('Loading faceRecognitionNet model...');
-            await faceapi.nets.faceRecognitionNet.loadFromUri(modelUrl);
+            // Library and the three nets, in parallel, from the local cache when warm
+            await faceModelLoader.load();
             
             this.faceModelsLoaded = true;
             console.log('All face registration models loaded successfully!');
@@ -9,6 +9,11 @@ var ajax = require('web.ajax');
 var QWeb = core.qweb;
 var _t = core._t;
 
+// Bus notification type of the health snapshots published by the server
+var HEALTH_NOTIFICATION = 'face_recognition_health';
+// Re-subscribe this often so the server keeps publishing while the dashboard is open
+var HEALTH_KEEPALIVE_INTERVAL = 5 * 60 * 1000;
+
 var FaceHealthDashboard = AbstractAction.extend({
     template: 'face_recognition_health_dashboard',
     
@@ -22,6 +27,11 @@ var FaceHealthDashboard = AbstractAction.extend({
         this._super.apply(this, arguments);
         this.updateInterval = null;
         this.lastUpdateTime = new Date();
+        this.healthChannel = null;
+        this.healthSequence = null;
+        this.healthSnapshot = null;
+        this.requestTracing = null;
+        this._onBusNotification = this._onBusNotification.bind(this);
     },
     
     willStart: function () {
@@ -31,12 +41,13 @@ var FaceHealthDashboard = AbstractAction.extend({
     start: function () {
         var self = this;
         return this._super.apply(this, arguments).then(function () {
-            self._fetchHealthData();
-            
-            // Set up auto-refresh every 2 minutes
+            // Snapshots are pushed over the bus; the interval only keeps
+            // the server-side producer running
+            self.call('bus_service', 'addEventListener', 'notification', self._onBusNotification);
+            self._subscribeHealth();
             self.updateInterval = setInterval(function() {
-                self._fetchHealthData();
-            }, 120000);
+                self._subscribeHealth();
+            }, HEALTH_KEEPALIVE_INTERVAL);
         });
     },
     
@@ -45,9 +56,102 @@ var FaceHealthDashboard = AbstractAction.extend({
         if (this.updateInterval) {
             clearInterval(this.updateInterval);
         }
+        this.call('bus_service', 'removeEventListener', 'notification', this._onBusNotification);
+        if (this.healthChannel) {
+            this.call('bus_service', 'deleteChannel', this.healthChannel);
+        }
         this._super.apply(this, arguments);
     },
     
+    _subscribeHealth: function() {
+        var self = this;
+        
+        // Latest published snapshot; later changes arrive on the bus
+        return this._rpc({
+            route: '/face_recognition/health/subscribe',
+            params: {}
+        }).then(function(result) {
+            if (!result.channel) {
+                self._showError(result.message || "Could not fetch health data.");
+                return;
+            }
+            if (!self.healthChannel) {
+                self.healthChannel = result.channel;
+                self.call('bus_service', 'addChannel', result.channel);
+            }
+            self.requestTracing = result.request_tracing;
+            self.admissionControl = result.admission_control;
+            // A snapshot is null until the producer first ran
+            if (result.snapshot) {
+                self.healthSequence = result.sequence;
+                self.healthSnapshot = result.snapshot;
+                self._renderHealth();
+            }
+        }).catch(function(error) {
+            console.error('Error fetching health data:', error);
+            self._showError("Could not fetch health data. Please check server logs.");
+        });
+    },
+    
+    _onBusNotification: function(event) {
+        var self = this;
+        event.detail.forEach(function(notification) {
+            if (notification.type !== HEALTH_NOTIFICATION) {
+                return;
+            }
+            var message = notification.payload;
+            if (message.snapshot) {
+                self.healthSnapshot = message.snapshot;
+            } else if (self.healthSnapshot && message.base === self.healthSequence) {
+                self._applyHealthDelta(message.changes || [], message.removed || []);
+            } else {
+                // A message was missed: start again from the stored snapshot
+                self._subscribeHealth();
+                return;
+            }
+            self.healthSequence = message.sequence;
+            self._renderHealth();
+        });
+    },
+    
+    _applyHealthDelta: function(changes, removed) {
+        var snapshot = this.healthSnapshot;
+        removed.forEach(function(path) {
+            var parent = snapshot;
+            for (var i = 0; i < path.length - 1 && parent; i++) {
+                parent = parent[path[i]];
+            }
+            if (parent) {
+                delete parent[path[path.length - 1]];
+            }
+        });
+        changes.forEach(function(change) {
+            var path = change[0];
+            var parent = snapshot;
+            for (var i = 0; i < path.length - 1; i++) {
+                if (typeof parent[path[i]] !== 'object' || parent[path[i]] === null) {
+                    parent[path[i]] = {};
+                }
+                parent = parent[path[i]];
+            }
+            parent[path[path.length - 1]] = change[1];
+        });
+    },
+    
+    _renderHealth: function() {
+        var data = Object.assign({}, this.healthSnapshot);
+        data.checks = Object.assign({}, data.checks);
+        if (this.requestTracing) {
+            data.checks.request_tracing = this.requestTracing;
+        }
+        if (this.admissionControl) {
+            data.checks.admission_control = this.admissionControl;
+        }
+        this._updateDashboard(data);
+        this.lastUpdateTime = data.timestamp ? new Date(data.timestamp.replace(' ', 'T') + 'Z') : new Date();
+        $("#last_updated").text(this.lastUpdateTime.toLocaleTimeString());
+    },
+    
     _fetchHealthData: function() {
         var self = this;
         
@@ -101,6 +205,9 @@ var FaceHealthDashboard = AbstractAction.extend({
         
         // Update resource stats
         this._updateResourceStats(data.checks.system_check);
+        
+        // Update slow request traces
+        this._updateSlowRequests(data.checks.request_tracing);
     },
     
     _formatCheckName: function(key) {
@@ -252,6 +359,57 @@ var FaceHealthDashboard = AbstractAction.extend({
         $('#resource_stats').html(html);
     },
     
+    _updateSlowRequests: function(data) {
+        if (!data) return;
+        
+        var traces = data.slow_requests || [];
+        if (traces.length === 0) {
+            $('#slow_requests').html(
+                '<div class="text-center">No requests slower than ' + Math.round(data.threshold_ms) + ' ms</div>'
+            );
+            return;
+        }
+        
+        var html = `
+            <table class="table table-sm o_face_slow_requests">
+                <thead>
+                    <tr>
+                        <th>Time</th>
+                        <th>Request</th>
+                        <th>Total</th>
+                        <th>SQL</th>
+                        <th>Stages</th>
+                    </tr>
+                </thead>
+                <tbody>
+        `;
+        
+        traces.forEach(function(trace) {
+            var stages = trace.stages.map(function(stage) {
+                return `<span class="o_face_trace_stage">${stage.stage}: ${stage.ms.toFixed(1)} ms</span>`;
+            }).join(' ');
+            
+            var client = trace.info && trace.info.client;
+            if (client && client.fps) {
+                stages += ` <span class="o_face_trace_stage">kiosk: ${client.fps} fps${client.worker ? ' (worker)' : ''}</span>`;
+            }
+            
+            html += `
+                <tr>
+                    <td>${new Date(trace.timestamp * 1000).toLocaleTimeString()}</td>
+                    <td>${trace.name}</td>
+                    <td>${trace.total_ms.toFixed(1)} ms</td>
+                    <td>${trace.sql_count} / ${trace.sql_ms.toFixed(1)} ms</td>
+                    <td>${stages}</td>
+                </tr>
+            `;
+        });
+        
+        html += '</tbody></table>';
+        
+        $('#slow_requests').html(html);
+    },
+    
     _formatBytes: function(bytes, decimals = 2) {
         if (bytes === 0) return '0 Bytes';
         
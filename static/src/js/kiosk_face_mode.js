@@ -4,15 +4,15 @@ odoo.define('hr_attendance_face_recognition.kiosk_face_mode', function (require)
 var AbstractAction = require('web.AbstractAction');
 var core = require('web.core');
 var session = require('web.session');
+var faceModelLoader = require('hr_attendance_face_recognition.face_model_loader');
+var faceEventQueue = require('hr_attendance_face_recognition.face_event_queue');
+var faceEdgeGallery = require('hr_attendance_face_recognition.face_edge_gallery');
 
 var QWeb = core.qweb;
 var _t = core._t;
 
-// Load face-api.js from CDN
-const script = document.createElement('script');
-script.src = '/hr_attendance_face_recognition/static/lib/face-api.js';
-script.crossOrigin = 'anonymous';
-document.head.appendChild(script);
+const DETECTION_WORKER_URL = '/hr_attendance_face_recognition/static/src/worker/face_detection_worker.js';
+const DEVICE_KEY_STORAGE = 'hr_attendance_face_recognition.device_key';
 
 var FaceKioskMode = AbstractAction.extend({
     template: 'HrAttendanceFaceKiosk',
@@ -33,20 +33,118 @@ var FaceKioskMode = AbstractAction.extend({
         this.retryAttempts = 0;
         this.maxRetries = 3;
         this.retryDelay = 1000; // 1 second between retries
+        // A busy server answers with the delay to wait before sending again
+        this.busyAttempts = 0;
+        this.maxBusyRetries = 4;
+        // Descriptor wire format: 'f32' or 'f16' raw little-endian floats
+        this.descriptorFormat = 'f32';
+        // Snapshot settings, overridden by the server at startup
+        this.storeImages = false;
+        this.snapshotMaxSize = 240;
+        this.snapshotQuality = 0.7;
+        // Face tracking: a person stays on one track while they are in
+        // front of the camera, and a track keeps its first successful
+        // result; a failed one is retried with a later frame
+        this.faceTrack = null;
+        this.verifyPending = false;
+        this.trackDistanceThreshold = 0.45; // max descriptor distance for the same identity
+        this.trackIouThreshold = 0.3;       // min box overlap between consecutive frames
+        this.trackTimeout = 1500;           // ms without the face before the track ends
+        this.trackRetryDelay = 1000;        // ms before a track whose scan failed is verified again
+        this.resultHoldUntil = 0;
+        // Off-main-thread detection with an adaptive frame rate
+        this.detectionWorker = null;
+        this.workerFrameId = 0;
+        this.workerRequests = {};
+        this.activeInterval = 100;   // ms between detections while the scene is active
+        this.idleInterval = 1000;    // ms between motion checks while the scene is idle
+        this.idleAfter = 3000;       // ms without motion or face before going idle
+        this.motionThreshold = 0.02; // fraction of changed pixels that counts as motion
+        this.lastActivity = 0;
+        this.frameTimestamps = [];
+        this.lastFrameTimings = {};
+        // Scans captured while the server is unreachable, replayed in bulk
+        this.offlineQueueSize = 0;
+        this.offlineBatchSize = 200;
+        this.offlineFlushInterval = 15000; // ms between replay attempts
+        this.offlineFlushTimer = null;
+        this.offlineFlushing = false;
+        this._onOnline = () => this._flushOfflineEvents();
+        // Registered kiosk device, scoping which employees can be matched
+        this.deviceKey = this._getDeviceKey();
+        // Kiosks of sites with a poor connection match on the device and
+        // only ask the server to confirm the employee found
+        this.edgeMatching = false;
+        this.edgeGallery = null;
+        this.edgeThreshold = 70;
+        this.bundleRefresh = 300;       // s between gallery updates
+        this.bundleMaxAge = 86400;      // s after which a full gallery is fetched again
+        this.bundleTimer = null;
+    },
+    
+    /**
+     * Return the kiosk's device key. It comes from the kiosk URL
+     * (?device=...) the first time and is remembered on the device.
+     */
+    _getDeviceKey: function() {
+        const urlKey = new URLSearchParams(window.location.search).get('device');
+        try {
+            if (urlKey) {
+                window.localStorage.setItem(DEVICE_KEY_STORAGE, urlKey);
+            }
+            return urlKey || window.localStorage.getItem(DEVICE_KEY_STORAGE);
+        } catch (error) {
+            // Storage disabled: the key only lives in the URL
+            return urlKey;
+        }
     },
     
     willStart: function () {
-        return this._super.apply(this, arguments);
+        return Promise.all([
+            this._super.apply(this, arguments),
+            this._loadKioskConfig()
+        ]);
+    },
+    
+    _loadKioskConfig: function() {
+        var self = this;
+        return this._rpc({
+            route: '/face_recognition/kiosk/config',
+            params: {device_key: self.deviceKey}
+        }).then(function(config) {
+            if (config && !config.success) {
+                self.kioskConfigError = config.message;
+            } else if (config) {
+                self.storeImages = config.store_images;
+                self.snapshotMaxSize = config.snapshot_max_size || self.snapshotMaxSize;
+                self.snapshotQuality = config.snapshot_quality || self.snapshotQuality;
+                self.edgeMatching = !!config.edge_matching && !!(window.crypto && window.crypto.subtle);
+                if (self.edgeMatching) {
+                    self.edgeThreshold = config.threshold;
+                    self.bundleRefresh = config.bundle_refresh || self.bundleRefresh;
+                    self.bundleMaxAge = config.bundle_max_age || self.bundleMaxAge;
+                }
+            }
+        }).catch(function(error) {
+            // Keep the defaults: no snapshot is uploaded
+            console.error('Error loading kiosk configuration:', error);
+        });
     },
     
     start: function () {
         var self = this;
         this.faceStreamPromise = this._startFaceStream();
         
-        // Load face-api.js models when script is loaded
-        script.onload = function() {
-            self._loadFaceDetectionModels();
-        };
+        // Load face-api.js and its models (cached locally after the first run)
+        this._loadFaceDetectionModels();
+        
+        // Replay scans left over from a previous offline period
+        window.addEventListener('online', this._onOnline);
+        this._flushOfflineEvents();
+        
+        if (this.edgeMatching) {
+            this._syncEdgeGallery();
+        }
         
         return this._super.apply(this, arguments).then(function () {
             self.initializeVideoElement();
@@ -55,6 +153,13 @@ var FaceKioskMode = AbstractAction.extend({
     
     destroy: function () {
         this._stopFaceStream();
+        window.removeEventListener('online', this._onOnline);
+        clearTimeout(this.offlineFlushTimer);
+        clearTimeout(this.bundleTimer);
+        if (this.detectionWorker) {
+            this.detectionWorker.terminate();
+            this.detectionWorker = null;
+        }
         this._super.apply(this, arguments);
     },
     
@@ -86,28 +191,31 @@ var FaceKioskMode = AbstractAction.extend({
         try {
             this._showProcessingMessage(_t('Loading face detection models...'));
             console.log('Starting to load face detection models...');
+            const loadStart = performance.now();
             
-            // Log the model URLs for debugging
-            const modelUrl = '/hr_attendance_face_recognition/static/models';
-            console.log('Loading models from:', modelUrl);
-            
-            // Load each model with logging
-            console.log('Loading tinyFaceDetector model...');
-            await faceapi.nets.tinyFaceDetector.loadFromUri(modelUrl);
-            console.log('tinyFaceDetector loaded successfully');
-            
-            console.log('Loading faceLandmark68Net model...');
-            await faceapi.nets.faceLandmark68Net.loadFromUri(modelUrl);
-            console.log('faceLandmark68Net loaded successfully');
-            
-            console.log('Loading faceRecognitionNet model...');
-            await faceapi.nets.faceRecognitionNet.loadFromUri(modelUrl);
-            console.log('faceRecognitionNet loaded successfully');
+            // Library and the three nets, in parallel, from the local cache when warm.
+            // Detection runs in a worker where supported, on this thread otherwise.
+            if (this._detectionWorkerSupported()) {
+                try {
+                    await this._startDetectionWorker();
+                } catch (error) {
+                    console.warn('Detection worker unavailable, detecting on the main thread:', error);
+                    await faceModelLoader.load();
+                }
+            } else {
+                await faceModelLoader.load();
+            }
             
             this.faceModelsLoaded = true;
+            console.log('Face models loaded in ' + Math.round(performance.now() - loadStart) + ' ms');
             console.log('All face models loaded successfully!');
             this._hideProcessingMessage();
-            this._showSuccessMessage(_t('Face detection ready!'));
+            if (this.kioskConfigError) {
+                // Unregistered device: verification would be refused
+                this._showErrorMessage(this.kioskConfigError);
+            } else {
+                this._showSuccessMessage(_t('Face detection ready!'));
+            }
         } catch (error) {
             console.error('Error loading face detection models', error);
             this._showErrorMessage(_t('Failed to load face detection models: ') + error.message);
@@ -119,6 +227,139 @@ var FaceKioskMode = AbstractAction.extend({
         }
     },
     
+    _detectionWorkerSupported: function() {
+        return typeof Worker !== 'undefined' &&
+            typeof OffscreenCanvas !== 'undefined' &&
+            typeof createImageBitmap !== 'undefined';
+    },
+    
+    _startDetectionWorker: async function() {
+        const assets = await faceModelLoader.loadAssets();
+        const worker = new Worker(DETECTION_WORKER_URL);
+        
+        try {
+            await new Promise(function(resolve, reject) {
+                worker.onmessage = function(event) {
+                    if (event.data.type === 'ready') {
+                        resolve();
+                    } else if (event.data.type === 'error') {
+                        reject(new Error(event.data.message));
+                    }
+                };
+                worker.onerror = function(event) {
+                    reject(new Error(event.message));
+                };
+                worker.postMessage({ type: 'init', library: assets.library, nets: assets.nets });
+            });
+        } catch (error) {
+            worker.terminate();
+            throw error;
+        }
+        
+        worker.onmessage = (event) => this._onWorkerMessage(event.data);
+        this.detectionWorker = worker;
+    },
+    
+    _onWorkerMessage: function(message) {
+        const request = this.workerRequests[message.id];
+        if (!request) {
+            return;
+        }
+        delete this.workerRequests[message.id];
+        
+        if (message.type === 'error') {
+            request.reject(new Error(message.message));
+        } else {
+            request.resolve(message);
+        }
+    },
+    
+    /**
+     * Send the current video frame to the worker. Motion checks only
+     * transfer a tiny downscaled bitmap.
+     */
+    _runWorkerFrame: async function(mode) {
+        const start = performance.now();
+        const bitmap = mode === 'motion'
+            ? await createImageBitmap(this.video, { resizeWidth: 64, resizeHeight: 48, resizeQuality: 'low' })
+            : await createImageBitmap(this.video);
+        const capture = performance.now() - start;
+        
+        const id = ++this.workerFrameId;
+        const result = await new Promise((resolve, reject) => {
+            this.workerRequests[id] = { resolve: resolve, reject: reject };
+            this.detectionWorker.postMessage({ type: 'frame', id: id, mode: mode, bitmap: bitmap }, [bitmap]);
+        });
+        
+        result.timings.capture = capture;
+        result.timings.total = performance.now() - start;
+        return result;
+    },
+    
+    /**
+     * Detect faces in the current frame, in the worker when available.
+     * Returns plain faces {box, landmarks, descriptor} in video pixels;
+     * descriptors are only present when a single face is in view.
+     */
+    _detectFrame: async function() {
+        if (this.detectionWorker) {
+            const result = await this._runWorkerFrame('detect');
+            this.lastFrameTimings = result.timings;
+            return result.faces;
+        }
+        
+        const start = performance.now();
+        const detections = await faceapi.detectAllFaces(
+            this.video, 
+            new faceapi.TinyFaceDetectorOptions()
+        ).withFaceLandmarks().withFaceDescriptors();
+        this.lastFrameTimings = { total: performance.now() - start };
+        
+        return detections.map(detection => ({
+            box: detection.detection.box,
+            landmarks: detection.landmarks.positions,
+            descriptor: detection.descriptor
+        }));
+    },
+    
+    _recordFrame: function() {
+        const now = performance.now();
+        this.frameTimestamps.push(now);
+        while (this.frameTimestamps.length && now - this.frameTimestamps[0] > 5000) {
+            this.frameTimestamps.shift();
+        }
+    },
+    
+    _achievedFps: function() {
+        const frames = this.frameTimestamps;
+        if (frames.length < 2) {
+            return 0;
+        }
+        return (frames.length - 1) * 1000 / (frames[frames.length - 1] - frames[0]);
+    },
+    
+    _drawFaces: function(faces) {
+        // Match the canvas to the displayed video and scale from video pixels
+        this._resizeCanvas();
+        const context = this.canvas.getContext('2d');
+        const scaleX = this.canvas.width / this.video.videoWidth;
+        const scaleY = this.canvas.height / this.video.videoHeight;
+        
+        context.strokeStyle = '#00FF00';
+        context.fillStyle = '#00FF00';
+        context.lineWidth = 2;
+        
+        faces.forEach(function(face) {
+            context.strokeRect(face.box.x * scaleX, face.box.y * scaleY,
+                face.box.width * scaleX, face.box.height * scaleY);
+            (face.landmarks || []).forEach(function(point) {
+                context.beginPath();
+                context.arc(point.x * scaleX, point.y * scaleY, 1.5, 0, 2 * Math.PI);
+                context.fill();
+            });
+        });
+    },
+    
     _startFaceStream: async function() {
         if (this.stream) {
             return Promise.resolve();
@@ -181,6 +422,8 @@ var FaceKioskMode = AbstractAction.extend({
         }
         
         this.detectRunning = true;
+        // Start in the active state; the scene goes idle once nothing happens
+        this.lastActivity = Date.now();
         this._showProcessingMessage(_t('Looking for your face...'));
         
         if (!this.video.srcObject && this.stream) {
@@ -212,43 +455,61 @@ var FaceKioskMode = AbstractAction.extend({
                 return;
             }
             
-            // Clear previous drawings
-            const context = this.canvas.getContext('2d');
-            context.clearRect(0, 0, this.canvas.width, this.canvas.height);
+            // Idle scene: a cheap motion check at a low rate until something moves
+            const idle = Date.now() - this.lastActivity > this.idleAfter;
+            if (this.detectionWorker && idle) {
+                const check = await this._runWorkerFrame('motion');
+                if (check.motion < this.motionThreshold) {
+                    this._expireFaceTrack();
+                    setTimeout(() => this._detectFace(), this.idleInterval);
+                    return;
+                }
+                this.lastActivity = Date.now();
+            }
+            
+            // Without a worker, keep the original main-thread pace
+            const nextDelay = this.detectionWorker ? this.activeInterval : 500;
             
             // Detect faces in video stream
-            const detections = await faceapi.detectAllFaces(
-                this.video, 
-                new faceapi.TinyFaceDetectorOptions()
-            ).withFaceLandmarks().withFaceDescriptors();
+            const faces = await this._detectFrame();
+            this._recordFrame();
             
             // Draw detections on canvas
-            const dims = faceapi.matchDimensions(this.canvas, this.video, true);
-            const resizedDetections = faceapi.resizeResults(detections, dims);
-            
-            faceapi.draw.drawDetections(this.canvas, resizedDetections);
-            faceapi.draw.drawFaceLandmarks(this.canvas, resizedDetections);
+            const context = this.canvas.getContext('2d');
+            context.clearRect(0, 0, this.canvas.width, this.canvas.height);
+            this._drawFaces(faces);
             
-            if (detections.length === 0) {
-                this._showWarningMessage(_t('No face detected. Please center your face in the camera.'));
+            if (faces.length === 0) {
+                this._expireFaceTrack();
+                this._showDetectionWarning(_t('No face detected. Please center your face in the camera.'));
                 // Try again
-                setTimeout(() => this._detectFace(), 500);
+                setTimeout(() => this._detectFace(), nextDelay);
                 return;
-            } else if (detections.length > 1) {
-                this._showWarningMessage(_t('Multiple faces detected. Please ensure only one face is visible.'));
+            }
+            
+            this.lastActivity = Date.now();
+            if (faces.length > 1) {
+                this._showDetectionWarning(_t('Multiple faces detected. Please ensure only one face is visible.'));
                 // Try again
-                setTimeout(() => this._detectFace(), 500);
+                setTimeout(() => this._detectFace(), nextDelay);
                 return;
             }
             
-            // Get the face descriptor
-            const descriptor = detections[0].descriptor;
+            const track = this._trackFace(faces[0]);
             
-            // Take a snapshot for verification
-            const snapshot = this._takeSnapshot();
+            // Submit only new faces; a tracked person keeps their result
+            if (!track.submitted && !this.verifyPending && Date.now() >= track.retryAt) {
+                track.submitted = true;
+                
+                // Only capture a face crop when the server stores attendance images
+                const snapshot = this.storeImages ? this._takeSnapshot(faces[0].box) : null;
+                
+                // Verify with server
+                this._verifyFace(track, snapshot);
+            }
             
-            // Verify with server
-            this._verifyFace(descriptor, snapshot);
+            // Keep tracking while the result is shown
+            setTimeout(() => this._detectFace(), nextDelay);
             
         } catch (error) {
             console.error('Error during face detection:', error);
@@ -257,36 +518,312 @@ var FaceKioskMode = AbstractAction.extend({
         }
     },
     
-    _takeSnapshot: function() {
+    /**
+     * Attach a detection to the current face track, or start a new track
+     * when the face is a different person or the previous one left.
+     */
+    _trackFace: function(face) {
+        const now = Date.now();
+        const box = face.box;
+        const track = this.faceTrack;
+        
+        if (track && now - track.lastSeen <= this.trackTimeout) {
+            // Identity is decided by the descriptor; box overlap confirms it
+            // is the same face moving, which lets a looser distance through
+            const distance = this._descriptorDistance(track.descriptor, face.descriptor);
+            const overlap = this._boxIou(track.box, box);
+            
+            if (distance <= this.trackDistanceThreshold &&
+                (overlap >= this.trackIouThreshold || distance <= this.trackDistanceThreshold * 0.66)) {
+                track.box = box;
+                track.lastSeen = now;
+                track.probe = face.descriptor;
+                return track;
+            }
+        }
+        
+        this.faceTrack = {
+            descriptor: face.descriptor,
+            // The latest frame's descriptor, which a retry is verified with
+            probe: face.descriptor,
+            box: box,
+            lastSeen: now,
+            submitted: false,
+            retryAt: 0,
+            result: null
+        };
+        return this.faceTrack;
+    },
+    
+    _expireFaceTrack: function() {
+        if (this.faceTrack && Date.now() - this.faceTrack.lastSeen > this.trackTimeout) {
+            this.faceTrack = null;
+        }
+    },
+    
+    _descriptorDistance: function(a, b) {
+        let sum = 0;
+        for (let i = 0; i < a.length; i++) {
+            const diff = a[i] - b[i];
+            sum += diff * diff;
+        }
+        return Math.sqrt(sum);
+    },
+    
+    _boxIou: function(a, b) {
+        const x1 = Math.max(a.x, b.x);
+        const y1 = Math.max(a.y, b.y);
+        const x2 = Math.min(a.x + a.width, b.x + b.width);
+        const y2 = Math.min(a.y + a.height, b.y + b.height);
+        const intersection = Math.max(0, x2 - x1) * Math.max(0, y2 - y1);
+        const union = a.width * a.height + b.width * b.height - intersection;
+        return union > 0 ? intersection / union : 0;
+    },
+    
+    _takeSnapshot: function(box) {
         if (!this.video || !this.video.videoWidth) {
             return null;
         }
         
+        // Crop around the detected face with a margin, clamped to the frame
+        const margin = 0.25;
+        const sx = Math.max(0, box.x - box.width * margin);
+        const sy = Math.max(0, box.y - box.height * margin);
+        const sw = Math.min(this.video.videoWidth - sx, box.width * (1 + 2 * margin));
+        const sh = Math.min(this.video.videoHeight - sy, box.height * (1 + 2 * margin));
+        
+        // Downscale so the longest side fits in snapshotMaxSize
+        const scale = Math.min(1, this.snapshotMaxSize / Math.max(sw, sh));
+        
         const canvas = document.createElement('canvas');
-        canvas.width = this.video.videoWidth;
-        canvas.height = this.video.videoHeight;
+        canvas.width = Math.round(sw * scale);
+        canvas.height = Math.round(sh * scale);
         
         const context = canvas.getContext('2d');
-        context.drawImage(this.video, 0, 0, canvas.width, canvas.height);
+        context.drawImage(this.video, sx, sy, sw, sh, 0, 0, canvas.width, canvas.height);
         
-        return canvas.toDataURL('image/jpeg', 0.8);
+        return canvas.toDataURL('image/jpeg', this.snapshotQuality);
     },
     
-    _verifyFace: function(descriptor, snapshot) {
+    _verifyFace: function(track, snapshot) {
         this._showProcessingMessage(_t('Verifying identity...'));
         this.retryAttempts = 0;
+        this.busyAttempts = 0;
+        this.verifyPending = true;
         
-        // Prepare data for API call
+        // Prepare data for API call. The UUID lets the server recognise the
+        // scan if it is replayed from the offline queue later on.
         const data = {
-            encoding: btoa(JSON.stringify(Array.from(descriptor))),
-            image: snapshot
+            uuid: faceEventQueue.newUuid(),
+            kiosk: this.deviceKey,
+            captured_at: Date.now(),
+            encoding: this._encodeDescriptor(track.probe, this.descriptorFormat),
+            format: this.descriptorFormat,
+            // Kiosk-side performance, recorded with the server trace
+            client_metrics: {
+                worker: !!this.detectionWorker,
+                fps: Math.round(this._achievedFps() * 10) / 10,
+                timings: this.lastFrameTimings
+            }
         };
+        if (snapshot) {
+            data.image = snapshot;
+        }
+        const claim = this._matchOnDevice(track.probe);
+        if (claim) {
+            data.claim = claim;
+        }
+        
+        // Older scans are still waiting: queue this one behind them so
+        // each employee's scans are applied in order
+        if (this.offlineQueueSize > 0) {
+            this._queueOfflineEvent(data, track);
+            return;
+        }
         
         // Implement retry logic
-        this._attemptVerification(data);
+        this._attemptVerification(data, track);
+    },
+    
+    /**
+     * Return ``{employee_id, score}`` when the on-device gallery holds an
+     * employee above the threshold, for the server to confirm.
+     */
+    _matchOnDevice: function(descriptor) {
+        if (!this.edgeGallery || !this.edgeGallery.generation) {
+            return null;
+        }
+        const result = faceEdgeGallery.match(this.edgeGallery, descriptor);
+        return result && result.score * 100 >= this.edgeThreshold ? result : null;
+    },
+    
+    /**
+     * Bring the on-device gallery up to date: from storage at startup,
+     * then with the changes since its generation, or in full once it is
+     * older than ``bundleMaxAge``.
+     */
+    _syncEdgeGallery: async function() {
+        clearTimeout(this.bundleTimer);
+        let delay = this.bundleRefresh * 1000;
+        try {
+            if (!this.edgeGallery) {
+                this.edgeGallery = await faceEdgeGallery.load(this.deviceKey);
+            }
+            const gallery = this.edgeGallery;
+            const full = !gallery.generation || Date.now() - gallery.fetchedAt > this.bundleMaxAge * 1000;
+            const signed = await this._rpc({
+                route: '/face_recognition/bundle',
+                params: {device_key: this.deviceKey, generation: full ? 0 : gallery.generation}
+            }, {shadow: true});
+            if (!signed.success) {
+                throw new Error(signed.message);
+            }
+            if (!full && gallery.publicKey !== signed.public_key) {
+                // The server signs with another key now: start over with a
+                // full bundle, which may pin it
+                gallery.generation = 0;
+                delay = 0;
+            } else {
+                const bundle = await faceEdgeGallery.verifyBundle(gallery, signed, full);
+                if (faceEdgeGallery.applyBundle(gallery, bundle, signed.public_key)) {
+                    await faceEdgeGallery.save(this.deviceKey, gallery);
+                } else {
+                    // A delta on another generation: fetch it all again
+                    gallery.generation = 0;
+                    delay = 0;
+                }
+            }
+        } catch (error) {
+            console.warn('On-device gallery not updated:', error);
+        }
+        this.bundleTimer = setTimeout(() => this._syncEdgeGallery(), delay);
+    },
+    
+    /**
+     * Keep a scan the server could not be reached for, to replay later.
+     * Snapshots are not kept, which keeps the queue small.
+     */
+    _queueOfflineEvent: async function(data, track) {
+        try {
+            await faceEventQueue.push({
+                uuid: data.uuid,
+                captured_at: data.captured_at,
+                encoding: data.encoding,
+                format: data.format
+            });
+            this.offlineQueueSize++;
+            track.result = {success: false, queued: true};
+            this._showDetectionWarning(_t('Server unreachable. Your scan was saved and will be recorded when the connection is back.'));
+            this.resultHoldUntil = Date.now() + 5000;
+        } catch (error) {
+            console.error('Error saving offline scan:', error);
+            this._showErrorMessage(_t('Error connecting to server after several attempts. Please try again.'));
+        }
+        this.verifyPending = false;
+        this._scheduleOfflineFlush();
+    },
+    
+    _scheduleOfflineFlush: function() {
+        if (!this.offlineFlushTimer) {
+            this.offlineFlushTimer = setTimeout(() => {
+                this.offlineFlushTimer = null;
+                this._flushOfflineEvents();
+            }, this.offlineFlushInterval);
+        }
     },
     
-    _attemptVerification: function(data) {
+    /**
+     * Replay queued scans oldest first, one batch per request, and drop
+     * every event the server answered for. Stops at the first failure
+     * and tries again later.
+     */
+    _flushOfflineEvents: async function() {
+        if (this.offlineFlushing) {
+            return;
+        }
+        this.offlineFlushing = true;
+        try {
+            for (;;) {
+                const events = await faceEventQueue.peek(this.offlineBatchSize);
+                if (!events.length) {
+                    break;
+                }
+                const result = await this._rpc({
+                    route: '/face_recognition/verify/bulk',
+                    params: {events: events, kiosk: this.deviceKey}
+                }, {shadow: true});
+                if (!result.success) {
+                    throw new Error(result.message);
+                }
+                await faceEventQueue.remove(result.results.map(event => event.uuid));
+                console.log('Replayed ' + result.results.length + ' offline face scans');
+                if (result.results.length < events.length) {
+                    // Events without a usable UUID get no answer; drop them too
+                    await faceEventQueue.remove(events.map(event => event.uuid));
+                }
+            }
+        } catch (error) {
+            console.warn('Offline face scans not replayed yet:', error);
+            this._scheduleOfflineFlush();
+        } finally {
+            this.offlineFlushing = false;
+        }
+        this.offlineQueueSize = await faceEventQueue.size().catch(() => 0);
+    },
+    
+    /**
+     * Encode a descriptor as base64 of its raw little-endian float32 or
+     * float16 values (512 / 256 bytes instead of ~2.5 KB of JSON text).
+     */
+    _encodeDescriptor: function(descriptor, format) {
+        const half = format === 'f16';
+        const itemSize = half ? 2 : 4;
+        const view = new DataView(new ArrayBuffer(descriptor.length * itemSize));
+        
+        for (let i = 0; i < descriptor.length; i++) {
+            if (half) {
+                view.setUint16(i * 2, this._toFloat16Bits(descriptor[i]), true);
+            } else {
+                view.setFloat32(i * 4, descriptor[i], true);
+            }
+        }
+        
+        const bytes = new Uint8Array(view.buffer);
+        let binary = '';
+        for (let i = 0; i < bytes.length; i++) {
+            binary += String.fromCharCode(bytes[i]);
+        }
+        return btoa(binary);
+    },
+    
+    _toFloat16Bits: function(value) {
+        // Round-to-nearest float32 -> IEEE 754 half precision conversion
+        const floatView = new Float32Array(1);
+        const intView = new Uint32Array(floatView.buffer);
+        floatView[0] = value;
+        const x = intView[0];
+        
+        const sign = (x >>> 16) & 0x8000;
+        let exponent = ((x >>> 23) & 0xff) - 127 + 15;
+        let mantissa = x & 0x7fffff;
+        
+        if (exponent >= 0x1f) {
+            // Overflow (descriptor values never get here) saturates to infinity
+            return sign | 0x7c00;
+        }
+        if (exponent <= 0) {
+            if (exponent < -10) {
+                return sign;
+            }
+            // Subnormal half
+            mantissa = (mantissa | 0x800000) >> (1 - exponent);
+            return sign | ((mantissa + 0x1000) >> 13);
+        }
+        // Rounding may carry into the exponent, which is the correct result
+        return sign | ((exponent << 10) + ((mantissa + 0x1000) >> 13));
+    },
+    
+    _attemptVerification: function(data, track) {
         var self = this;
         
         // Call server to verify face
@@ -296,16 +833,26 @@ var FaceKioskMode = AbstractAction.extend({
                 face_data: data
             },
         }).then(function(result) {
-            self.detectRunning = false;
+            if (result.busy) {
+                self._retryWhenBusy(data, track, result.retry_after);
+                return;
+            }
+            self.verifyPending = false;
             
             if (result.success) {
+                // The result stands for as long as the person stays tracked
+                track.result = result;
+                
                 // Reset retry counter on success
                 self.retryAttempts = 0;
                 
                 // Successfully recognized
                 self._showAttendanceSuccess(result);
             } else {
-                // No match found
+                // No match found, perhaps from a blurred or turned frame:
+                // try again with a later one
+                track.submitted = false;
+                track.retryAt = Date.now() + self.trackRetryDelay;
                 self._showAttendanceError(result);
             }
         }).catch(function(error) {
@@ -318,21 +865,42 @@ var FaceKioskMode = AbstractAction.extend({
                 // Show retry message
                 self._showProcessingMessage(_t('Connection issue. Retrying... (') + self.retryAttempts + '/' + self.maxRetries + ')');
                 
-                // Implement exponential backoff
-                const delay = self.retryDelay * Math.pow(1.5, self.retryAttempts - 1);
+                // Exponential backoff, jittered so kiosks do not retry in step
+                const delay = self._jitter(self.retryDelay * Math.pow(1.5, self.retryAttempts - 1));
                 
                 // Retry after delay
                 setTimeout(function() {
-                    self._attemptVerification(data);
+                    self._attemptVerification(data, track);
                 }, delay);
             } else {
-                // Max retries reached, show error
-                self._showErrorMessage(_t('Error connecting to server after several attempts. Please try again.'));
-                self.detectRunning = false;
+                // Max retries reached: keep the scan for later replay
+                self._queueOfflineEvent(data, track);
             }
         });
     },
     
+    /**
+     * The server shed the scan: send it again after the delay it asked
+     * for, doubled on each attempt and jittered so that the kiosks it
+     * turned away do not all come back at once. A scan still shed after
+     * a few attempts is kept for the bulk replay.
+     */
+    _retryWhenBusy: function(data, track, retryAfter) {
+        this.busyAttempts++;
+        if (this.busyAttempts > this.maxBusyRetries) {
+            this._queueOfflineEvent(data, track);
+            return;
+        }
+        this._showProcessingMessage(_t('Server busy. Retrying...'));
+        const delay = this._jitter((retryAfter || this.retryDelay) * Math.pow(2, this.busyAttempts - 1));
+        setTimeout(() => this._attemptVerification(data, track), delay);
+    },
+    
+    _jitter: function(delay) {
+        // Anywhere between half and one and a half times the delay
+        return delay * (0.5 + Math.random());
+    },
+    
     registerFace: function() {
         // This function should only be available for administrators in the employee form
         // It will be handled in a separate wizard
@@ -344,6 +912,7 @@ var FaceKioskMode = AbstractAction.extend({
         const name = result.name;
         
         this._hideProcessingMessage();
+        this.resultHoldUntil = Date.now() + 5000;
         
         // Update UI with check-in/out message
         this.$('.o_face_kiosk_clock_status').html(
@@ -366,10 +935,19 @@ var FaceKioskMode = AbstractAction.extend({
             ? _t(' (Processed in ') + (result.processing_time * 1000).toFixed(0) + 'ms)' 
             : '';
         
+        // A repeated scan (e.g. by a second kiosk) did not toggle attendance
+        let actionText;
+        if (result.repeated) {
+            actionText = action === 'check_in' ?
+                _t('You are already checked in.') :
+                _t('You are already checked out.');
+        } else {
+            actionText = action === 'check_in' ?
+                _t('You have been successfully checked in!') :
+                _t('You have been successfully checked out!');
+        }
         this.$('.o_face_kiosk_message').html(
-            action === 'check_in' ? 
-            _t('You have been successfully checked in!') + '<br/>' + confidenceText + processingText : 
-            _t('You have been successfully checked out!') + '<br/>' + confidenceText + processingText
+            actionText + '<br/>' + confidenceText + processingText
         );
         
         // Show the success message for 5 seconds then reset
@@ -392,6 +970,7 @@ var FaceKioskMode = AbstractAction.extend({
         
         const confidence = result.confidence ? result.confidence.toFixed(2) + '%' : 'N/A';
         const message = result.message || _t('Unknown error');
+        this.resultHoldUntil = Date.now() + 5000;
         
         this.$('.o_face_kiosk_clock_status').text(_t('Recognition Failed'));
         this.$('.o_face_kiosk_message').removeClass('alert-success');
@@ -422,6 +1001,13 @@ var FaceKioskMode = AbstractAction.extend({
         this.$('.o_face_kiosk_message').text(message);
     },
     
+    _showDetectionWarning: function(message) {
+        // Don't overwrite a recognition result while it is displayed
+        if (Date.now() >= this.resultHoldUntil) {
+            this._showWarningMessage(message);
+        }
+    },
+    
     _showWarningMessage: function(message) {
         this.$('.o_face_kiosk_message').removeClass('alert-success alert-danger');
         this.$('.o_face_kiosk_message').addClass('alert-warning');
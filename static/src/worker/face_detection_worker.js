@@ -0,0 +1,174 @@
+/**
+ * Face detection worker for the attendance kiosk.
+ *
+ * Runs face-api.js off the UI thread. The kiosk transfers ImageBitmaps of
+ * the video stream and gets back plain face boxes, landmarks and
+ * descriptors, with per-stage timings. Two kinds of frames are handled:
+ *
+ * - 'motion': a tiny bitmap compared with the previous one, used as a
+ *   cheap check while the scene is idle;
+ * - 'detect': full detection; landmarks and descriptor are only computed
+ *   when exactly one face is present, as only those frames are verified.
+ *
+ * Messages in:  {type: 'init', library, nets}
+ *               {type: 'frame', id, mode, bitmap}
+ * Messages out: {type: 'ready'} | {type: 'error', message}
+ *               {type: 'result', id, mode, motion, faces, timings}
+ */
+'use strict';
+
+// Pixel difference (0-255) above which a motion frame counts as changed
+const MOTION_PIXEL_DELTA = 25;
+
+let detectorOptions = null;
+let frameCanvas = null;
+let motionCanvas = null;
+let previousMotionFrame = null;
+
+class WorkerMediaPlaceholder {}
+
+function setupEnvironment() {
+    // face-api.js only knows DOM and Node environments; map it onto
+    // OffscreenCanvas. Inputs are always OffscreenCanvases.
+    faceapi.env.setEnv({
+        Canvas: OffscreenCanvas,
+        CanvasRenderingContext2D: OffscreenCanvasRenderingContext2D,
+        Image: WorkerMediaPlaceholder,
+        ImageData: ImageData,
+        Video: WorkerMediaPlaceholder,
+        createCanvasElement: () => new OffscreenCanvas(1, 1),
+        createImageElement: () => { throw new Error('createImageElement - not available in a worker'); },
+        createVideoElement: () => { throw new Error('createVideoElement - not available in a worker'); },
+        fetch: self.fetch.bind(self),
+        readFile: () => { throw new Error('readFile - filesystem not available in a worker'); },
+    });
+}
+
+async function init(message) {
+    const libraryUrl = URL.createObjectURL(new Blob([message.library], { type: 'text/javascript' }));
+    importScripts(libraryUrl);
+    URL.revokeObjectURL(libraryUrl);
+
+    setupEnvironment();
+
+    await Promise.all(Object.keys(message.nets).map(async function (name) {
+        const net = message.nets[name];
+        const loadWeights = faceapi.tf.io.weightsLoaderFactory(() => Promise.resolve(net.buffers));
+        faceapi.nets[name].loadFromWeightMap(await loadWeights(net.manifest, ''));
+    }));
+
+    detectorOptions = new faceapi.TinyFaceDetectorOptions();
+    frameCanvas = new OffscreenCanvas(1, 1);
+    motionCanvas = new OffscreenCanvas(1, 1);
+}
+
+function measureMotion(bitmap) {
+    motionCanvas.width = bitmap.width;
+    motionCanvas.height = bitmap.height;
+    const context = motionCanvas.getContext('2d', { willReadFrequently: true });
+    context.drawImage(bitmap, 0, 0);
+    const pixels = context.getImageData(0, 0, bitmap.width, bitmap.height).data;
+
+    // Green channel is a good enough luminance proxy at this resolution
+    const frame = new Uint8Array(pixels.length / 4);
+    for (let i = 0; i < frame.length; i++) {
+        frame[i] = pixels[i * 4 + 1];
+    }
+
+    let changed = 0;
+    if (previousMotionFrame && previousMotionFrame.length === frame.length) {
+        for (let i = 0; i < frame.length; i++) {
+            if (Math.abs(frame[i] - previousMotionFrame[i]) > MOTION_PIXEL_DELTA) {
+                changed++;
+            }
+        }
+    }
+    previousMotionFrame = frame;
+    // Fraction of pixels that changed since the previous motion frame
+    return changed / frame.length;
+}
+
+async function detectFaces(bitmap, timings) {
+    let start = performance.now();
+    frameCanvas.width = bitmap.width;
+    frameCanvas.height = bitmap.height;
+    frameCanvas.getContext('2d').drawImage(bitmap, 0, 0);
+    timings.draw = performance.now() - start;
+
+    start = performance.now();
+    const detections = await faceapi.detectAllFaces(frameCanvas, detectorOptions);
+    timings.detect = performance.now() - start;
+
+    const faces = detections.map(detection => ({
+        box: {
+            x: detection.box.x,
+            y: detection.box.y,
+            width: detection.box.width,
+            height: detection.box.height,
+        },
+        score: detection.score,
+        landmarks: null,
+        descriptor: null,
+    }));
+    if (faces.length !== 1) {
+        return faces;
+    }
+
+    // Same steps as withFaceLandmarks().withFaceDescriptors(), without
+    // detecting a second time
+    start = performance.now();
+    const [faceCanvas] = await faceapi.extractFaces(frameCanvas, [detections[0]]);
+    const landmarks = (await faceapi.detectFaceLandmarks(faceCanvas))
+        .shiftBy(detections[0].box.x, detections[0].box.y);
+    timings.landmarks = performance.now() - start;
+
+    start = performance.now();
+    const [alignedCanvas] = await faceapi.extractFaces(
+        frameCanvas, [landmarks.align(null, { useDlibAlignment: true })]);
+    faces[0].descriptor = await faceapi.computeFaceDescriptor(alignedCanvas);
+    faces[0].landmarks = landmarks.positions.map(point => ({ x: point.x, y: point.y }));
+    timings.descriptor = performance.now() - start;
+
+    return faces;
+}
+
+async function processFrame(message) {
+    const bitmap = message.bitmap;
+    const timings = {};
+    const result = { type: 'result', id: message.id, mode: message.mode, motion: 0, faces: [], timings: timings };
+
+    try {
+        if (message.mode === 'motion') {
+            const start = performance.now();
+            result.motion = measureMotion(bitmap);
+            timings.motion = performance.now() - start;
+        } else {
+            // Motion frames are only sent while idle; a baseline from
+            // before this active period would read as a wake-up
+            previousMotionFrame = null;
+            result.faces = await detectFaces(bitmap, timings);
+        }
+    } finally {
+        bitmap.close();
+    }
+
+    const transfer = result.faces
+        .filter(face => face.descriptor)
+        .map(face => face.descriptor.buffer);
+    self.postMessage(result, transfer);
+}
+
+self.onmessage = function (event) {
+    const message = event.data;
+    let task;
+    if (message.type === 'init') {
+        task = init(message).then(() => self.postMessage({ type: 'ready' }));
+    } else if (message.type === 'frame') {
+        task = processFrame(message);
+    } else {
+        return;
+    }
+    task.catch(function (error) {
+        self.postMessage({ type: 'error', id: message.id, message: error.message || String(error) });
+    });
+};
@@ -1,2 +1,18 @@
 # -*- coding: utf-8 -*-
 from . import logging_utils
+from . import tracing
+from . import descriptor_codec
+from . import face_matching
+from . import sharded_matching
+from . import matching_service
+from . import gallery_cache
+from . import face_import
+from . import identity_audit
+from . import snapshot_delta
+from . import probe_memo
+from . import tiered_gallery
+from . import admission
+from . import read_replica
+from . import gallery_bundle
+from . import profiling
+from . import thumbnail_cache
@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+"""Admission control of the verify requests
+
+Two layers:
+
+- ``AdmissionControl`` counts the requests of one process, with a FIFO
+  wait queue. It is what protects a threaded server, where one process
+  serves every request.
+- ``SharedSlots`` counts them across processes, as Postgres advisory
+  locks, so it protects a prefork server, whose workers serve one request
+  at a time each and never see more than one in ``AdmissionControl``,
+  and servers on several hosts sharing a database. Its limits are for
+  all of them together, the worker's limits times the workers by
+  default. Waiters block on a slot in Postgres rather than polling.
+"""
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.errors
+
+from odoo.sql_db import connection_info_for
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+# Verify requests matched at once by one worker, waiting for a slot, and
+# in flight from one kiosk. ``face_recognition_verify_concurrency = 0``
+# in the server config disables admission control.
+DEFAULT_VERIFY_CONCURRENCY = 4
+DEFAULT_VERIFY_QUEUE = 16
+DEFAULT_VERIFY_PER_KIOSK = 2
+# Seconds a request waits for a slot before it is shed
+DEFAULT_VERIFY_QUEUE_WAIT = 2.0
+
+# Bounds of the delay a shed kiosk is told to wait before retrying
+MIN_RETRY_AFTER_MS = 250
+MAX_RETRY_AFTER_MS = 10000
+
+# A worker that shed a request this recently reports a warning
+SHED_WARNING_SECONDS = 5 * 60
+
+# Advisory lock namespaces (first key) of the shared slots, kiosk slots
+# and wait queue places
+SLOT_LOCK_NAMESPACE = 0x46520001
+KIOSK_LOCK_NAMESPACE = 0x46520002
+QUEUE_LOCK_NAMESPACE = 0x46520003
+# Kiosk slots per kiosk key
+MAX_KIOSK_SLOTS = 16
+# Seconds before a database the slots could not be reached on is tried again
+SHARED_RETRY_INTERVAL = 30.0
+
+
+class ServerBusy(Exception):
+    """A request was shed; ``retry_after`` is the suggested delay in ms"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter(object):
+    __slots__ = ('event', 'granted')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class AdmissionControl(object):
+    """Concurrency limits with a bounded FIFO wait queue
+
+    At most ``max_active`` requests run at once, ``max_queued`` more wait
+    up to ``max_wait`` seconds for a slot, and one kiosk has at most
+    ``max_per_kiosk`` requests running or waiting. Anything beyond is shed
+    at once with ``ServerBusy``, instead of piling up until the kiosk
+    times out and retries. A finishing request hands its slot to the
+    oldest waiter.
+    """
+
+    def __init__(self, max_active=DEFAULT_VERIFY_CONCURRENCY, max_queued=DEFAULT_VERIFY_QUEUE,
+                 max_per_kiosk=DEFAULT_VERIFY_PER_KIOSK, max_wait=DEFAULT_VERIFY_QUEUE_WAIT):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.max_per_kiosk = max_per_kiosk
+        self.max_wait = max_wait
+        self.active = 0
+        self.admitted = 0
+        self.max_depth = 0
+        self.shed = Counter()
+        self.last_shed = None
+        # Moving average of the time a request holds its slot
+        self.service_time = 0.2
+        self.wait_time = 0.0
+        self._queue = deque()
+        self._kiosks = Counter()
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return self.max_active > 0
+
+    @contextmanager
+    def admit(self, kiosk, shared=None):
+        """Hold a slot for the duration of the block, or raise ``ServerBusy``
+
+        With ``shared``, a ``SharedSlots``, the request also needs one of
+        its slots, counted across every process.
+        """
+        if not self:
+            yield
+            return
+        self._acquire(kiosk)
+        start = time.perf_counter()
+        try:
+            held = None
+            if shared is not None:
+                try:
+                    held = shared.acquire(kiosk)
+                except ServerBusy as busy:
+                    with self._lock:
+                        self.shed[busy.reason] += 1
+                        self.last_shed = time.time()
+                    raise
+            try:
+                yield
+            finally:
+                if held:
+                    shared.release(held)
+        finally:
+            self._release(kiosk, time.perf_counter() - start)
+
+    def _acquire(self, kiosk):
+        with self._lock:
+            if self.max_per_kiosk and self._kiosks[kiosk] >= self.max_per_kiosk:
+                self._shed('kiosk_limit')
+            if self.active < self.max_active and not self._queue:
+                self.active += 1
+                self._kiosks[kiosk] += 1
+                self.admitted += 1
+                return
+            if len(self._queue) >= self.max_queued:
+                self._shed('queue_full')
+            waiter = _Waiter()
+            self._queue.append(waiter)
+            self._kiosks[kiosk] += 1
+            self.max_depth = max(self.max_depth, len(self._queue))
+
+        start = time.perf_counter()
+        waiter.event.wait(self.max_wait)
+        with self._lock:
+            if waiter.granted:
+                self.admitted += 1
+                self.wait_time = 0.8 * self.wait_time + 0.2 * (time.perf_counter() - start)
+                return
+            self._queue.remove(waiter)
+            self._forget(kiosk)
+            self._shed('timeout')
+
+    def _release(self, kiosk, seconds):
+        with self._lock:
+            self.service_time = 0.8 * self.service_time + 0.2 * seconds
+            self._forget(kiosk)
+            if self._queue:
+                # The slot goes to the oldest waiter rather than back to the pool
+                waiter = self._queue.popleft()
+                waiter.granted = True
+                waiter.event.set()
+            else:
+                self.active -= 1
+
+    def _forget(self, kiosk):
+        self._kiosks[kiosk] -= 1
+        if self._kiosks[kiosk] <= 0:
+            del self._kiosks[kiosk]
+
+    def _shed(self, reason):
+        """Count a shed request and raise; called with the lock held"""
+        self.shed[reason] += 1
+        self.last_shed = time.time()
+        # Time for the requests ahead to drain through the slots
+        backlog = (len(self._queue) + self.active) * self.service_time / max(self.max_active, 1)
+        raise ServerBusy(reason, _retry_after(backlog))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': bool(self),
+                'max_active': self.max_active,
+                'max_queued': self.max_queued,
+                'max_per_kiosk': self.max_per_kiosk,
+                'max_wait_seconds': self.max_wait,
+                'active': self.active,
+                'queue_depth': len(self._queue),
+                'max_queue_depth': self.max_depth,
+                'admitted': self.admitted,
+                'shed': sum(self.shed.values()),
+                'shed_by_reason': dict(self.shed),
+                'last_shed': self.last_shed,
+                'avg_service_ms': self.service_time * 1000,
+                'avg_wait_ms': self.wait_time * 1000,
+            }
+
+
+def _retry_after(seconds):
+    return int(min(max(seconds * 1000, MIN_RETRY_AFTER_MS), MAX_RETRY_AFTER_MS))
+
+
+class SharedSlots(object):
+    """Verify slots shared by every process using a database
+
+    Each slot, kiosk slot and wait queue place is a session-level
+    advisory lock. A request holding slots has a connection of this
+    process to itself, opened for the purpose in autocommit: the
+    request's own transaction may be aborted by the time the slots are
+    released, and a session may take a lock it already holds, so two
+    requests of one process must not share one. Connections go back to a
+    pool once released, and a process that dies closes them, which
+    releases their locks.
+
+    A request finding every slot taken takes a wait queue place, then
+    blocks on the slot of that place until it is free or the session's
+    ``lock_timeout`` of ``max_wait`` expires.
+    """
+
+    def __init__(self, dbname, max_active, max_queued, max_per_kiosk, max_wait):
+        self.dbname = dbname
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.max_per_kiosk = min(max_per_kiosk, MAX_KIOSK_SLOTS)
+        self.max_wait = max_wait
+        self.errors = 0
+        self.last_error = None
+        self._pid = None
+        self._down_until = 0.0
+        self._idle = []
+        self._held = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        with self._lock:
+            # Connections inherited from the parent process are not ours to use
+            if self._pid != os.getpid():
+                self._idle = []
+                self._held = 0
+                self._pid = os.getpid()
+            if self._idle:
+                return self._idle.pop()
+        _dsn, connection_info = connection_info_for(self.dbname)
+        cnx = psycopg2.connect(application_name='odoo-face-recognition-admission', **connection_info)
+        cnx.autocommit = True
+        with cnx.cursor() as cr:
+            cr.execute("SET lock_timeout = %s", (max(int(self.max_wait * 1000), 1),))
+        return cnx
+
+    def _try_lock(self, cr, namespace, keys):
+        """Take the first free lock of ``keys`` and return it, or None"""
+        for key in keys:
+            cr.execute("SELECT pg_try_advisory_lock(%s, %s)", (namespace, key))
+            if cr.fetchone()[0]:
+                return (namespace, key)
+        return None
+
+    def _wait_lock(self, cr, lock):
+        """Block until ``lock`` is taken and return it, or None on lock timeout"""
+        try:
+            cr.execute("SELECT pg_advisory_lock(%s, %s)", lock)
+        except psycopg2.errors.LockNotAvailable:
+            return None
+        return lock
+
+    def acquire(self, kiosk):
+        """Return the connection and locks of a slot, or raise ``ServerBusy``
+
+        Returns None when the database cannot be reached: the request is
+        then only limited by this process.
+        """
+        if time.monotonic() < self._down_until:
+            return None
+        cnx = None
+        locks = []
+        try:
+            cnx = self._connect()
+            with cnx.cursor() as cr:
+                if self.max_per_kiosk:
+                    base = (zlib.crc32(str(kiosk).encode('utf-8')) & 0x7ffffff) * MAX_KIOSK_SLOTS
+                    lock = self._try_lock(cr, KIOSK_LOCK_NAMESPACE, range(base, base + self.max_per_kiosk))
+                    if lock is None:
+                        raise ServerBusy('kiosk_limit', _retry_after(0))
+                    locks.append(lock)
+                slot = self._try_lock(cr, SLOT_LOCK_NAMESPACE, range(self.max_active))
+                if slot is None:
+                    place = self._try_lock(cr, QUEUE_LOCK_NAMESPACE, range(self.max_queued))
+                    if place is None:
+                        raise ServerBusy('queue_full', _retry_after(self.max_wait))
+                    try:
+                        # Waiters spread over the slots by queue place
+                        slot = self._wait_lock(cr, (SLOT_LOCK_NAMESPACE, place[1] % self.max_active))
+                    finally:
+                        cr.execute("SELECT pg_advisory_unlock(%s, %s)", place)
+                    if slot is None:
+                        raise ServerBusy('timeout', _retry_after(self.max_wait))
+                locks.append(slot)
+            with self._lock:
+                self._held += 1
+            return cnx, locks
+        except psycopg2.Error as e:
+            self.errors += 1
+            self.last_error = str(e).strip()
+            self._down_until = time.monotonic() + SHARED_RETRY_INTERVAL
+            _logger.warning("Shared verify slots unavailable, limiting this worker only for %d s: %s",
+                            SHARED_RETRY_INTERVAL, self.last_error)
+            if cnx is not None:
+                # Closing the connection releases whatever it still holds
+                cnx.close()
+            return None
+        except ServerBusy:
+            self._unlock(cnx, locks)
+            raise
+
+    def release(self, held):
+        cnx, locks = held
+        with self._lock:
+            self._held -= 1
+        self._unlock(cnx, locks)
+
+    def _unlock(self, cnx, locks):
+        """Release ``locks`` and put the connection back in the pool"""
+        try:
+            with cnx.cursor() as cr:
+                for lock in locks:
+                    cr.execute("SELECT pg_advisory_unlock(%s, %s)", lock)
+        except psycopg2.Error as e:
+            # Closing the connection releases whatever it still holds
+            _logger.warning("Could not release shared verify slots: %s", e)
+            cnx.close()
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                self._idle.append(cnx)
+
+    def status(self):
+        return {
+            'enabled': True,
+            'available': time.monotonic() >= self._down_until,
+            'max_active': self.max_active,
+            'max_queued': self.max_queued,
+            'held': self._held,
+            'errors': self.errors,
+            'last_error': self.last_error,
+        }
+
+
+def _config_number(key, default, cast):
+    try:
+        return cast(config.get(key, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# Shared by every verify request of this worker
+verify_admission = AdmissionControl(
+    max_active=_config_number('face_recognition_verify_concurrency', DEFAULT_VERIFY_CONCURRENCY, int),
+    max_queued=_config_number('face_recognition_verify_queue', DEFAULT_VERIFY_QUEUE, int),
+    max_per_kiosk=_config_number('face_recognition_verify_per_kiosk', DEFAULT_VERIFY_PER_KIOSK, int),
+    max_wait=_config_number('face_recognition_verify_queue_wait', DEFAULT_VERIFY_QUEUE_WAIT, float),
+)
+
+
+# Limits of the shared slots, across every worker and host using a
+# database: by default, the worker's limits times the workers of this
+# server. Servers on several hosts sharing a database should set them.
+_server_workers = max(_config_number('workers', 0, int), 1)
+shared_verify_concurrency = _config_number(
+    'face_recognition_verify_shared_concurrency', verify_admission.max_active * _server_workers, int)
+shared_verify_queue = _config_number(
+    'face_recognition_verify_shared_queue', verify_admission.max_queued * _server_workers, int)
+
+_shared_slots = {}
+_shared_slots_lock = threading.Lock()
+
+
+def get_shared_slots(dbname):
+    """Return the shared verify slots of ``dbname``
+
+    None when admission control is disabled.
+    """
+    if not verify_admission:
+        return None
+    with _shared_slots_lock:
+        slots = _shared_slots.get(dbname)
+        if slots is None:
+            slots = _shared_slots[dbname] = SharedSlots(
+                dbname, shared_verify_concurrency, shared_verify_queue,
+                verify_admission.max_per_kiosk, verify_admission.max_wait)
+        return slots
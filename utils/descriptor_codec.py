@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import base64
+import binascii
+import json
+
+import numpy as np
+
+# face-api.js descriptors are 128 float32 values
+DESCRIPTOR_SIZE = 128
+
+# Wire format tags sent by the kiosk in ``face_data['format']``.
+# 'json' is the legacy base64(JSON array) format and the default when no
+# tag is present; 'f32' / 'f16' are base64 of the raw little-endian values.
+FORMAT_JSON = 'json'
+FORMAT_FLOAT32 = 'f32'
+FORMAT_FLOAT16 = 'f16'
+
+_BINARY_DTYPES = {
+    FORMAT_FLOAT32: np.dtype('<f4'),
+    FORMAT_FLOAT16: np.dtype('<f2'),
+}
+
+
+def decode_face_descriptor(encoded, fmt=None):
+    """Decode a probe descriptor received from the kiosk
+
+    Binary formats are read with ``np.frombuffer`` straight from the
+    base64-decoded bytes; float16 payloads are widened to float32.
+    Returns a 1-d float32 array, raises ``ValueError`` on malformed input.
+    """
+    fmt = fmt or FORMAT_JSON
+
+    if fmt == FORMAT_JSON:
+        values = json.loads(base64.b64decode(encoded).decode('utf-8'))
+        try:
+            descriptor = np.asarray(values, dtype=np.float32)
+        except TypeError:
+            raise ValueError("Face descriptor must be a flat list of numbers")
+        if descriptor.ndim != 1:
+            raise ValueError("Face descriptor must be a flat list of numbers")
+        if len(descriptor) != DESCRIPTOR_SIZE:
+            raise ValueError("Expected %d values for a face descriptor, got %d" % (
+                DESCRIPTOR_SIZE, len(descriptor)))
+        if not np.isfinite(descriptor).all():
+            raise ValueError("Face descriptor contains non-finite values")
+        return descriptor
+
+    dtype = _BINARY_DTYPES.get(fmt)
+    if dtype is None:
+        raise ValueError("Unknown face descriptor format: %s" % fmt)
+
+    try:
+        raw = base64.b64decode(encoded, validate=True)
+    except binascii.Error as e:
+        raise ValueError("Invalid base64 face descriptor: %s" % e)
+
+    if len(raw) != DESCRIPTOR_SIZE * dtype.itemsize:
+        raise ValueError("Expected %d bytes for a %s descriptor, got %d" % (
+            DESCRIPTOR_SIZE * dtype.itemsize, fmt, len(raw)))
+
+    descriptor = np.frombuffer(raw, dtype=dtype)
+    if dtype != np.float32:
+        descriptor = descriptor.astype(np.float32)
+    if not np.isfinite(descriptor).all():
+        raise ValueError("Face descriptor contains non-finite values")
+    return descriptor
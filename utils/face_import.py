@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+import csv
+import io
+import json
+import os
+import zipfile
+
+import numpy as np
+
+from .descriptor_codec import DESCRIPTOR_SIZE, decode_face_descriptor
+
+# Refuse archives that expand to more than this, whatever they claim
+MAX_IMPORT_BYTES = 1024 * 1024 * 1024
+
+# Sanity bounds on a template's Euclidean norm; face-api.js descriptors
+# sit around 1, a zero or huge vector is a broken export
+MIN_TEMPLATE_NORM = 0.1
+MAX_TEMPLATE_NORM = 10.0
+
+# Column holding the employee identifier in import CSV files
+EMPLOYEE_COLUMN = 'employee'
+
+
+class FaceImportRows(object):
+    """Templates read from an import file, one row per template
+
+    ``descriptors`` holds one DESCRIPTOR_SIZE float32 vector per template,
+    aligned with ``identifiers`` and ``rows`` (a "file:line" label for the
+    error report). Rows that could not be decoded are left out and listed in
+    ``errors`` as ``{'row', 'employee', 'message'}``.
+    """
+
+    def __init__(self):
+        self.identifiers = []
+        self.rows = []
+        self.descriptors = []
+        self.errors = []
+
+    def __len__(self):
+        return len(self.identifiers)
+
+    def add(self, row, identifier, descriptor):
+        self.rows.append(row)
+        self.identifiers.append(identifier)
+        self.descriptors.append(descriptor)
+
+    def add_error(self, row, identifier, message):
+        self.errors.append({'row': row, 'employee': identifier, 'message': message})
+
+    def as_matrix(self):
+        """Stack the templates into one (n, DESCRIPTOR_SIZE) float32 matrix"""
+        if not self.descriptors:
+            return np.empty((0, DESCRIPTOR_SIZE), dtype=np.float32)
+        return np.vstack(self.descriptors).astype(np.float32, copy=False)
+
+
+def _parse_descriptor_text(text, fmt=None):
+    """Read a CSV descriptor cell: a JSON array, or base64 in ``fmt``"""
+    text = text.strip()
+    if text.startswith('['):
+        descriptor = np.asarray(json.loads(text), dtype=np.float32)
+    else:
+        descriptor = decode_face_descriptor(text, fmt or None)
+    if descriptor.shape != (DESCRIPTOR_SIZE,):
+        raise ValueError("Expected %d values, got %d" % (DESCRIPTOR_SIZE, descriptor.size))
+    return descriptor
+
+
+def _read_csv(rows, text, source):
+    """Add the templates of one CSV file
+
+    The file has a header with an ``employee`` column and either a
+    ``descriptor`` column (JSON array, or base64 tagged by an optional
+    ``format`` column as sent by the kiosk) or DESCRIPTOR_SIZE numeric
+    columns. Rows of numeric columns are converted in one pass.
+    """
+    reader = csv.reader(io.StringIO(text))
+    header = [name.strip().lower() for name in next(reader, [])]
+    if EMPLOYEE_COLUMN not in header:
+        rows.add_error(source, '', "Missing '%s' column" % EMPLOYEE_COLUMN)
+        return
+    employee_index = header.index(EMPLOYEE_COLUMN)
+    descriptor_index = header.index('descriptor') if 'descriptor' in header else None
+    format_index = header.index('format') if 'format' in header else None
+    value_indexes = [i for i, name in enumerate(header) if i not in (employee_index, format_index)]
+    if descriptor_index is None and len(value_indexes) != DESCRIPTOR_SIZE:
+        rows.add_error(source, '', "Expected a 'descriptor' column or %d value columns, got %d" % (
+            DESCRIPTOR_SIZE, len(value_indexes)))
+        return
+
+    numeric = []
+    for line_number, record in enumerate(reader, start=2):
+        if not any(cell.strip() for cell in record):
+            continue
+        row = '%s:%d' % (source, line_number)
+        identifier = record[employee_index].strip() if employee_index < len(record) else ''
+        if not identifier:
+            rows.add_error(row, '', "Missing employee identifier")
+            continue
+        if descriptor_index is None:
+            numeric.append((row, identifier, [record[i] if i < len(record) else '' for i in value_indexes]))
+            continue
+        try:
+            fmt = record[format_index].strip() if format_index is not None and format_index < len(record) else None
+            descriptor = _parse_descriptor_text(record[descriptor_index], fmt)
+        except Exception as e:
+            rows.add_error(row, identifier, "Invalid descriptor: %s" % e)
+            continue
+        rows.add(row, identifier, descriptor)
+
+    if not numeric:
+        return
+    try:
+        values = np.array([cells for _row, _identifier, cells in numeric], dtype=np.float32)
+    except ValueError:
+        # Some cell is not a number: find which rows, one at a time
+        values = None
+    for i, (row, identifier, cells) in enumerate(numeric):
+        if values is not None:
+            rows.add(row, identifier, values[i])
+            continue
+        try:
+            rows.add(row, identifier, np.array(cells, dtype=np.float32))
+        except ValueError as e:
+            rows.add_error(row, identifier, "Invalid descriptor: %s" % e)
+
+
+def _read_template_file(rows, identifier, content, name):
+    """Add the templates of a ``<identifier>.npy`` or ``<identifier>.json`` member"""
+    try:
+        if name.endswith('.npy'):
+            block = np.load(io.BytesIO(content), allow_pickle=False)
+        else:
+            block = np.asarray(json.loads(content.decode('utf-8')), dtype=np.float32)
+        block = np.asarray(block, dtype=np.float32)
+        if block.ndim == 1:
+            block = block.reshape(1, -1)
+        if block.ndim != 2 or block.shape[1] != DESCRIPTOR_SIZE:
+            raise ValueError("Expected (n, %d) templates, got shape %s" % (DESCRIPTOR_SIZE, block.shape))
+    except Exception as e:
+        rows.add_error(name, identifier, "Invalid template file: %s" % e)
+        return
+    for i, descriptor in enumerate(block):
+        rows.add('%s[%d]' % (name, i), identifier, descriptor)
+
+
+def read_face_import(content, filename):
+    """Read an import file into ``FaceImportRows``
+
+    ``content`` is a CSV file, or a ZIP archive of CSV files and of
+    per-employee ``<identifier>.npy`` / ``<identifier>.json`` template
+    files. Raises ``ValueError`` when the file itself cannot be read.
+    """
+    rows = FaceImportRows()
+    if not zipfile.is_zipfile(io.BytesIO(content)):
+        try:
+            text = content.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ValueError("%s is neither a ZIP archive nor a UTF-8 CSV file" % filename)
+        _read_csv(rows, text, filename or 'import.csv')
+        return rows
+
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        members = [info for info in archive.infolist() if not info.is_dir()]
+        if sum(info.file_size for info in members) > MAX_IMPORT_BYTES:
+            raise ValueError("Archive expands to more than %d MB" % (MAX_IMPORT_BYTES // (1024 * 1024)))
+        for info in sorted(members, key=lambda info: info.filename):
+            name = info.filename
+            base, extension = os.path.splitext(os.path.basename(name))
+            extension = extension.lower()
+            if base.startswith('.') or extension not in ('.csv', '.npy', '.json'):
+                continue
+            data = archive.read(info)
+            if extension == '.csv':
+                try:
+                    _read_csv(rows, data.decode('utf-8-sig'), name)
+                except UnicodeDecodeError:
+                    rows.add_error(name, '', "Not a UTF-8 CSV file")
+            else:
+                _read_template_file(rows, base, data, name)
+    return rows
+
+
+def validate_templates(matrix):
+    """Check every template at once
+
+    Returns an array with the error message of each row, None for the
+    valid ones.
+    """
+    messages = np.full(len(matrix), None, dtype=object)
+    if not len(matrix):
+        return messages
+    finite = np.isfinite(matrix).all(axis=1)
+    clean = np.where(finite[:, None], matrix, 0)
+    norms = np.sqrt(np.einsum('ij,ij->i', clean, clean))
+    messages[norms > MAX_TEMPLATE_NORM] = "Template norm above %s" % MAX_TEMPLATE_NORM
+    messages[norms < MIN_TEMPLATE_NORM] = "Template norm below %s" % MIN_TEMPLATE_NORM
+    messages[~finite] = "Template has non-finite values"
+    return messages
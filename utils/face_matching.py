@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from .descriptor_codec import DESCRIPTOR_SIZE
+
+# Upper bound on the number of probe x template distances computed at once,
+# which keeps a batch's scratch matrix around 16 MB of float32
+MAX_DISTANCE_BLOCK = 4 * 1024 * 1024
+
+# Closest templates searched for the runner-up employee; an employee has a
+# handful of templates, so another one is nearly always among them
+RUNNER_UP_CANDIDATES = 8
+
+
+def as_template_block(templates):
+    """Return an employee's templates as a (k, DESCRIPTOR_SIZE) float32 array
+
+    Raises ``ValueError`` when the stored data does not have that shape.
+    """
+    block = np.asarray(templates, dtype=np.float32)
+    if block.ndim == 1 and block.shape[0] == DESCRIPTOR_SIZE:
+        block = block.reshape(1, DESCRIPTOR_SIZE)
+    if block.ndim != 2 or block.shape[1] != DESCRIPTOR_SIZE or not len(block):
+        raise ValueError("Expected a list of %d-value face templates, got shape %s" % (
+            DESCRIPTOR_SIZE, block.shape))
+    return block
+
+
+def similarity_from_distance(distance):
+    """Map a Euclidean descriptor distance to a 0-1 similarity
+
+    Assumes the maximum meaningful distance is 1.0, as face-api.js
+    descriptors of the same person sit well under 0.6 of each other.
+    """
+    return np.maximum(0.0, 1.0 - distance)
+
+
+class FaceGallery(object):
+    """All registered face templates as one matrix, matched in a single pass
+
+    ``matrix`` holds one template per row and ``owners`` the employee id of
+    each row. Squared row norms are precomputed so matching a batch of
+    probes is one matrix product.
+    """
+    __slots__ = ('matrix', 'owners', 'employee_ids', 'sq_norms')
+
+    def __init__(self, matrix, owners):
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32).reshape(-1, DESCRIPTOR_SIZE)
+        self.owners = np.asarray(owners, dtype=np.int64)
+        self.sq_norms = np.einsum('ij,ij->i', self.matrix, self.matrix)
+        self.employee_ids = np.unique(self.owners)
+
+    @classmethod
+    def from_templates(cls, templates_by_employee):
+        """Build a gallery from ``(employee_id, template block)`` pairs"""
+        blocks = []
+        owners = []
+        for employee_id, templates in templates_by_employee:
+            block = as_template_block(templates)
+            blocks.append(block)
+            owners.append(np.full(len(block), employee_id, dtype=np.int64))
+        if not blocks:
+            return cls(np.empty((0, DESCRIPTOR_SIZE), dtype=np.float32), [])
+        return cls(np.vstack(blocks), np.concatenate(owners))
+
+    def __len__(self):
+        """Number of employees in the gallery"""
+        return len(self.employee_ids)
+
+    @property
+    def template_count(self):
+        return len(self.owners)
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes + self.owners.nbytes + self.sq_norms.nbytes
+
+    def distances(self, probes):
+        """Return the (P, T) Euclidean distance matrix of probes x templates"""
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        if probes.shape[1] != DESCRIPTOR_SIZE:
+            raise ValueError("Expected %d-value probes, got %d" % (DESCRIPTOR_SIZE, probes.shape[1]))
+        sq = probes @ self.matrix.T
+        sq *= -2.0
+        sq += np.einsum('ij,ij->i', probes, probes)[:, None]
+        sq += self.sq_norms[None, :]
+        np.maximum(sq, 0.0, out=sq)
+        return np.sqrt(sq, out=sq)
+
+    def best_matches(self, probes):
+        """Return ``(employee_ids, similarities)`` of the closest template per probe
+
+        Probes are processed in blocks bounded by ``MAX_DISTANCE_BLOCK``.
+        Employee id is -1 and similarity 0 when the gallery is empty.
+        """
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        count = len(probes)
+        employee_ids = np.full(count, -1, dtype=np.int64)
+        similarities = np.zeros(count, dtype=np.float32)
+        if not self.template_count:
+            return employee_ids, similarities
+
+        rows = max(1, MAX_DISTANCE_BLOCK // self.template_count)
+        for start in range(0, count, rows):
+            distances = self.distances(probes[start:start + rows])
+            best = np.argmin(distances, axis=1)
+            best_distance = distances[np.arange(len(best)), best]
+            employee_ids[start:start + rows] = self.owners[best]
+            similarities[start:start + rows] = similarity_from_distance(best_distance)
+        return employee_ids, similarities
+
+    def top_k(self, probes, k=1):
+        """Return ``(employee_ids, similarities)`` of the k closest templates
+
+        Both arrays are (P, k), best first. Several of the k templates may
+        belong to the same employee; k is capped at the template count.
+        """
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        k = min(k, self.template_count)
+        employee_ids = np.empty((len(probes), k), dtype=np.int64)
+        similarities = np.empty((len(probes), k), dtype=np.float32)
+        if not k:
+            return employee_ids, similarities
+
+        rows = max(1, MAX_DISTANCE_BLOCK // self.template_count)
+        for start in range(0, len(probes), rows):
+            distances = self.distances(probes[start:start + rows])
+            if k < distances.shape[1]:
+                candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            else:
+                candidates = np.broadcast_to(np.arange(distances.shape[1]), distances.shape)
+            candidate_distances = np.take_along_axis(distances, candidates, axis=1)
+            order = np.argsort(candidate_distances, axis=1)
+            best = np.take_along_axis(candidates, order, axis=1)
+            employee_ids[start:start + rows] = self.owners[best]
+            similarities[start:start + rows] = similarity_from_distance(
+                np.take_along_axis(candidate_distances, order, axis=1))
+        return employee_ids, similarities
+
+    def best_match_with_runner_up(self, probe, k=RUNNER_UP_CANDIDATES):
+        """Return ``(employee_id, similarity, runner_up)`` for one probe
+
+        ``runner_up`` is the similarity of the closest other employee, found
+        among the k closest templates; when they all belong to the best
+        employee, the k-th similarity, which no other employee exceeds.
+        0 when there is no other employee, id None if empty.
+        """
+        employee_ids, similarities = self.top_k(probe, k)
+        if not employee_ids.shape[1]:
+            return None, 0.0, 0.0
+        employee_ids, similarities = employee_ids[0], similarities[0]
+        best_id = employee_ids[0]
+        others = np.flatnonzero(employee_ids != best_id)
+        if len(others):
+            runner_up = float(similarities[others[0]])
+        elif self.template_count > len(employee_ids):
+            runner_up = float(similarities[-1])
+        else:
+            runner_up = 0.0
+        return int(best_id), float(similarities[0]), runner_up
+
+    def best_match(self, probe):
+        """Return ``(employee_id, similarity)`` for one probe, id None if empty"""
+        employee_ids, similarities = self.best_matches(probe)
+        if employee_ids[0] < 0:
+            return None, 0.0
+        return int(employee_ids[0]), float(similarities[0])
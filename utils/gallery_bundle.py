@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Signed gallery bundles for kiosks that match on the device
+
+A bundle is a JSON document holding a partition's templates as float16,
+with the employee ids and template counts they belong to, all as base64
+little-endian arrays. A delta bundle carries the templates changed since
+``base_generation`` and the full list of the partition's employees, so the
+kiosk also drops those that left it.
+
+Bundles are signed with an ECDSA P-256 key so a kiosk can check with
+WebCrypto, against the public key it pinned, that what it stored or
+received came from the server. The signature is raw ``r || s``, the
+encoding WebCrypto expects.
+"""
+import base64
+import functools
+import json
+
+import numpy as np
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+
+from .descriptor_codec import DESCRIPTOR_SIZE
+
+BUNDLE_VERSION = 1
+
+
+def _b64(array, dtype):
+    return base64.b64encode(np.ascontiguousarray(array, dtype=dtype).tobytes()).decode('ascii')
+
+
+def build_bundle(partition, generation, templates_by_employee, employee_ids=None, base_generation=None):
+    """Return the bundle of ``(employee_id, template block)`` pairs, as a dict
+
+    A full bundle when ``base_generation`` is None; otherwise a delta on
+    top of it, ``employee_ids`` being every employee the partition holds.
+    """
+    blocks = [block for _employee_id, block in templates_by_employee]
+    bundle = {
+        'version': BUNDLE_VERSION,
+        'partition': partition,
+        'generation': generation,
+        'base_generation': base_generation,
+        'descriptor_size': DESCRIPTOR_SIZE,
+        'template_employee_ids': _b64([employee_id for employee_id, _block in templates_by_employee], '<i4'),
+        'template_counts': _b64([len(block) for block in blocks], '<u2'),
+        'templates': _b64(np.vstack(blocks) if blocks else np.empty((0, DESCRIPTOR_SIZE)), '<f2'),
+    }
+    if base_generation is not None:
+        bundle['employee_ids'] = _b64(sorted(employee_ids), '<i4')
+    return bundle
+
+
+def generate_signing_key():
+    """Return a new private key, PEM encoded"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    return key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode('ascii')
+
+
+class BundleSigner(object):
+    """Signs bundles with a PEM private key; ``public_key`` is its base64 SPKI"""
+
+    def __init__(self, private_key_pem):
+        self._key = serialization.load_pem_private_key(private_key_pem.encode('ascii'), password=None)
+        self.public_key = base64.b64encode(self._key.public_key().public_bytes(
+            serialization.Encoding.DER,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        )).decode('ascii')
+
+    def sign(self, data):
+        r, s = decode_dss_signature(self._key.sign(data, ec.ECDSA(hashes.SHA256())))
+        return base64.b64encode(r.to_bytes(32, 'big') + s.to_bytes(32, 'big')).decode('ascii')
+
+    def sign_bundle(self, bundle):
+        """Return ``{'data', 'signature', 'public_key'}``, ``data`` being the signed JSON text"""
+        data = json.dumps(bundle, separators=(',', ':'))
+        return {
+            'data': data,
+            'signature': self.sign(data.encode('utf-8')),
+            'public_key': self.public_key,
+        }
+
+
+@functools.lru_cache(maxsize=4)
+def get_bundle_signer(private_key_pem):
+    return BundleSigner(private_key_pem)
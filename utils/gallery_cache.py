@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+
+class _Partition(object):
+    __slots__ = ('value', 'timestamp', 'epoch', 'build_lock', 'hits', 'misses', 'builds', 'build_seconds')
+
+    def __init__(self):
+        self.value = None
+        self.timestamp = None
+        # Bumped by every invalidation
+        self.epoch = 0
+        self.build_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.build_seconds = 0.0
+
+
+class GalleryCache(object):
+    """Face galleries keyed by partition, each rebuilt after ``validity`` seconds
+
+    A partition is the set of employees one kind of kiosk may match, e.g.
+    one company or one department of a site. Invalidation keeps the hit
+    statistics, only the galleries are rebuilt.
+    """
+
+    def __init__(self, validity):
+        self.validity = validity
+        self._partitions = {}
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def _valid(self, partition):
+        return bool(partition.timestamp and time.time() - partition.timestamp < self.validity)
+
+    def get(self, key, build):
+        """Return the partition's value, calling ``build()`` when missing or expired
+
+        One thread builds a partition at a time; the others missing it
+        meanwhile wait for that build rather than each running their own.
+        """
+        with self._lock:
+            partition = self._partitions.get(key)
+            if partition is None:
+                partition = self._partitions[key] = _Partition()
+            if self._valid(partition):
+                partition.hits += 1
+                return partition.value
+            partition.misses += 1
+
+        with partition.build_lock:
+            with self._lock:
+                if self._valid(partition):
+                    return partition.value
+                epoch = partition.epoch
+            start = time.time()
+            value = build()
+            with self._lock:
+                partition.value = value
+                partition.builds += 1
+                partition.build_seconds = time.time() - start
+                # Invalidated while building: kept, but rebuilt on next use
+                if partition.epoch == epoch:
+                    partition.timestamp = start
+            return value
+
+    def valid(self, key):
+        """Whether the partition is built and neither expired nor invalidated"""
+        with self._lock:
+            partition = self._partitions.get(key)
+            return partition is not None and self._valid(partition)
+
+    def version(self, key):
+        """Number of times the partition was built, 0 if never"""
+        with self._lock:
+            partition = self._partitions.get(key)
+            return partition.builds if partition else 0
+
+    def invalidate(self, key=None):
+        """Mark one or all partitions for rebuild"""
+        with self._lock:
+            partitions = [self._partitions[key]] if key in self._partitions else []
+            if key is None:
+                partitions = list(self._partitions.values())
+            for partition in partitions:
+                partition.timestamp = None
+                partition.epoch += 1
+
+    def set_generation(self, generation):
+        """Mark every partition for rebuild when ``generation`` changed
+
+        The generation is shared through the database by changes made
+        outside the request path, e.g. a bulk import, so that each worker
+        rebuilds once rather than when ``validity`` runs out. Returns
+        whether the partitions were invalidated.
+        """
+        with self._lock:
+            if generation == self._generation:
+                return False
+            changed = self._generation is not None
+            self._generation = generation
+            if changed:
+                for partition in self._partitions.values():
+                    partition.timestamp = None
+                    partition.epoch += 1
+        return changed
+
+    def stats(self):
+        """Return one dict per partition with its size, age and hit counts"""
+        now = time.time()
+        with self._lock:
+            items = list(self._partitions.items())
+        stats = []
+        for key, partition in items:
+            value = partition.value
+            lookups = partition.hits + partition.misses
+            stats.append({
+                'partition': '/'.join(str(part) for part in key),
+                'valid': bool(partition.timestamp and now - partition.timestamp < self.validity),
+                'age_seconds': now - partition.timestamp if partition.timestamp else 0,
+                'employees': len(value) if value is not None else 0,
+                'templates': getattr(value, 'template_count', 0),
+                'memory_bytes': getattr(value, 'nbytes', 0),
+                'shards': len(getattr(value, 'shards', ())) or 1,
+                'hits': partition.hits,
+                'misses': partition.misses,
+                'hit_rate': partition.hits / lookups if lookups else 0.0,
+                'build_seconds': partition.build_seconds,
+            })
+        return stats
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import math
+
+import numpy as np
+
+from .face_matching import MAX_DISTANCE_BLOCK
+
+# Templates per side of one block of the all-pairs distance matrix, so a
+# block is at most MAX_DISTANCE_BLOCK float32 values
+DEFAULT_AUDIT_BLOCK = int(math.sqrt(MAX_DISTANCE_BLOCK))
+
+
+def find_identity_collisions(gallery, max_distance, block_size=DEFAULT_AUDIT_BLOCK):
+    """Return the pairs of employees having templates within ``max_distance``
+
+    Compares every template of ``gallery`` (a ``FaceGallery``) with every
+    template of the other employees, one ``block_size`` x ``block_size``
+    block of the upper triangle at a time, so memory stays bounded however
+    large the gallery. Such pairs are duplicate enrollments, or people a
+    probe could be matched to either way.
+
+    Returns one dict per pair, closest first: ``employee_a`` <
+    ``employee_b``, the ``distance`` of their closest templates, the
+    position of those templates in each employee's list
+    (``template_a``/``template_b``) and ``template_pairs``, the number of
+    template pairs within ``max_distance``.
+    """
+    matrix = gallery.matrix
+    owners = gallery.owners
+    sq_norms = gallery.sq_norms
+    count = len(owners)
+    limit = np.float32(max_distance) ** 2
+
+    # Position of each template in its employee's list; the gallery keeps
+    # an employee's templates contiguous
+    starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]]) if count else np.empty(0, np.int64)
+    positions = np.arange(count) - np.repeat(starts, np.diff(np.r_[starts, count]))
+
+    pairs = {}
+    for row_start in range(0, count, block_size):
+        rows = matrix[row_start:row_start + block_size]
+        row_owners = owners[row_start:row_start + block_size]
+        for column_start in range(row_start, count, block_size):
+            columns = matrix[column_start:column_start + block_size]
+            column_owners = owners[column_start:column_start + block_size]
+
+            sq = rows @ columns.T
+            sq *= -2.0
+            sq += sq_norms[row_start:row_start + block_size, None]
+            sq += sq_norms[None, column_start:column_start + block_size]
+
+            close = sq <= limit
+            close &= row_owners[:, None] != column_owners[None, :]
+            if column_start == row_start:
+                # Each pair once: the diagonal block's upper triangle only
+                close = np.triu(close, k=1)
+            hit_rows, hit_columns = np.nonzero(close)
+            if not len(hit_rows):
+                continue
+
+            distances = np.sqrt(np.maximum(sq[hit_rows, hit_columns], 0.0))
+            a = row_owners[hit_rows]
+            b = column_owners[hit_columns]
+            swap = a > b
+            template_a = np.where(swap, positions[column_start + hit_columns], positions[row_start + hit_rows])
+            template_b = np.where(swap, positions[row_start + hit_rows], positions[column_start + hit_columns])
+            a, b = np.where(swap, b, a), np.where(swap, a, b)
+
+            # Closest template pair per employee pair, from the hits sorted by distance
+            order = np.argsort(distances, kind='stable')
+            keys = np.stack([a[order], b[order]], axis=1)
+            unique_keys, first, counts = np.unique(keys, axis=0, return_index=True, return_counts=True)
+            for (employee_a, employee_b), index, hits in zip(unique_keys, first, counts):
+                key = (int(employee_a), int(employee_b))
+                hit = order[index]
+                pair = pairs.get(key)
+                if pair is None:
+                    pair = pairs[key] = {
+                        'employee_a': key[0],
+                        'employee_b': key[1],
+                        'distance': float(distances[hit]),
+                        'template_a': int(template_a[hit]),
+                        'template_b': int(template_b[hit]),
+                        'template_pairs': 0,
+                    }
+                elif distances[hit] < pair['distance']:
+                    pair.update(distance=float(distances[hit]),
+                                template_a=int(template_a[hit]), template_b=int(template_b[hit]))
+                pair['template_pairs'] += int(hits)
+
+    return sorted(pairs.values(), key=lambda pair: pair['distance'])
@@ -1,78 +1,188 @@
 # -*- coding: utf-8 -*-
 import logging
-import traceback
+import random
+import threading
 import json
 import time
 from functools import wraps
 
+from odoo.tools import config
+
 # Import the dedicated logger
 from odoo.addons.hr_attendance_face_recognition import face_logger
 
+# Fraction of successful recognitions / metrics records that are logged.
+# Set ``face_recognition_log_sample_rate`` in the server config to override.
+DEFAULT_SUCCESS_SAMPLE_RATE = 1.0
+
+# Minimum number of seconds between two error records of the same type.
+# Set ``face_recognition_error_log_interval`` in the server config to override.
+DEFAULT_ERROR_LOG_INTERVAL = 60.0
+
+
+class JsonPayload(object):
+    """Defer ``json.dumps`` until the record is actually formatted"""
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return json.dumps(self.data, default=str)
+
+
+class ErrorRateLimiter(object):
+    """Let one error per key through every ``interval`` seconds
+
+    Suppressed occurrences are counted and reported with the next record
+    that is allowed through.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._last_emit = {}
+        self._suppressed = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        """Return ``(allowed, suppressed_count)`` for an occurrence of ``key``"""
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_emit.get(key)
+            if last is not None and now - last < self.interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return False, 0
+            self._last_emit[key] = now
+            return True, self._suppressed.pop(key, 0)
+
+
+def _config_float(key, default):
+    try:
+        return float(config.get(key, default))
+    except (TypeError, ValueError):
+        return default
+
+
+success_sample_rate = _config_float('face_recognition_log_sample_rate', DEFAULT_SUCCESS_SAMPLE_RATE)
+error_limiter = ErrorRateLimiter(
+    _config_float('face_recognition_error_log_interval', DEFAULT_ERROR_LOG_INTERVAL))
+
+
+def _sampled():
+    """Decide whether a sampled (success) record should be emitted"""
+    return success_sample_rate >= 1.0 or random.random() < success_sample_rate
+
+
 def log_entry_exit(func):
     """Decorator to log entry and exit of important functions"""
+    func_name = func.__name__
+
     @wraps(func)
     def wrapper(*args, **kwargs):
-        func_name = func.__name__
-        face_logger.debug(f"ENTER: {func_name}")
-        
-        start_time = time.time()
+        if face_logger.isEnabledFor(logging.DEBUG):
+            face_logger.debug("ENTER: %s", func_name)
+
+        start_time = time.perf_counter()
         try:
             result = func(*args, **kwargs)
-            elapsed = time.time() - start_time
-            
+            elapsed = time.perf_counter() - start_time
+
             # Log detailed timing if function takes longer than expected
             if elapsed > 1.0:  # More than 1 second
-                face_logger.warning(f"SLOW EXECUTION: {func_name} took {elapsed:.2f} seconds")
-            else:
-                face_logger.debug(f"EXIT: {func_name} - Execution time: {elapsed:.2f} seconds")
-                
+                face_logger.warning("SLOW EXECUTION: %s took %.2f seconds", func_name, elapsed)
+            elif face_logger.isEnabledFor(logging.DEBUG):
+                face_logger.debug("EXIT: %s - Execution time: %.2f seconds", func_name, elapsed)
+
             return result
         except Exception as e:
-            elapsed = time.time() - start_time
+            elapsed = time.perf_counter() - start_time
             face_logger.error(
-                f"ERROR in {func_name} after {elapsed:.2f} seconds: {str(e)}\n"
-                f"Traceback: {traceback.format_exc()}"
+                "ERROR in %s after %.2f seconds: %s",
+                func_name, elapsed, e, exc_info=True
             )
             raise
     return wrapper
 
 def log_face_recognition_attempt(employee_id, confidence, success, action=None):
-    """Log details about a face recognition attempt"""
-    status = "SUCCESS" if success else "FAILED"
-    action_str = f" - Action: {action}" if action else ""
+    """Log details about a face recognition attempt
+
+    Successful attempts are sampled, repeated failures are rate limited.
+    """
+    if not face_logger.isEnabledFor(logging.INFO):
+        return
+    suppressed = 0
+    if success:
+        if not _sampled():
+            return
+    else:
+        allowed, suppressed = error_limiter.allow('recognition_failed')
+        if not allowed:
+            return
     face_logger.info(
-        f"Face Recognition {status} - Employee ID: {employee_id} - "
-        f"Confidence: {confidence:.2f}%{action_str}"
+        "Face Recognition %s - Employee ID: %s - Confidence: %.2f%%%s%s",
+        "SUCCESS" if success else "FAILED", employee_id, confidence,
+        " - Action: %s" % action if action else "",
+        " (%d similar suppressed)" % suppressed if suppressed else "",
+        extra={'face_event': {
+            'event': 'recognition',
+            'employee_id': employee_id,
+            'confidence': confidence,
+            'success': success,
+            'action': action,
+        }}
     )
 
 def log_face_registration(employee_id, employee_name, templates_count, success):
     """Log details about a face registration attempt"""
-    status = "SUCCESS" if success else "FAILED"
+    if not face_logger.isEnabledFor(logging.INFO):
+        return
     face_logger.info(
-        f"Face Registration {status} - Employee ID: {employee_id} - "
-        f"Name: {employee_name} - Templates: {templates_count}"
+        "Face Registration %s - Employee ID: %s - Name: %s - Templates: %s",
+        "SUCCESS" if success else "FAILED", employee_id, employee_name, templates_count,
+        extra={'face_event': {
+            'event': 'registration',
+            'employee_id': employee_id,
+            'templates_count': templates_count,
+            'success': success,
+        }}
     )
 
 def log_system_error(error_type, message, details=None):
-    """Log system-level errors with detailed information"""
+    """Log system-level errors with detailed information
+
+    Repeated errors of the same type are rate limited; the number of
+    suppressed occurrences is attached to the next emitted record.
+    """
+    if not face_logger.isEnabledFor(logging.ERROR):
+        return
+    allowed, suppressed = error_limiter.allow(error_type)
+    if not allowed:
+        return
+
     error_data = {
         "error_type": error_type,
         "message": message
     }
-    
+
     if details:
         error_data["details"] = details
-        
-    face_logger.error(f"SYSTEM ERROR: {json.dumps(error_data)}")
+    if suppressed:
+        error_data["suppressed"] = suppressed
+
+    face_logger.error("SYSTEM ERROR: %s", JsonPayload(error_data),
+                      extra={'face_event': error_data})
 
 def log_recognition_metrics(confidence, processing_time, device_info=None):
-    """Log metrics about recognition performance"""
+    """Log metrics about recognition performance (sampled)"""
+    if not face_logger.isEnabledFor(logging.INFO) or not _sampled():
+        return
     metrics = {
         "confidence": confidence,
         "processing_time_ms": int(processing_time * 1000)
     }
-    
+
     if device_info:
         metrics["device"] = device_info
-        
-    face_logger.info(f"METRICS: {json.dumps(metrics)}")
+
+    face_logger.info("METRICS: %s", JsonPayload(metrics),
+                     extra={'face_event': metrics})
@@ -0,0 +1,580 @@
+# -*- coding: utf-8 -*-
+"""Face matching service shared by all Odoo workers
+
+``LocalMatchingService`` owns a gallery and applies per-employee updates
+to it. The sidecar daemon (``scripts/face_matcher.py``) serves one over a
+Unix socket, so the gallery is held and kept current once per host instead
+of once per worker; ``MatchingServiceClient`` talks to it. Without the
+sidecar, ``LocalMatchingService`` can be used directly in-process.
+
+Wire protocol, all integers little-endian::
+
+    request:  op (uint8), payload length (uint32), payload
+    response: status (uint8), payload length (uint32), payload
+
+    PING    -> empty
+    MATCH   probes as float32[n * 128]
+            -> employees (uint32), templates (uint32), ids int64[n], similarities float32[n]
+    UPSERT  employee id (int64), templates float32[k * 128]
+    REMOVE  employee ids int64[n]
+    LOAD    count (uint32), generation (uint64),
+            count x (employee id (int64), k (uint32), templates float32[k * 128])
+    STATUS  -> JSON object
+    DEFINE_SUBSET  key length (uint32), key, employee ids int64[n]
+    MATCH_SUBSET   key length (uint32), key, probes float32[n * 128]
+            -> as MATCH, against the employees of that subset only
+
+A subset (a kiosk partition) is defined once under a key that changes
+with its employees, and matches then only send the key. A MATCH_SUBSET
+for a key the daemon does not know, or no longer keeps, answers
+``STATUS_UNKNOWN_SUBSET``; the client defines it and retries.
+
+The socket lives in a directory only the Odoo user can enter, by default
+``<data_dir>/run``, and the client only talks to a daemon running as the
+same user, so no other local account can read the templates or answer
+matches.
+
+A MATCH sent before the first LOAD answers ``STATUS_NOT_LOADED``. The
+client then reads the gallery from the database and sends it with the
+generation it read at the start, so updates pushed in the meantime are
+kept rather than overwritten.
+
+This module has no Odoo dependency so the daemon can run on its own.
+"""
+import hashlib
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .descriptor_codec import DESCRIPTOR_SIZE
+from .face_matching import FaceGallery, as_template_block
+
+_logger = logging.getLogger(__name__)
+
+# Odoo's default ``data_dir``; the daemon and the Odoo workers run as the
+# same user, so both resolve it to the same directory
+DEFAULT_DATA_DIR = os.path.join(os.path.expanduser('~'), '.local', 'share', 'Odoo')
+SOCKET_NAME = 'face_matcher.sock'
+# The world-writable path older versions used; read as the default
+LEGACY_SOCKET_PATH = '/tmp/odoo_face_matcher.sock'
+
+OP_PING = 0
+OP_MATCH = 1
+OP_UPSERT = 2
+OP_REMOVE = 3
+OP_LOAD = 4
+OP_STATUS = 5
+OP_MATCH_SUBSET = 6
+OP_DEFINE_SUBSET = 7
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+STATUS_NOT_LOADED = 2
+STATUS_UNKNOWN_SUBSET = 3
+
+MAX_MESSAGE_SIZE = 1 << 30
+
+# Employee subsets (kiosk partitions) whose gallery is kept between
+# matches, and subsets defined
+MAX_SUBSET_GALLERIES = 16
+MAX_SUBSETS = 256
+
+_HEADER = struct.Struct('<BI')
+_COUNTS = struct.Struct('<II')
+_LOAD_HEADER = struct.Struct('<IQ')
+_EMPLOYEE_HEADER = struct.Struct('<qI')
+_EMPLOYEE_ID = struct.Struct('<q')
+_COUNT = struct.Struct('<I')
+
+_TEMPLATE_BYTES = DESCRIPTOR_SIZE * 4
+_PEER_CREDENTIALS = struct.Struct('3i')
+
+
+def default_socket_path(data_dir=None, dbname=None):
+    """Return the socket path in the ``run`` directory of ``data_dir``
+
+    Each database has its own daemon, named after it: employee ids only
+    mean something within one database.
+    """
+    name = SOCKET_NAME
+    if dbname:
+        name = '%s-%s' % (dbname, SOCKET_NAME)
+    return os.path.join(data_dir or DEFAULT_DATA_DIR, 'run', name)
+
+
+DEFAULT_SOCKET_PATH = default_socket_path()
+
+
+class MatchingServiceError(Exception):
+    """The matching service could not be reached or failed the request"""
+
+
+class GalleryNotLoaded(MatchingServiceError):
+    """The matching service has not received a gallery yet"""
+
+
+class UnknownSubset(MatchingServiceError):
+    """The matching service does not know the subset matched against"""
+
+
+class LocalMatchingService(object):
+    """A gallery kept current by per-employee updates, matched in-process
+
+    Every update bumps ``generation``. A full ``load`` tagged with the
+    generation it was read at keeps employees updated after that point.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.generation = 0
+        self.match_count = 0
+        self.started_at = time.time()
+        self._templates = {}
+        self._changed_at = {}
+        self._gallery = None
+        # Subset key -> sorted employee ids, and -> gallery
+        self._subsets = OrderedDict()
+        self._subset_galleries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, templates_by_employee, generation=0):
+        templates = {employee_id: as_template_block(block) for employee_id, block in templates_by_employee}
+        with self._lock:
+            for employee_id, changed_at in self._changed_at.items():
+                if changed_at > generation:
+                    if employee_id in self._templates:
+                        templates[employee_id] = self._templates[employee_id]
+                    else:
+                        templates.pop(employee_id, None)
+            self._templates = templates
+            self._changed_at = {}
+            self._gallery = None
+            self._subset_galleries.clear()
+            self.loaded = True
+            self.generation += 1
+
+    def upsert(self, employee_id, templates):
+        block = as_template_block(templates)
+        with self._lock:
+            self.generation += 1
+            self._templates[employee_id] = block
+            self._changed_at[employee_id] = self.generation
+            self._gallery = None
+            self._subset_galleries.clear()
+
+    def remove(self, employee_ids):
+        with self._lock:
+            self.generation += 1
+            for employee_id in employee_ids:
+                self._templates.pop(employee_id, None)
+                self._changed_at[employee_id] = self.generation
+            self._gallery = None
+            self._subset_galleries.clear()
+
+    def define_subset(self, key, employee_ids):
+        """Keep the employees of subset ``key`` for the matches naming it"""
+        employee_ids = np.unique(np.asarray(employee_ids, dtype=np.int64))
+        with self._lock:
+            self._subsets[key] = employee_ids
+            self._subsets.move_to_end(key)
+            self._subset_galleries.pop(key, None)
+            while len(self._subsets) > MAX_SUBSETS:
+                evicted, _ids = self._subsets.popitem(last=False)
+                self._subset_galleries.pop(evicted, None)
+
+    def gallery(self, subset=None):
+        """Return the gallery of all employees, or of the employees of subset ``subset``"""
+        with self._lock:
+            if subset is None:
+                if self._gallery is None:
+                    self._gallery = FaceGallery.from_templates(self._templates.items())
+                return self._gallery
+
+            employee_ids = self._subsets.get(subset)
+            if employee_ids is None:
+                raise UnknownSubset("Unknown employee subset")
+            self._subsets.move_to_end(subset)
+            gallery = self._subset_galleries.get(subset)
+            if gallery is None:
+                gallery = FaceGallery.from_templates(
+                    (employee_id, self._templates[employee_id])
+                    for employee_id in employee_ids.tolist()
+                    if employee_id in self._templates
+                )
+                self._subset_galleries[subset] = gallery
+                while len(self._subset_galleries) > MAX_SUBSET_GALLERIES:
+                    self._subset_galleries.popitem(last=False)
+            else:
+                self._subset_galleries.move_to_end(subset)
+            return gallery
+
+    def match(self, probes, subset=None):
+        """Return ``(gallery, employee_ids, similarities)``, ``gallery`` being the one matched"""
+        if not self.loaded:
+            raise GalleryNotLoaded("No gallery loaded")
+        self.match_count += 1
+        gallery = self.gallery(subset)
+        return (gallery,) + tuple(gallery.best_matches(probes))
+
+    def best_matches(self, probes, subset=None):
+        return self.match(probes, subset)[1:]
+
+    def status(self):
+        gallery = self.gallery()
+        return {
+            'loaded': self.loaded,
+            'generation': self.generation,
+            'employees': len(gallery),
+            'templates': gallery.template_count,
+            'memory_bytes': gallery.nbytes,
+            'matches': self.match_count,
+            'subsets': len(self._subsets),
+            'subset_galleries': len(self._subset_galleries),
+            'uptime_seconds': time.time() - self.started_at,
+        }
+
+
+def _recv_exactly(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ConnectionError("Connection closed")
+        received += count
+    return bytes(buffer)
+
+
+def _recv_message(sock):
+    code, length = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    if length > MAX_MESSAGE_SIZE:
+        raise ValueError("Message of %d bytes exceeds the limit" % length)
+    return code, _recv_exactly(sock, length) if length else b''
+
+
+def _send_message(sock, code, payload=b''):
+    sock.sendall(_HEADER.pack(code, len(payload)) + payload)
+
+
+def _probes_from_bytes(payload):
+    if not payload or len(payload) % _TEMPLATE_BYTES:
+        raise ValueError("Expected a whole number of %d-value descriptors" % DESCRIPTOR_SIZE)
+    return np.frombuffer(payload, dtype='<f4').reshape(-1, DESCRIPTOR_SIZE)
+
+
+def _encode_load(templates_by_employee, generation):
+    parts = []
+    for employee_id, templates in templates_by_employee:
+        block = as_template_block(templates)
+        parts.append(_EMPLOYEE_HEADER.pack(employee_id, len(block)))
+        parts.append(block.astype('<f4', copy=False).tobytes())
+    return _LOAD_HEADER.pack(len(parts) // 2, generation) + b''.join(parts)
+
+
+def _decode_load(payload):
+    count, generation = _LOAD_HEADER.unpack_from(payload)
+    offset = _LOAD_HEADER.size
+    templates_by_employee = []
+    for _index in range(count):
+        employee_id, k = _EMPLOYEE_HEADER.unpack_from(payload, offset)
+        offset += _EMPLOYEE_HEADER.size
+        block = np.frombuffer(payload, dtype='<f4', count=k * DESCRIPTOR_SIZE, offset=offset)
+        templates_by_employee.append((employee_id, block.reshape(k, DESCRIPTOR_SIZE)))
+        offset += k * _TEMPLATE_BYTES
+    return templates_by_employee, generation
+
+
+def _split_subset_key(payload):
+    """Return the subset key heading ``payload`` and the rest of it"""
+    (length,) = _COUNT.unpack_from(payload)
+    end = _COUNT.size + length
+    return bytes(payload[_COUNT.size:end]), payload[end:]
+
+
+def _subset_key_bytes(key):
+    key = key.encode('utf-8') if isinstance(key, str) else bytes(key)
+    return _COUNT.pack(len(key)) + key
+
+
+class MatchingRequestHandler(socketserver.BaseRequestHandler):
+    """Serve requests from one Odoo worker connection until it closes"""
+
+    def handle(self):
+        service = self.server.service
+        while True:
+            try:
+                op, payload = _recv_message(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                status, response = STATUS_OK, self._dispatch(service, op, payload)
+            except GalleryNotLoaded as e:
+                status, response = STATUS_NOT_LOADED, str(e).encode('utf-8')
+            except UnknownSubset as e:
+                status, response = STATUS_UNKNOWN_SUBSET, str(e).encode('utf-8')
+            except Exception as e:
+                _logger.exception("Face matcher request %s failed", op)
+                status, response = STATUS_ERROR, str(e).encode('utf-8')
+            try:
+                _send_message(self.request, status, response)
+            except OSError:
+                return
+
+    def _dispatch(self, service, op, payload):
+        if op == OP_PING:
+            return b''
+        if op in (OP_MATCH, OP_MATCH_SUBSET):
+            subset = None
+            if op == OP_MATCH_SUBSET:
+                subset, payload = _split_subset_key(payload)
+            # Counts of the gallery matched, not of one an update swapped in since
+            gallery, employee_ids, similarities = service.match(_probes_from_bytes(payload), subset)
+            return (_COUNTS.pack(len(gallery), gallery.template_count)
+                    + employee_ids.astype('<i8').tobytes()
+                    + similarities.astype('<f4').tobytes())
+        if op == OP_DEFINE_SUBSET:
+            subset, payload = _split_subset_key(payload)
+            service.define_subset(subset, np.frombuffer(payload, dtype='<i8'))
+            return b''
+        if op == OP_UPSERT:
+            (employee_id,) = _EMPLOYEE_ID.unpack_from(payload)
+            service.upsert(employee_id, _probes_from_bytes(payload[_EMPLOYEE_ID.size:]))
+            return b''
+        if op == OP_REMOVE:
+            service.remove([int(employee_id) for employee_id in np.frombuffer(payload, dtype='<i8')])
+            return b''
+        if op == OP_LOAD:
+            templates_by_employee, generation = _decode_load(payload)
+            service.load(templates_by_employee, generation)
+            _logger.info("Face gallery loaded with %d employees", len(templates_by_employee))
+            return b''
+        if op == OP_STATUS:
+            return json.dumps(service.status()).encode('utf-8')
+        raise ValueError("Unknown operation %s" % op)
+
+
+class MatchingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, service=None):
+        _secure_socket_directory(os.path.dirname(os.path.abspath(socket_path)))
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.service = service or LocalMatchingService()
+        # Created with its final mode: only the Odoo user (and its group)
+        # may query the gallery, from the moment it exists
+        umask = os.umask(0o117)
+        try:
+            super().__init__(socket_path, MatchingRequestHandler)
+        finally:
+            os.umask(umask)
+
+
+def _secure_socket_directory(directory):
+    """Create ``directory`` private to this user, or check an existing one is not shared
+
+    A directory another account owns or can write to would let it put its
+    own socket in place of the daemon's.
+    """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.stat(directory)
+    if info.st_uid != os.geteuid():
+        raise PermissionError("Socket directory %s is owned by another user" % directory)
+    if info.st_mode & 0o002:
+        raise PermissionError("Socket directory %s is writable by any user" % directory)
+
+
+def _check_peer(sock):
+    """Refuse a daemon running as another user, where the platform tells"""
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return
+    _pid, uid, _gid = _PEER_CREDENTIALS.unpack(
+        sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, _PEER_CREDENTIALS.size))
+    if uid != os.geteuid():
+        raise PermissionError("Face matcher socket is served by uid %d, not by this user" % uid)
+
+
+class MatchingServiceClient(object):
+    """Client of the matching daemon, with one connection per thread
+
+    Quacks like a ``FaceGallery`` for matching; ``len()`` and
+    ``template_count`` are as of the last match or status call.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, timeout=5.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.employee_count = 0
+        self.template_count = 0
+        self._local = threading.local()
+
+    def __len__(self):
+        return self.employee_count
+
+    def _connection(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+                _check_peer(sock)
+            except OSError:
+                sock.close()
+                raise
+            self._local.sock = sock
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    def _call(self, op, payload=b''):
+        try:
+            sock = self._connection()
+            _send_message(sock, op, payload)
+            status, response = _recv_message(sock)
+        except (OSError, ValueError) as e:
+            # The connection is in an unknown state after a failure
+            self._close()
+            raise MatchingServiceError("Face matcher at %s unavailable: %s" % (self.socket_path, e))
+        if status == STATUS_NOT_LOADED:
+            raise GalleryNotLoaded(response.decode('utf-8'))
+        if status == STATUS_UNKNOWN_SUBSET:
+            raise UnknownSubset(response.decode('utf-8'))
+        if status != STATUS_OK:
+            raise MatchingServiceError(response.decode('utf-8'))
+        return response
+
+    def ping(self):
+        self._call(OP_PING)
+
+    def status(self):
+        status = json.loads(self._call(OP_STATUS).decode('utf-8'))
+        self.employee_count = status['employees']
+        self.template_count = status['templates']
+        return status
+
+    def define_subset(self, key, employee_ids):
+        self._call(OP_DEFINE_SUBSET, _subset_key_bytes(key)
+                   + np.asarray(employee_ids, dtype='<i8').tobytes())
+
+    def best_matches(self, probes, subset=None):
+        """Match against all employees, or only against the employees of subset ``subset``"""
+        probes = np.atleast_2d(np.asarray(probes, dtype='<f4'))
+        if subset is None:
+            response = self._call(OP_MATCH, probes.tobytes())
+        else:
+            response = self._call(OP_MATCH_SUBSET, _subset_key_bytes(subset) + probes.tobytes())
+        self.employee_count, self.template_count = _COUNTS.unpack_from(response)
+        count = len(probes)
+        offset = _COUNTS.size
+        employee_ids = np.frombuffer(response, dtype='<i8', count=count, offset=offset)
+        similarities = np.frombuffer(response, dtype='<f4', count=count, offset=offset + count * 8)
+        return employee_ids, similarities
+
+    def best_match(self, probe):
+        employee_ids, similarities = self.best_matches(probe)
+        if employee_ids[0] < 0:
+            return None, 0.0
+        return int(employee_ids[0]), float(similarities[0])
+
+    def upsert(self, employee_id, templates):
+        block = as_template_block(templates)
+        self._call(OP_UPSERT, _EMPLOYEE_ID.pack(employee_id) + block.astype('<f4', copy=False).tobytes())
+
+    def remove(self, employee_ids):
+        if employee_ids:
+            self._call(OP_REMOVE, np.asarray(employee_ids, dtype='<i8').tobytes())
+
+    def load(self, templates_by_employee, generation=0):
+        self._call(OP_LOAD, _encode_load(templates_by_employee, generation))
+
+
+def employee_subset(name, employee_ids):
+    """Return the ``(key, employee_ids)`` subset of a ``SidecarGallery``
+
+    The key names the subset and the employees in it, so a subset whose
+    employees changed is a new one to the daemon.
+    """
+    employee_ids = np.asarray(employee_ids, dtype=np.int64)
+    return '%s:%s' % (name, hashlib.sha1(employee_ids.tobytes()).hexdigest()), employee_ids
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_matching_client(socket_path=DEFAULT_SOCKET_PATH):
+    """Return the process-wide client for ``socket_path``"""
+    with _clients_lock:
+        client = _clients.get(socket_path)
+        if client is None:
+            client = _clients[socket_path] = MatchingServiceClient(socket_path)
+        return client
+
+
+class SidecarGallery(object):
+    """Match through the daemon, loading it on demand
+
+    ``load_templates`` returns the ``(employee_id, templates)`` pairs from
+    the database; it is called when the daemon has no gallery yet. With
+    ``subset``, a ``(key, employee_ids)`` pair whose key changes with its
+    employees, matches are restricted to those employees; the daemon is
+    only sent them when it does not know the key yet.
+    """
+
+    def __init__(self, client, load_templates, subset=None):
+        self.client = client
+        self.load_templates = load_templates
+        self.subset = subset
+        # Daemon generation as of the last ensure_loaded()
+        self.generation = None
+
+    def __len__(self):
+        return len(self.client)
+
+    @property
+    def template_count(self):
+        return self.client.template_count
+
+    def ensure_loaded(self):
+        status = self.client.status()
+        self.generation = status['generation']
+        if not status['loaded']:
+            self.reload(status['generation'])
+
+    def reload(self, generation=None):
+        if generation is None:
+            generation = self.client.status()['generation']
+        self.client.load(self.load_templates(), generation)
+        self.generation = self.client.status()['generation']
+
+    def best_matches(self, probes):
+        key = self.subset[0] if self.subset else None
+        # A restarted daemon has neither the gallery nor the subset
+        for _attempt in range(2):
+            try:
+                return self.client.best_matches(probes, key)
+            except GalleryNotLoaded:
+                self.reload()
+            except UnknownSubset:
+                self.client.define_subset(*self.subset)
+        return self.client.best_matches(probes, key)
+
+    def best_match(self, probe):
+        employee_ids, similarities = self.best_matches(probe)
+        if employee_ids[0] < 0:
+            return None, 0.0
+        return int(employee_ids[0]), float(similarities[0])
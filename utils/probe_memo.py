@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .descriptor_codec import DESCRIPTOR_SIZE
+
+# Random hyperplanes of the locality-sensitive bucket; near-identical
+# probes fall on the same side of each with high probability
+BUCKET_BITS = 8
+_PLANES = np.random.RandomState(20240521).standard_normal((DESCRIPTOR_SIZE, BUCKET_BITS)).astype(np.float32)
+
+DEFAULT_MEMO_TTL = 3.0
+DEFAULT_MEMO_DISTANCE = 0.05
+# Probes remembered per kiosk, and kiosks remembered per worker
+DEFAULT_MEMO_ENTRIES = 32
+DEFAULT_MEMO_KIOSKS = 1024
+
+
+def probe_bucket(probe):
+    """Sign pattern of the probe against the hyperplanes, as a small int"""
+    bits = (np.asarray(probe, dtype=np.float32) @ _PLANES) > 0
+    return int(np.packbits(bits)[0])
+
+
+class _Scope(object):
+    __slots__ = ('generation', 'entries')
+
+    def __init__(self, generation):
+        self.generation = generation
+        # (bucket, probe bytes) -> (probe, employee_id, similarity, runner_up, expires_at)
+        self.entries = OrderedDict()
+
+
+class ProbeMemo(object):
+    """Recent match results per kiosk, for the next frames of the same face
+
+    A kiosk sends several frames of a person in a row, each a few
+    hundredths apart in descriptor space. Results are kept for ``ttl``
+    seconds under the probe's bucket and reused for a probe within
+    ``max_distance`` of the remembered one. By the triangle inequality the
+    new probe's distance to any template is then within ``max_distance``
+    of the remembered probe's, which bounds the confidence error, and the
+    best employee stays best if it led the runner-up by twice that.
+
+    Each kiosk's results are tagged with the generation of the gallery
+    they were matched against, and dropped when it changes.
+    """
+
+    def __init__(self, ttl=DEFAULT_MEMO_TTL, max_distance=DEFAULT_MEMO_DISTANCE,
+                 max_entries=DEFAULT_MEMO_ENTRIES, max_kiosks=DEFAULT_MEMO_KIOSKS):
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.max_kiosks = max_kiosks
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self._scopes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return self.ttl > 0
+
+    def _scope(self, kiosk, generation):
+        scope = self._scopes.get(kiosk)
+        if scope is None:
+            scope = self._scopes[kiosk] = _Scope(generation)
+            while len(self._scopes) > self.max_kiosks:
+                self._scopes.popitem(last=False)
+        else:
+            self._scopes.move_to_end(kiosk)
+            if scope.generation != generation:
+                scope.generation = generation
+                scope.entries.clear()
+                self.flushes += 1
+        return scope
+
+    def lookup(self, kiosk, generation, probe):
+        """Return ``(employee_id, similarity, runner_up, distance)`` remembered for a close probe, or None"""
+        probe = np.asarray(probe, dtype=np.float32)
+        bucket = probe_bucket(probe)
+        now = time.monotonic()
+        with self._lock:
+            scope = self._scope(kiosk, generation)
+            for key, (known, employee_id, similarity, runner_up, expires_at) in list(scope.entries.items()):
+                if expires_at <= now:
+                    del scope.entries[key]
+                    continue
+                if key[0] != bucket:
+                    continue
+                distance = float(np.linalg.norm(known - probe))
+                if distance <= self.max_distance:
+                    scope.entries.move_to_end(key)
+                    self.hits += 1
+                    return employee_id, similarity, runner_up, distance
+            self.misses += 1
+        return None
+
+    def store(self, kiosk, generation, probe, employee_id, similarity, runner_up):
+        probe = np.array(probe, dtype=np.float32)
+        key = (probe_bucket(probe), probe.tobytes())
+        with self._lock:
+            scope = self._scope(kiosk, generation)
+            scope.entries[key] = (probe, employee_id, similarity, runner_up, time.monotonic() + self.ttl)
+            scope.entries.move_to_end(key)
+            while len(scope.entries) > self.max_entries:
+                scope.entries.popitem(last=False)
+
+    def flush(self):
+        with self._lock:
+            self._scopes.clear()
+            self.flushes += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': bool(self),
+                'ttl_seconds': self.ttl,
+                'max_distance': self.max_distance,
+                'kiosks': len(self._scopes),
+                'entries': sum(len(scope.entries) for scope in self._scopes.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'flushes': self.flushes,
+            }
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""On-demand sampling profiler for the verify and register requests
+
+A manager starts a capture for the next N requests of this worker, or for
+a time window. While it runs, a background thread samples the stacks of
+the threads serving those requests every few milliseconds, which costs
+the requests nothing but the GIL handoffs; the gallery builds they
+trigger are traced with ``tracemalloc``. The capture stops by itself and
+is written to the data directory as:
+
+- ``<id>.collapsed``: one ``frame;frame;... count`` line per stack, for
+  flame graph tools
+- ``<id>.pstats``: the samples as ``pstats`` data, for ``pstats`` or
+  snakeviz, with sample time standing in for call time
+- ``<id>.json``: the capture summary and the allocation statistics
+"""
+import itertools
+import json
+import logging
+import marshal
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+DEFAULT_SAMPLE_INTERVAL = 0.005
+MIN_SAMPLE_INTERVAL = 0.001
+# Bounds of one capture
+MAX_PROFILE_REQUESTS = 1000
+MAX_PROFILE_SECONDS = 600
+# Captures kept on disk per database
+PROFILE_HISTORY = 5
+# Frames kept per allocation traceback, and allocation sites reported
+ALLOCATION_FRAMES = 10
+TOP_ALLOCATIONS = 25
+
+PROFILE_FORMATS = {
+    'collapsed': ('text/plain', '.collapsed'),
+    'pstats': ('application/octet-stream', '.pstats'),
+    'allocations': ('application/json', '.json'),
+}
+
+_CAPTURE_ID = re.compile(r'^[\w-]+$')
+
+_logger = logging.getLogger(__name__)
+
+_capture = None
+# Tells apart the captures a worker starts within the same second
+_capture_sequence = itertools.count(1)
+_capture_lock = threading.Lock()
+_tracemalloc_users = 0
+
+
+def _frame_key(code):
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+
+def _frame_label(key):
+    filename, lineno, name = key
+    return '%s (%s:%d)' % (name, '/'.join(filename.split(os.sep)[-2:]), lineno)
+
+
+class ProfileCapture(object):
+    """One capture: the stacks sampled and the allocations traced"""
+
+    def __init__(self, directory, max_requests=None, seconds=None, interval=DEFAULT_SAMPLE_INTERVAL):
+        self.id = '%s-%d-%d' % (time.strftime('%Y%m%d-%H%M%S'), os.getpid(), next(_capture_sequence))
+        self.directory = directory
+        self.max_requests = max_requests
+        self.interval = interval
+        self.started_at = time.time()
+        self.deadline = self.started_at + (seconds or MAX_PROFILE_SECONDS)
+        self.requests = 0
+        self.samples = 0
+        # (request name, frame key, ...) from the outermost frame -> samples
+        self.stacks = Counter()
+        self.allocations = []
+        self.finished_at = None
+        self._threads = {}
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True, name='face-recognition-profiler')
+
+    @property
+    def active(self):
+        return not self._stopped.is_set()
+
+    def _enter(self, name):
+        """Register the current thread; False when the capture takes no more requests"""
+        with _capture_lock:
+            if not self.active or time.time() >= self.deadline or (
+                    self.max_requests and self.requests >= self.max_requests):
+                return False
+            self.requests += 1
+            self._threads[threading.get_ident()] = name
+            return True
+
+    def _exit(self):
+        with _capture_lock:
+            self._threads.pop(threading.get_ident(), None)
+            done = self.max_requests and self.requests >= self.max_requests and not self._threads
+        if done:
+            self.stop()
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            if time.time() >= self.deadline:
+                self.stop()
+                break
+            with _capture_lock:
+                threads = dict(self._threads)
+            frames = sys._current_frames()
+            for ident, name in threads.items():
+                frame = frames.get(ident)
+                if frame is None or ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_key(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                self.stacks[(name,) + tuple(stack)] += 1
+                self.samples += 1
+        # Written here rather than by whoever stopped the capture, so the
+        # request that ends it does not wait on the disk
+        try:
+            self._write()
+        except OSError:
+            _logger.warning("Could not write face recognition profile %s to %s",
+                            self.id, self.directory, exc_info=True)
+
+    def start(self):
+        self._sampler.start()
+
+    def stop(self):
+        """Stop sampling; the sampler thread then writes the results"""
+        with _capture_lock:
+            if not self.active:
+                return
+            self._stopped.set()
+            self.finished_at = time.time()
+
+    def collapsed(self):
+        lines = []
+        for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1]):
+            lines.append('%s %d' % (';'.join([stack[0]] + [_frame_label(key) for key in stack[1:]]), count))
+        return '\n'.join(lines) + '\n'
+
+    def pstats(self):
+        """Return the samples as marshalled ``pstats`` data
+
+        Each sample counts as a call of ``interval`` seconds: to the leaf
+        function as its own time, and to every function of the stack as
+        cumulative time.
+        """
+        stats = {}
+        for stack, count in self.stacks.items():
+            frames = stack[1:]
+            seconds = count * self.interval
+            seen = set()
+            for depth, key in enumerate(frames):
+                entry = stats.setdefault(key, [0, 0, 0.0, 0.0, {}])
+                leaf = depth == len(frames) - 1
+                if key not in seen:
+                    entry[0] += count
+                    entry[1] += count
+                    entry[3] += seconds
+                    seen.add(key)
+                if leaf:
+                    entry[2] += seconds
+                if depth:
+                    caller = entry[4].setdefault(frames[depth - 1], [0, 0, 0.0, 0.0])
+                    caller[0] += count
+                    caller[1] += count
+                    caller[2] += seconds if leaf else 0.0
+                    caller[3] += seconds
+        return marshal.dumps({
+            key: (cc, nc, tt, ct, {caller: tuple(values) for caller, values in callers.items()})
+            for key, (cc, nc, tt, ct, callers) in stats.items()
+        })
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'active': self.active,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'deadline': self.deadline,
+            'max_requests': self.max_requests,
+            'requests': self.requests,
+            'samples': self.samples,
+            'interval_ms': self.interval * 1000,
+            'pid': os.getpid(),
+        }
+
+    def _write(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, self.id)
+        with open(path + '.collapsed', 'w') as f:
+            f.write(self.collapsed())
+        with open(path + '.pstats', 'wb') as f:
+            f.write(self.pstats())
+        with open(path + '.json', 'w') as f:
+            json.dump(dict(self.summary(), allocations=self.allocations), f, indent=1)
+        # Oldest captures go first
+        captures = sorted(name[:-len('.json')] for name in os.listdir(self.directory) if name.endswith('.json'))
+        for capture_id in captures[:-PROFILE_HISTORY]:
+            for _content_type, suffix in PROFILE_FORMATS.values():
+                try:
+                    os.unlink(os.path.join(self.directory, capture_id + suffix))
+                except OSError:
+                    pass
+
+
+def start_capture(directory, max_requests=None, seconds=None, interval=DEFAULT_SAMPLE_INTERVAL):
+    """Start a capture in this worker, stopping the running one if any"""
+    global _capture
+    capture = ProfileCapture(
+        directory,
+        max_requests=min(max_requests, MAX_PROFILE_REQUESTS) if max_requests else None,
+        seconds=min(seconds, MAX_PROFILE_SECONDS) if seconds else None,
+        interval=max(interval, MIN_SAMPLE_INTERVAL),
+    )
+    with _capture_lock:
+        previous, _capture = _capture, capture
+    if previous:
+        previous.stop()
+    capture.start()
+    return capture
+
+
+def current_capture():
+    return _capture
+
+
+@contextmanager
+def profiled(name):
+    """Sample the current thread for the running capture, if it takes this request"""
+    capture = _capture
+    if capture is None or not capture._enter(name):
+        yield
+        return
+    try:
+        yield
+    finally:
+        capture._exit()
+
+
+@contextmanager
+def trace_allocations(name):
+    """Record the allocations of the block with the running capture, if any"""
+    global _tracemalloc_users
+    capture = _capture
+    if capture is None or not capture.active:
+        yield
+        return
+    with _capture_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(ALLOCATION_FRAMES)
+        _tracemalloc_users += 1
+    before = tracemalloc.take_snapshot()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        with _capture_lock:
+            _tracemalloc_users -= 1
+            if not _tracemalloc_users:
+                tracemalloc.stop()
+        capture.allocations.append({
+            'name': name,
+            'seconds': time.perf_counter() - start,
+            'peak_bytes': peak,
+            'top': [{
+                'where': str(stat.traceback),
+                'size_diff': stat.size_diff,
+                'count_diff': stat.count_diff,
+            } for stat in after.compare_to(before, 'lineno')[:TOP_ALLOCATIONS]],
+        })
+
+
+def list_captures(directory):
+    """Return the summaries of the captures stored in ``directory``, newest first"""
+    summaries = []
+    if not os.path.isdir(directory):
+        return summaries
+    for name in sorted(os.listdir(directory), reverse=True):
+        if name.endswith('.json'):
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    summary = json.load(f)
+            except (OSError, ValueError):
+                continue
+            summary.pop('allocations', None)
+            summaries.append(summary)
+    return summaries
+
+
+def capture_path(directory, capture_id, fmt):
+    """Return the file of a stored capture in ``fmt``, or None"""
+    if fmt not in PROFILE_FORMATS or not _CAPTURE_ID.match(capture_id or ''):
+        return None
+    path = os.path.join(directory, capture_id + PROFILE_FORMATS[fmt][1])
+    return path if os.path.exists(path) else None
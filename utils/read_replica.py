@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""Reporting queries on a read-only replica of the database
+
+Set ``face_recognition_replica_dsn`` in the server config to a libpq
+connection string, e.g. ``host=replica dbname=odoo user=odoo_ro``, to run
+the health, diagnostics and log queries there instead of competing with
+check-ins on the primary. Any database with the same schema will do, such
+as a copy restored on the local server. Without it, or while the replica
+is unreachable or lags too far behind, the queries run on the primary.
+
+The replica stands in for one database only: the one named
+``face_recognition_replica_database``, by default the ``dbname`` of the
+DSN. The other databases of the server report on their own primary.
+
+The replica's lag is only taken as 0 while it streams from its upstream,
+which its role can only see with the privileges of ``pg_read_all_stats``
+(e.g. as a member of ``pg_monitor``); otherwise the lag is the age of the
+last replayed transaction.
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+import psycopg2.pool
+
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+# Milliseconds a replica query may run, seconds a connection may take to
+# open, seconds of replication lag tolerated, and connections kept per
+# worker; ``face_recognition_replica_*`` in the server config override them
+DEFAULT_REPLICA_STATEMENT_TIMEOUT = 5000
+DEFAULT_REPLICA_CONNECT_TIMEOUT = 3
+DEFAULT_REPLICA_MAX_LAG = 30.0
+DEFAULT_REPLICA_POOL_SIZE = 2
+
+# Seconds between two lag measurements, and before an unreachable
+# replica is tried again
+LAG_CHECK_INTERVAL = 10.0
+REPLICA_RETRY_INTERVAL = 30.0
+
+# Seconds the replica is behind; 0 for a primary, or a replica streaming
+# from its upstream that replayed everything it received (an idle primary
+# sends nothing). A replica that lost its upstream has received
+# everything it will, so it is as old as its last replayed transaction,
+# and NULL when it replayed none.
+_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN streaming AND pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        WHEN pg_last_xact_replay_timestamp() IS NOT NULL
+            THEN EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+        WHEN streaming THEN 0
+    END AS lag
+    FROM (SELECT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') AS streaming) AS receiver
+"""
+
+
+class ReplicaUnavailable(Exception):
+    """The replica cannot serve the query; run it on the primary"""
+
+
+class ReadReplica(object):
+    """Pooled read-only connections to a replica, with a lag bound
+
+    The pool is created lazily in each worker process. Connections are in
+    autocommit, read-only, and carry a statement timeout; opening one gives
+    up after ``connect_timeout`` seconds, so an unreachable host delays a
+    report by that much before it runs on the primary.
+    """
+
+    def __init__(self, dsn, statement_timeout=DEFAULT_REPLICA_STATEMENT_TIMEOUT,
+                 max_lag=DEFAULT_REPLICA_MAX_LAG, pool_size=DEFAULT_REPLICA_POOL_SIZE,
+                 connect_timeout=DEFAULT_REPLICA_CONNECT_TIMEOUT, database=None):
+        self.dsn = dsn
+        if dsn and not database:
+            database = psycopg2.extensions.parse_dsn(dsn).get('dbname')
+        self.database = database
+        self.statement_timeout = statement_timeout
+        self.connect_timeout = connect_timeout
+        self.max_lag = max_lag
+        self.pool_size = pool_size
+        self.lag = None
+        # Whether the last measured lag was over max_lag, or unknown
+        self.behind = False
+        self.queries = 0
+        self.fallbacks = 0
+        self.last_error = None
+        self._lag_checked = 0.0
+        self._down_until = 0.0
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self.dsn)
+
+    def serves(self, dbname):
+        """Whether the replica stands in for database ``dbname``"""
+        return bool(self) and dbname == self.database
+
+    def _get_pool(self):
+        with self._lock:
+            # A pool inherited from the parent process is not ours to use
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = psycopg2.pool.ThreadedConnectionPool(
+                    0, self.pool_size, dsn=self.dsn,
+                    connect_timeout=self.connect_timeout,
+                    options='-c statement_timeout=%d' % self.statement_timeout,
+                    application_name='odoo-face-recognition-reports')
+                self._pid = os.getpid()
+            return self._pool
+
+    @contextmanager
+    def _connection(self):
+        pool = self._get_pool()
+        conn = pool.getconn()
+        broken = False
+        try:
+            if not conn.autocommit:
+                conn.set_session(readonly=True, autocommit=True)
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            pool.putconn(conn, close=broken or bool(conn.closed))
+
+    def query(self, query, params=()):
+        """Return the rows of ``query`` as dicts, or raise ``ReplicaUnavailable``
+
+        A query cancelled by the statement timeout is raised as is: running
+        it on the primary would bring back the load the replica is for.
+        """
+        now = time.monotonic()
+        if now < self._down_until:
+            raise ReplicaUnavailable(self.last_error)
+        try:
+            with self._connection() as conn, conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cr:
+                if now - self._lag_checked >= LAG_CHECK_INTERVAL:
+                    cr.execute(_LAG_QUERY)
+                    lag = cr.fetchone()['lag']
+                    self.lag = float(lag) if lag is not None else None
+                    self.behind = self.lag is None or self.lag > self.max_lag
+                    self._lag_checked = now
+                if self.behind:
+                    if self.lag is None:
+                        raise ReplicaUnavailable("Replica is not streaming and has replayed nothing")
+                    raise ReplicaUnavailable("Replica is %.0f s behind the primary" % self.lag)
+                cr.execute(query, params)
+                rows = [dict(row) for row in cr.fetchall()]
+        except psycopg2.extensions.QueryCanceledError:
+            raise
+        except psycopg2.pool.PoolError as e:
+            # Every connection of this worker is busy; only this query moves
+            raise ReplicaUnavailable(str(e))
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            self.last_error = str(e).strip()
+            self._down_until = now + REPLICA_RETRY_INTERVAL
+            _logger.warning("Read replica unavailable, reporting on the primary for %d s: %s",
+                            REPLICA_RETRY_INTERVAL, self.last_error)
+            raise ReplicaUnavailable(self.last_error)
+        self.queries += 1
+        return rows
+
+    def status(self):
+        return {
+            'enabled': bool(self),
+            'database': self.database,
+            'available': bool(self) and time.monotonic() >= self._down_until and not self.behind,
+            'lag_seconds': self.lag,
+            'max_lag_seconds': self.max_lag,
+            'statement_timeout_ms': self.statement_timeout,
+            'connect_timeout_seconds': self.connect_timeout,
+            'queries': self.queries,
+            'fallbacks': self.fallbacks,
+            'last_error': self.last_error,
+        }
+
+
+def _config_number(key, default, cast):
+    try:
+        return cast(config.get(key, default))
+    except (TypeError, ValueError):
+        return default
+
+
+read_replica = ReadReplica(
+    config.get('face_recognition_replica_dsn') or None,
+    statement_timeout=_config_number(
+        'face_recognition_replica_statement_timeout', DEFAULT_REPLICA_STATEMENT_TIMEOUT, int),
+    max_lag=_config_number('face_recognition_replica_max_lag', DEFAULT_REPLICA_MAX_LAG, float),
+    pool_size=_config_number('face_recognition_replica_pool_size', DEFAULT_REPLICA_POOL_SIZE, int),
+    connect_timeout=_config_number(
+        'face_recognition_replica_connect_timeout', DEFAULT_REPLICA_CONNECT_TIMEOUT, int),
+    database=config.get('face_recognition_replica_database') or None,
+)
+
+
+def report_query(env, query, params=()):
+    """Run a read-only reporting query, returning its rows as dicts
+
+    Runs on the replica when one is configured for the database of
+    ``env`` and usable, else on ``env.cr``.
+    """
+    if read_replica.serves(env.cr.dbname):
+        try:
+            return read_replica.query(query, params)
+        except ReplicaUnavailable:
+            read_replica.fallbacks += 1
+    env.cr.execute(query, params)
+    return env.cr.dictfetchall()
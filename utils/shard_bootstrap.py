@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""Start-up of a sharded matching pool process
+
+Pool processes are started fresh (forkserver or spawn), and the tasks
+they receive name ``_shard_top_k`` by the module path the Odoo worker
+imported it under, e.g. ``odoo.addons.<module>.utils.sharded_matching``.
+A fresh interpreter cannot import that path without Odoo's addons path
+and the addon's ``__init__``, so this file, run with ``runpy.run_path``
+as the pool initializer, loads the numpy-only matching modules from
+this directory under that path instead. ``PACKAGE`` is passed in by
+``sharded_matching``.
+"""
+import importlib.util
+import os
+import sys
+import types
+
+UTILS_PATH = os.path.dirname(os.path.abspath(__file__))
+MODULES = ('descriptor_codec', 'face_matching', 'sharded_matching')
+
+
+def _load(package):
+    # Stand-ins for the parent packages, so none of their __init__ runs
+    parts = package.split('.')
+    for depth in range(1, len(parts) + 1):
+        name = '.'.join(parts[:depth])
+        if name not in sys.modules:
+            module = types.ModuleType(name)
+            module.__path__ = []
+            sys.modules[name] = module
+    sys.modules[package].__path__ = [UTILS_PATH]
+    for name in MODULES:
+        qualified = '%s.%s' % (package, name)
+        if qualified not in sys.modules:
+            spec = importlib.util.spec_from_file_location(qualified, os.path.join(UTILS_PATH, '%s.py' % name))
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[qualified] = module
+            spec.loader.exec_module(module)
+
+
+_load(PACKAGE)  # noqa: F821
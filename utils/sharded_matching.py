@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""Parallel matching of large galleries across a pool of processes
+
+The template matrix and its squared norms are copied once into
+``multiprocessing.shared_memory`` segments. Each pool process attaches to
+them by name and scores the probes against one shard (a contiguous range
+of rows), returning its local top-k; the caller merges the per-shard
+results. Small galleries are matched in-process, where the pool round
+trip would cost more than it saves.
+
+The pool processes are started with forkserver (spawn where it is not
+available), never forked from the Odoo worker: a worker is multithreaded
+(log listener, BLAS, warm-up and profiler threads), and a child forked
+while another thread holds a lock can deadlock on it. Nothing needs to be
+inherited, the gallery being in shared memory. Every Odoo worker has its
+own pool, so ``max_pool_processes`` bounds one pool by the CPUs of the
+host divided among the workers.
+
+This module has no Odoo dependency so the pool processes stay light.
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import runpy
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .descriptor_codec import DESCRIPTOR_SIZE
+from .face_matching import FaceGallery, similarity_from_distance
+
+_logger = logging.getLogger(__name__)
+
+# Galleries with fewer templates than this are matched in-process
+DEFAULT_MIN_SHARDED_TEMPLATES = 20000
+
+# Segments a pool process keeps attached; older ones are closed first
+_MAX_ATTACHED_SEGMENTS = 32
+
+_BOOTSTRAP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shard_bootstrap.py')
+
+_pool = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+# Worker side: the segments of the galleries alive in this process, and a
+# generation bumped whenever one is released, sent with every task
+_live_segments = frozenset()
+_segments_generation = 0
+_segments_lock = threading.Lock()
+
+
+def max_pool_processes(workers):
+    """Return the pool size each of ``workers`` Odoo workers may use
+
+    The host's CPUs shared among the workers, so that all pools together
+    do not start more processes than there are CPUs.
+    """
+    return max(1, (os.cpu_count() or 1) // max(workers, 1))
+
+
+def _get_pool(processes):
+    """Return the process pool, (re)created with ``processes`` workers"""
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or _pool_size != processes:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            # Fresh processes load this module from its file under the same
+            # name, without importing Odoo; they share the parent's resource
+            # tracker, which owns the segments
+            _pool = ProcessPoolExecutor(
+                max_workers=processes, mp_context=context,
+                initializer=runpy.run_path,
+                initargs=(_BOOTSTRAP_PATH, {'PACKAGE': __name__.rpartition('.')[0]}),
+            )
+            _pool_size = processes
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown_pool)
+
+
+# Pool process side: segment name -> attached SharedMemory, and the
+# generation of the live segments last detached against
+_attached = OrderedDict()
+_attached_generation = 0
+
+
+def _detach_released(generation, live):
+    """Close the mappings of the segments no live gallery uses any more
+
+    A released gallery's memory is only returned once every process
+    mapping its unlinked segments has closed them.
+    """
+    global _attached_generation
+    # Tasks of several worker threads may arrive out of order
+    if generation <= _attached_generation:
+        return
+    _attached_generation = generation
+    for name in [name for name in _attached if name not in live]:
+        _attached.pop(name).close()
+
+
+def _attach(name):
+    segment = _attached.get(name)
+    if segment is None:
+        segment = shared_memory.SharedMemory(name=name)
+        _attached[name] = segment
+        while len(_attached) > _MAX_ATTACHED_SEGMENTS:
+            _attached.popitem(last=False)[1].close()
+    else:
+        _attached.move_to_end(name)
+    return segment
+
+
+def _shard_top_k(matrix_name, norms_name, template_count, start, stop, probes, k, generation=0, live=()):
+    """Return the ``(rows, distances)`` of the k closest templates in a shard
+
+    Runs in a pool process. Rows are indices into the full matrix, both
+    arrays are (P, k) sorted by increasing distance. ``generation`` and
+    ``live`` are the worker's live segments, for ``_detach_released``.
+    """
+    _detach_released(generation, live)
+    matrix = np.ndarray((template_count, DESCRIPTOR_SIZE), dtype=np.float32,
+                        buffer=_attach(matrix_name).buf)[start:stop]
+    sq_norms = np.ndarray((template_count,), dtype=np.float32,
+                          buffer=_attach(norms_name).buf)[start:stop]
+
+    sq = probes @ matrix.T
+    sq *= -2.0
+    sq += np.einsum('ij,ij->i', probes, probes)[:, None]
+    sq += sq_norms[None, :]
+    np.maximum(sq, 0.0, out=sq)
+
+    k = min(k, stop - start)
+    if k < sq.shape[1]:
+        candidates = np.argpartition(sq, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(sq.shape[1]), sq.shape)
+    candidate_sq = np.take_along_axis(sq, candidates, axis=1)
+    order = np.argsort(candidate_sq, axis=1)
+    rows = np.take_along_axis(candidates, order, axis=1) + start
+    distances = np.sqrt(np.take_along_axis(candidate_sq, order, axis=1))
+    return rows, distances
+
+
+def _release_segments(segments):
+    global _live_segments, _segments_generation
+    with _segments_lock:
+        _live_segments = _live_segments.difference(segment.name for segment in segments)
+        _segments_generation += 1
+    for segment in segments:
+        try:
+            segment.close()
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class ShardedFaceGallery(FaceGallery):
+    """A ``FaceGallery`` whose matrix lives in shared memory, scored in shards
+
+    The segments are unlinked once the gallery is garbage collected, so a
+    request still matching against a replaced gallery is not cut short.
+    """
+    __slots__ = ('shards', 'segments', '__weakref__')
+
+    def __init__(self, matrix, owners, shards):
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32).reshape(-1, DESCRIPTOR_SIZE)
+        matrix_segment = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+        norms_segment = shared_memory.SharedMemory(create=True, size=max(len(matrix) * 4, 1))
+        self.segments = (matrix_segment, norms_segment)
+        weakref.finalize(self, _release_segments, self.segments)
+        global _live_segments
+        with _segments_lock:
+            _live_segments = _live_segments.union(segment.name for segment in self.segments)
+
+        shared = np.ndarray(matrix.shape, dtype=np.float32, buffer=matrix_segment.buf)
+        shared[:] = matrix
+        super().__init__(shared, owners)
+        # FaceGallery computed the norms; move them into shared memory too
+        sq_norms = np.ndarray(self.sq_norms.shape, dtype=np.float32, buffer=norms_segment.buf)
+        sq_norms[:] = self.sq_norms
+        self.sq_norms = sq_norms
+
+        bounds = np.linspace(0, len(matrix), min(shards, max(len(matrix), 1)) + 1).astype(int)
+        self.shards = [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+    def top_k(self, probes, k=1):
+        """Score the probes on every shard in parallel and merge the top-k
+
+        Falls back to in-process matching if the pool fails.
+        """
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        if not self.template_count:
+            return super().top_k(probes, k)
+
+        try:
+            pool = _get_pool(len(self.shards))
+            with _segments_lock:
+                generation, live = _segments_generation, _live_segments
+            futures = [
+                pool.submit(_shard_top_k, self.segments[0].name, self.segments[1].name,
+                            self.template_count, start, stop, probes, k, generation, live)
+                for start, stop in self.shards
+            ]
+            parts = [future.result() for future in futures]
+        except Exception as e:
+            _logger.warning("Sharded face matching failed, matching in-process: %s", e)
+            return super().top_k(probes, k)
+
+        rows = np.concatenate([part[0] for part in parts], axis=1)
+        distances = np.concatenate([part[1] for part in parts], axis=1)
+        order = np.argsort(distances, axis=1)[:, :k]
+        rows = np.take_along_axis(rows, order, axis=1)
+        distances = np.take_along_axis(distances, order, axis=1)
+        return self.owners[rows], similarity_from_distance(distances)
+
+    def best_matches(self, probes):
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        employee_ids = np.full(len(probes), -1, dtype=np.int64)
+        similarities = np.zeros(len(probes), dtype=np.float32)
+        if not self.template_count:
+            return employee_ids, similarities
+        best_ids, best_similarities = self.top_k(probes, 1)
+        return best_ids[:, 0], best_similarities[:, 0]
+
+
+def build_face_gallery(templates_by_employee, shards=0, min_templates=DEFAULT_MIN_SHARDED_TEMPLATES):
+    """Build an in-process or, for large galleries, a sharded gallery
+
+    Sharding is used when ``shards`` is above 1 and the gallery holds at
+    least ``min_templates`` templates.
+    """
+    gallery = FaceGallery.from_templates(templates_by_employee)
+    if shards > 1 and gallery.template_count >= min_templates:
+        try:
+            return ShardedFaceGallery(gallery.matrix, gallery.owners, shards)
+        except OSError as e:
+            # e.g. /dev/shm too small for the gallery
+            _logger.warning("Cannot place the face gallery in shared memory: %s", e)
+    return gallery
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+
+def diff_snapshot(old, new, path=()):
+    """Return what changed from ``old`` to ``new``, two JSON-like dicts
+
+    Returns ``(changes, removed)``: ``changes`` lists ``[path, value]``
+    for every value that is new or differs, ``removed`` the paths that
+    disappeared, a path being the list of keys leading to the value.
+    Only dicts are compared key by key; lists and scalars are replaced
+    as a whole.
+    """
+    changes = []
+    removed = []
+    for key, value in new.items():
+        key_path = list(path) + [key]
+        if key not in old:
+            changes.append([key_path, value])
+        elif isinstance(value, dict) and isinstance(old[key], dict):
+            sub_changes, sub_removed = diff_snapshot(old[key], value, key_path)
+            changes.extend(sub_changes)
+            removed.extend(sub_removed)
+        elif old[key] != value:
+            changes.append([key_path, value])
+    removed.extend(list(path) + [key] for key in old if key not in new)
+    return changes, removed
+
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Downscaled attendance captures, cached on disk
+
+Thumbnails are keyed by the checksum of the stored capture and their size,
+so a file never goes stale: a new capture has a new checksum. They live in
+``<data_dir>/face_recognition_thumbnails/<db>``, shared by the workers of
+the host, and are dropped once unused for ``THUMBNAIL_MAX_AGE_DAYS``.
+"""
+import os
+import re
+import tempfile
+import time
+
+from odoo.tools import config
+from odoo.tools.image import image_process
+
+THUMBNAIL_SIZES = (64, 128, 256, 512)
+DEFAULT_THUMBNAIL_SIZE = 256
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_MAX_AGE_DAYS = 30
+
+_CHECKSUM = re.compile(r'^[0-9a-f]{40}$')
+
+
+def thumbnail_directory(dbname):
+    return os.path.join(config['data_dir'], 'face_recognition_thumbnails', dbname)
+
+
+def thumbnail_etag(checksum, size):
+    return '%s-%d' % (checksum, size)
+
+
+def get_thumbnail(dbname, checksum, size, read_original):
+    """Return the JPEG thumbnail of the capture with ``checksum``
+
+    ``read_original`` returns the stored capture; it is only called when
+    the thumbnail is not on disk yet.
+    """
+    if not _CHECKSUM.match(checksum or '') or size not in THUMBNAIL_SIZES:
+        raise ValueError("Invalid thumbnail %r at size %r" % (checksum, size))
+    directory = os.path.join(thumbnail_directory(dbname), checksum[:2])
+    path = os.path.join(directory, '%s.jpg' % thumbnail_etag(checksum, size))
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        # Reads do not update atime on most mounts; the mtime marks use
+        os.utime(path)
+        return data
+    except FileNotFoundError:
+        pass
+
+    data = image_process(read_original(), size=(size, size), quality=THUMBNAIL_QUALITY, output_format='JPEG')
+    os.makedirs(directory, exist_ok=True)
+    # Written aside and renamed, so another worker never reads half a file
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+    return data
+
+
+def prune_thumbnails(dbname, max_age_days=THUMBNAIL_MAX_AGE_DAYS):
+    """Remove the thumbnails unused for ``max_age_days``; return how many"""
+    root = thumbnail_directory(dbname)
+    limit = time.time() - max_age_days * 86400
+    removed = 0
+    for directory, _dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            try:
+                if os.path.getmtime(path) < limit:
+                    os.unlink(path)
+                    removed += 1
+            except OSError:
+                pass
+    return removed
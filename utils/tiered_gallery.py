@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+
+from .face_matching import FaceGallery, similarity_from_distance
+
+# Employees with an attendance within this many hours, or still checked
+# in, form the hot tier
+DEFAULT_HOT_TIER_HOURS = 48
+# Percentage points the best hot match must lead the runner-up by to be
+# accepted without searching the rest of the gallery
+DEFAULT_HOT_TIER_MARGIN = 10.0
+# Seconds between two reads of the attendances changed since the last one,
+# and between two full reads
+HOT_TIER_REFRESH = 60
+HOT_TIER_RELOAD = 600
+# Attendances are read back this far before the last read, for the
+# transactions that started before it but committed after
+HOT_TIER_SYNC_OVERLAP = timedelta(minutes=5)
+
+
+class TieredGallery(object):
+    """A partition gallery with the templates of its hot employees up front
+
+    The hot tier is a small in-process copy of the hot employees' rows. The
+    cold tier is the partition gallery itself, sharded or not, so falling
+    through gives exactly the untiered result; the hot rows scored twice
+    are a small fraction of it, and the large gallery is not rebuilt each
+    time the hot set changes.
+    """
+
+    def __init__(self, gallery, hot_ids):
+        self.cold = gallery
+        self.hot_ids = hot_ids
+        mask = np.isin(gallery.owners, np.fromiter(hot_ids, dtype=np.int64, count=len(hot_ids)))
+        self.hot = FaceGallery(gallery.matrix[mask], gallery.owners[mask])
+        # The gallery keeps an employee's templates contiguous, and so does the mask
+        owners = self.hot.owners
+        self._starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]]) if len(owners) else owners
+
+    def __len__(self):
+        return len(self.cold)
+
+    @property
+    def template_count(self):
+        return self.cold.template_count
+
+    def best_hot_matches(self, probe, k=2):
+        """Return ``(employee_ids, similarities)`` of the k best hot employees"""
+        if not self.hot.template_count:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        distances = np.minimum.reduceat(self.hot.distances(probe)[0], self._starts)
+        best = np.argsort(distances)[:k]
+        return self.hot.owners[self._starts[best]], similarity_from_distance(distances[best])
+
+    def best_match(self, probe, threshold, margin, stats=None):
+        """Return ``(employee_id, similarity, tier, runner_up)`` for one probe
+
+        The best hot employee is accepted when its similarity reaches
+        ``threshold`` and leads the runner-up by ``margin`` (both 0-1);
+        otherwise the whole gallery is searched. ``runner_up`` is as in
+        ``FaceGallery.best_match_with_runner_up``; for a hot match, the hot
+        runner-up plus ``margin``, the lead the match needed over it.
+        """
+        start = time.perf_counter()
+        employee_ids, similarities = self.best_hot_matches(probe)
+        accepted = bool(len(employee_ids)) and similarities[0] >= threshold and (
+            len(employee_ids) < 2 or similarities[0] - similarities[1] >= margin)
+        if stats is not None:
+            stats.record('hot', time.perf_counter() - start, accepted)
+        if accepted:
+            runner_up = float(similarities[1]) + margin if len(employee_ids) > 1 else 0.0
+            return int(employee_ids[0]), float(similarities[0]), 'hot', runner_up
+
+        start = time.perf_counter()
+        employee_id, similarity, runner_up = self.cold.best_match_with_runner_up(probe)
+        if stats is not None:
+            stats.record('cold', time.perf_counter() - start)
+        return employee_id, similarity, 'cold', runner_up
+
+
+class HotTier(object):
+    """Last attendance activity per employee, and the tiered galleries built on it
+
+    ``load`` replaces the activity, every ``HOT_TIER_RELOAD`` seconds so
+    that deleted attendances are forgotten; in between ``merge`` adds what
+    changed since the previous read. A partition's tiered gallery is
+    rebuilt when its gallery or the set of hot employees changes.
+    """
+
+    def __init__(self):
+        # employee id -> (last check-in or check-out, still checked in)
+        self.activity = {}
+        self.synced_at = None
+        self.loaded = 0.0
+        self.refreshed = 0.0
+        # Set while a request reads the activity, so no other one does
+        self.refreshing = False
+        self._tiered = {}
+        self.lock = threading.Lock()
+
+    def due(self):
+        """Return ``'load'``, ``'merge'`` or None, what the activity needs"""
+        if self.refreshing:
+            return None
+        now = time.monotonic()
+        if not self.loaded or now - self.loaded >= HOT_TIER_RELOAD:
+            return 'load'
+        if now - self.refreshed >= HOT_TIER_REFRESH:
+            return 'merge'
+        return None
+
+    def load(self, activity, synced_at):
+        self.activity = dict(activity)
+        self.synced_at = synced_at
+        self.loaded = self.refreshed = time.monotonic()
+
+    def merge(self, activity, synced_at):
+        for employee_id, (last_seen, checked_in) in activity.items():
+            known = self.activity.get(employee_id)
+            # The rows read back are the changed ones, so their open state wins
+            self.activity[employee_id] = (max(last_seen, known[0]) if known else last_seen, checked_in)
+        if synced_at and (not self.synced_at or synced_at > self.synced_at):
+            self.synced_at = synced_at
+        self.refreshed = time.monotonic()
+
+    def hot_ids(self, since):
+        return frozenset(employee_id for employee_id, (last_seen, checked_in) in self.activity.items()
+                         if checked_in or last_seen >= since)
+
+    def tiered_gallery(self, key, gallery, since):
+        """Return the ``TieredGallery`` of a partition for employees active after ``since``"""
+        hot_ids = self.hot_ids(since)
+        tiered = self._tiered.get(key)
+        if tiered is None or tiered.cold is not gallery or tiered.hot_ids != hot_ids:
+            tiered = self._tiered[key] = TieredGallery(gallery, hot_ids)
+        return tiered
+
+    def stats(self):
+        return [{
+            'partition': '/'.join(str(part) for part in key),
+            'hot_employees': len(tiered.hot),
+            'hot_templates': tiered.hot.template_count,
+            'cold_templates': tiered.cold.template_count,
+        } for key, tiered in list(self._tiered.items())]
+
+
+class _TierCounters(object):
+    __slots__ = ('searches', 'accepts', 'seconds', 'max_seconds')
+
+    def __init__(self):
+        self.searches = 0
+        self.accepts = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+
+class TierStats(object):
+    """Searches, hot-tier acceptances and latency per tier"""
+
+    def __init__(self):
+        self._tiers = {'hot': _TierCounters(), 'cold': _TierCounters()}
+        self._lock = threading.Lock()
+
+    def record(self, tier, seconds, accepted=False):
+        with self._lock:
+            counters = self._tiers[tier]
+            counters.searches += 1
+            counters.accepts += int(accepted)
+            counters.seconds += seconds
+            counters.max_seconds = max(counters.max_seconds, seconds)
+
+    def stats(self):
+        with self._lock:
+            hot = self._tiers['hot']
+            stats = {
+                'hot_acceptance_rate': hot.accepts / hot.searches if hot.searches else 0.0,
+            }
+            for tier, counters in self._tiers.items():
+                stats[tier] = {
+                    'searches': counters.searches,
+                    'accepts': counters.accepts,
+                    'avg_ms': counters.seconds * 1000 / counters.searches if counters.searches else 0.0,
+                    'max_ms': counters.max_seconds * 1000,
+                }
+            return stats
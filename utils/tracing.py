@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import collections
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from odoo.tools import config
+
+# Requests slower than this are kept in the slow trace ring buffer.
+# Set ``face_recognition_slow_trace_ms`` in the server config to override.
+DEFAULT_SLOW_TRACE_MS = 500.0
+
+# Number of slow traces kept per worker
+SLOW_TRACE_BUFFER_SIZE = 50
+
+_current_trace = contextvars.ContextVar('face_recognition_trace', default=None)
+
+try:
+    slow_trace_threshold = float(config.get('face_recognition_slow_trace_ms', DEFAULT_SLOW_TRACE_MS)) / 1000.0
+except (TypeError, ValueError):
+    slow_trace_threshold = DEFAULT_SLOW_TRACE_MS / 1000.0
+
+_slow_traces = collections.deque(maxlen=SLOW_TRACE_BUFFER_SIZE)
+_slow_traces_lock = threading.Lock()
+
+
+def _sql_counters():
+    """Return the (query count, query time) Odoo keeps on the request thread"""
+    thread = threading.current_thread()
+    return getattr(thread, 'query_count', 0), getattr(thread, 'query_time', 0.0)
+
+
+class Trace(object):
+    """Stage timings collected for one verify/register request"""
+    __slots__ = ('name', 'info', 'started_at', 'spans', 'total',
+                 '_start', '_sql_count', '_sql_time')
+
+    def __init__(self, name, info=None):
+        self.name = name
+        self.info = info or {}
+        self.started_at = time.time()
+        self.spans = []
+        self.total = None
+        self._start = time.perf_counter()
+        self._sql_count, self._sql_time = _sql_counters()
+
+    def add_span(self, name, elapsed, sql_count, sql_time):
+        self.spans.append((name, elapsed, sql_count, sql_time))
+
+    def finish(self):
+        self.total = time.perf_counter() - self._start
+        sql_count, sql_time = _sql_counters()
+        self._sql_count = sql_count - self._sql_count
+        self._sql_time = sql_time - self._sql_time
+
+    def as_dict(self):
+        """Return a JSON-serializable breakdown, times in milliseconds"""
+        total = self.total if self.total is not None else time.perf_counter() - self._start
+        return {
+            'name': self.name,
+            'timestamp': self.started_at,
+            'total_ms': round(total * 1000, 3),
+            'sql_count': self._sql_count,
+            'sql_ms': round(self._sql_time * 1000, 3),
+            'stages': [{
+                'stage': name,
+                'ms': round(elapsed * 1000, 3),
+                'sql_count': sql_count,
+                'sql_ms': round(sql_time * 1000, 3),
+            } for name, elapsed, sql_count, sql_time in self.spans],
+            'info': self.info,
+        }
+
+
+@contextmanager
+def trace_request(name, **info):
+    """Collect stage spans for the enclosed request
+
+    Traces slower than ``slow_trace_threshold`` are stored in the slow trace
+    ring buffer of the current worker.
+    """
+    trace = Trace(name, info)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        trace.finish()
+        if trace.total >= slow_trace_threshold:
+            with _slow_traces_lock:
+                _slow_traces.append(trace.as_dict())
+
+
+@contextmanager
+def span(name):
+    """Time a stage of the current trace; a no-op outside of a trace"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    sql_count, sql_time = _sql_counters()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        end_count, end_time = _sql_counters()
+        trace.add_span(name, elapsed, end_count - sql_count, end_time - sql_time)
+
+
+def current_trace():
+    """Return the trace of the running request, if any"""
+    return _current_trace.get()
+
+
+def get_slow_traces():
+    """Return the slow traces recorded by this worker, newest first"""
+    with _slow_traces_lock:
+        return list(reversed(_slow_traces))